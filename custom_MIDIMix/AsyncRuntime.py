@@ -0,0 +1,453 @@
+"""asyncio runtime: one event loop runs input routing, port output and persistence.
+
+    python MidiMasterator.py --runtime async
+"""
+import asyncio
+import collections
+import functools
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import Log
+import RawMidi
+from CcCoalescer import CcCoalescer
+from Latency import Histogram
+from MidiInput import TimestampedInput
+from MidiMasterator import MidiMasterator
+from StateHandler import StateHandler
+from StateWriter import StateWriter
+
+BATCH = 64  # messages per port write hop
+
+
+class AsyncOutput:
+    """Writer task for one output port, with the OutputWriter API.
+
+    Messages are appended to a deque from any thread. The task sends them in
+    batches from the loop, giving the other tasks a turn between batches;
+    rtmidi sends only hand the bytes to the driver. A writer created with ``yield_to`` waits (up to
+    ``max_yield``) for that writer to go idle first, which gives the loopback
+    priority over the LEDs. ``drained`` lets the input task wait for the
+    queue to fall back below a level: the backpressure of the runtime.
+    """
+
+    def __init__(self, runtime, port, name, yield_to=None, max_yield=0.005):
+        """
+        Start the writer task.
+
+        Args:
+            runtime (AsyncRuntime): Runtime whose loop runs the task.
+            port: Open mido output port (target 0).
+            name (str): Name used for the task and in the stats.
+            yield_to (AsyncOutput): Higher priority writer to let drain first.
+            max_yield (float): Longest a batch waits on yield_to, in seconds.
+        """
+        self.runtime = runtime
+        self.port = port
+        self.name = name
+        self._targets = [(port.send, RawMidi.raw_sender(port))]  # per port: mido send, raw send
+        self.yield_to = yield_to
+        self.max_yield = max_yield
+        self._queue = collections.deque()
+        self._ready = None     # asyncio.Event: messages queued (created on the loop)
+        self._progress = None  # asyncio.Event: a batch went out, or the queue ran empty
+        self._idle = threading.Event()
+        self._idle.set()
+        self._done = threading.Event()
+        self._closing = False
+        self.enqueued = 0
+        self.sent = 0
+        self.errors = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.send_time = 0.0
+        self.yield_time = 0.0
+        self.latency = None  # Histograms per latency class, as OutputWriter.latency
+        runtime.spawn(self._run, f"writer-{name}")
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def add_port(self, port):
+        """Serve another output port from this writer; returns its target number for send."""
+        self._targets.append((port.send, RawMidi.raw_sender(port)))
+        return len(self._targets) - 1
+
+    def send(self, message, target=0, stamp=None):
+        """Queue a mido message or raw byte tuple for a port, with its arrival stamp; never blocks (see drained)."""
+        self._idle.clear()
+        self._queue.append((target, message, stamp))
+        self.enqueued += 1
+        depth = len(self._queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if depth == 1:
+            self.runtime.wake(self._wake)
+
+    def wait_idle(self, timeout=None):
+        """Wait until everything queued so far has been sent (from outside the loop)."""
+        return self._idle.wait(timeout)
+
+    async def drained(self, level):
+        """Wait until at most ``level`` messages are queued (on the loop)."""
+        while len(self._queue) > level:
+            self._progress.clear()
+            await self._progress.wait()
+
+    async def idle(self):
+        while self._queue:
+            self._progress.clear()
+            await self._progress.wait()
+
+    def stats(self):
+        return {"depth": self.depth, "max_depth": self.max_depth, "enqueued": self.enqueued,
+                "sent": self.sent, "errors": self.errors, "batches": self.batches, "blocked_ms": 0.0,
+                "send_ms": self.send_time * 1000, "yield_ms": self.yield_time * 1000}
+
+    def close(self, timeout=1.0):
+        """Send what is still queued (up to timeout) and stop the task. Call from outside the loop."""
+        self._closing = True
+        self.runtime.wake(self._wake)
+        self._done.wait(timeout)
+
+    def _wake(self):
+        if self._ready is not None:
+            self._ready.set()
+
+    async def _run(self):
+        self._ready = asyncio.Event()
+        self._progress = asyncio.Event()
+        clock = time.perf_counter
+        queue = self._queue
+        try:
+            while True:
+                if not queue:
+                    self._idle.set()
+                    self._progress.set()
+                    if self._closing:
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                if self.yield_to is not None and self.yield_to.depth:
+                    start = clock()
+                    try:
+                        await asyncio.wait_for(self.yield_to.idle(), self.max_yield)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.yield_time += clock() - start
+                batch = [queue.popleft() for _ in range(min(len(queue), BATCH))]
+                start = clock()
+                self._send_batch(batch)
+                self.send_time += clock() - start
+                self.batches += 1
+                self._progress.set()
+                await asyncio.sleep(0)
+        finally:
+            self._done.set()
+
+    def _send_batch(self, batch):
+        targets = self._targets
+        latency = self.latency
+        clock = time.perf_counter
+        for target, message, stamp in batch:
+            try:
+                if type(message) is tuple:
+                    targets[target][1](message)
+                else:
+                    targets[target][0](message)
+                self.sent += 1
+            except Exception:
+                self.errors += 1
+                Log.routing.exception("%s: send failed for %s", self.name, message)
+            if stamp is not None and latency is not None:
+                latency[stamp[1]].record(clock() - stamp[0])
+
+
+class AsyncStateWriter(StateWriter):
+    """StateWriter whose debounce is a task on the loop; the file writes run on the default executor.
+
+    Dirty banks coalesce in the pending map, so the work the task can be
+    asked to do is bounded by the number of banks, however fast they change.
+    """
+
+    def __init__(self, runtime, backend=None, debounce=0.5):
+        super().__init__(backend, debounce, thread=False)
+        self.runtime = runtime
+        self._dirty = None  # asyncio.Events, created on the loop
+        self._kicked = None
+        self._done = threading.Event()
+        runtime.spawn(self._debounce, "state")
+
+    def save_state(self, toggle_states, cc_values, bid):
+        super().save_state(toggle_states, cc_values, bid)
+        self.runtime.wake(self._mark)
+
+    def flush(self, wait=True):
+        if wait:
+            self._write_pending()
+        else:
+            self.runtime.wake(self._kick_now)
+
+    def close(self):
+        self._closed = True
+        self.runtime.wake(self._mark)
+        self._done.wait(1.0)
+        super().close()
+
+    def _mark(self):
+        if self._dirty is not None:
+            self._dirty.set()
+
+    def _kick_now(self):
+        if self._kicked is not None:
+            self._kicked.set()
+
+    async def _debounce(self):
+        self._dirty = asyncio.Event()
+        self._kicked = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._closed:
+                if not self._pending:
+                    self._dirty.clear()
+                    await self._dirty.wait()
+                    continue
+                # keep absorbing changes until the interval passes or a flush is forced
+                try:
+                    await asyncio.wait_for(self._kicked.wait(), self.debounce)
+                except asyncio.TimeoutError:
+                    pass
+                self._kicked.clear()
+                await loop.run_in_executor(None, self._write_pending)
+        finally:
+            self._done.set()
+
+
+class AsyncRuntime:
+    """Runs a MidiMasterator on one asyncio event loop in a background thread.
+
+    Tasks: input routing (one inbox for all units), a writer per output
+    port, the state debounce and a loop lag probe; CC
+    coalescing uses loop timers. The backend's MIDI callbacks only append to
+    the inbox and wake the input task when it sleeps. The input task routes
+    message by message and, whenever a writer queue is above ``high_water``,
+    waits for it to drain to half of that before taking the next one, so a
+    fader storm backs up in the inbox instead of in the port queues. When
+    more than ``inbox_limit`` messages wait there, control changes that a
+    later move of the same control supersedes before any other message
+    (a bank switch, say) are dropped (counted as shed); notes are never
+    dropped. A pass that sheds nothing
+    is not repeated until the inbox has doubled, so a burst of notes costs
+    linear time. Failed tasks are logged and restarted.
+
+    Tk stays on the main thread: Tk to loop through ``call``; the loop never
+    calls into Tk, its frame requests only set the GUI's flag and wake the
+    GUI's notifier thread, so neither side polls or waits on the other.
+    """
+
+    def __init__(self, high_water=512, inbox_limit=256, probe_interval=0.005):
+        """
+        Create the loop (started by start).
+
+        Args:
+            high_water (int): Writer queue depth at which the input task waits for the writer.
+            inbox_limit (int): Inbox length from which superseded control changes are shed; None never sheds.
+            probe_interval (float): Sleep of the loop lag probe, in seconds.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.high_water = high_water
+        self.inbox_limit = inbox_limit
+        self.probe_interval = probe_interval
+        self.mm = None
+        self._thread = None
+        self._thread_id = None
+        self._inbox = collections.deque()
+        self._inbox_ready = None
+        self._drained = None  # set by the input task whenever the inbox runs empty
+        self._sleeping = False
+        self._shed_at = inbox_limit  # inbox length that triggers the next shedding pass
+        self._tasks = []
+        self.received = 0
+        self.max_inbox = 0
+        self.backpressure_waits = 0
+        self.backpressure_time = 0.0
+        self.shed = 0
+        self.lag = Histogram()  # loop lag: how late the probe's sleep returns
+
+    def masterator(self, *args, state_backend="json", state_debounce=0.5, **kwargs):
+        """Create the MidiMasterator wired to this runtime; same arguments as MidiMasterator."""
+        state = AsyncStateWriter(self, StateHandler(), state_debounce) if state_backend == "json" else None
+        self.mm = MidiMasterator(*args, state_backend=state_backend, state=state,
+                                 writer=functools.partial(AsyncOutput, self),
+                                 coalescer=functools.partial(CcCoalescer, loop=self.loop), **kwargs)
+        self.spawn(self._route, "input")
+        self.spawn(self._probe, "lag probe")
+        return self.mm
+
+    def start(self):
+        """Run the loop on its thread; tasks spawned so far start now."""
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self._thread_id = threading.get_ident()
+            self.loop.call_soon(started.set)
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="asyncio", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def start_input(self):
+        """Hand every unit's input to the loop: backend callbacks stamp the messages and fill the inbox."""
+        for d in self.mm.devices:
+            d.midi_input = TimestampedInput(d.input_port, functools.partial(self._arrive, d), threading.Lock())
+            d.midi_input.start()
+
+    def wait_idle(self, timeout=None):
+        """Wait until every message that arrived so far has been routed (from outside the loop)."""
+        future = asyncio.run_coroutine_threadsafe(self._until_drained(), self.loop)
+        try:
+            future.result(timeout)
+            return True
+        except TimeoutError:
+            future.cancel()
+            return False
+
+    def stop(self):
+        """Cancel the tasks and stop the loop; close the Masterator's ports first."""
+        async def cancel():
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.loop.stop()
+        if self._thread:
+            asyncio.run_coroutine_threadsafe(cancel(), self.loop)
+            self._thread.join(1.0)
+        self.loop.close()
+
+    def spawn(self, coro_fn, name):
+        """Run coro_fn() as a supervised task on the loop (from any thread, before or after start)."""
+        self.loop.call_soon_threadsafe(
+            lambda: self._tasks.append(self.loop.create_task(self._supervise(coro_fn, name), name=name)))
+
+    def wake(self, fn):
+        """Run a loop-side callback: now when on the loop, else soon on the loop."""
+        if threading.get_ident() == self._thread_id:
+            fn()
+        else:
+            self.loop.call_soon_threadsafe(fn)
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the loop, e.g. from a Tk key binding."""
+        self.loop.call_soon_threadsafe(self._call_logged, fn, args)
+
+    def stats(self):
+        return {"received": self.received, "max_inbox": self.max_inbox,
+                "backpressure_waits": self.backpressure_waits,
+                "backpressure_ms": self.backpressure_time * 1000, "shed": self.shed,
+                "lag_ms_p50": self.lag.percentile(50) / 1000, "lag_ms_p99": self.lag.percentile(99) / 1000,
+                "lag_ms_max": self.lag.max / 1000}
+
+    # ---------- internals ----------
+    def _arrive(self, device, message):
+        """Backend thread: queue the message, wake the input task only if it sleeps."""
+        self._inbox.append((device, message))
+        if self._sleeping:
+            self._sleeping = False
+            self.loop.call_soon_threadsafe(self._inbox_ready.set)
+
+    def _call_logged(self, fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            Log.general.exception("Error in %s", getattr(fn, "__name__", fn))
+            if self.mm:
+                self.mm.recorder.dump_on_error()
+
+    async def _supervise(self, coro_fn, name):
+        while True:
+            try:
+                await coro_fn()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                Log.general.exception("Task %s failed, restarting", name)
+                if self.mm:
+                    self.mm.recorder.dump_on_error()
+                await asyncio.sleep(0.1)
+
+    async def _until_drained(self):
+        # on the loop an empty inbox means the input task has routed everything it took
+        while self._inbox:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def _route(self):
+        ready = self._inbox_ready = asyncio.Event()
+        drained = self._drained = asyncio.Event()
+        inbox = self._inbox
+        mm = self.mm
+        clock = time.perf_counter
+        routed = 0
+        while True:
+            if not inbox:
+                drained.set()
+                ready.clear()
+                self._sleeping = True
+                if not inbox:  # a message appended before the flag was seen is picked up here
+                    await ready.wait()
+                self._sleeping = False
+                continue
+            waiting = len(inbox)
+            if waiting > self.max_inbox:
+                self.max_inbox = waiting
+            if self.inbox_limit is not None:
+                if waiting > self._shed_at:
+                    self._shed()
+                    self._shed_at = max(self.inbox_limit, 2 * len(inbox))
+                elif waiting <= self.inbox_limit:
+                    self._shed_at = self.inbox_limit
+            device, message = inbox.popleft()
+            mm._handle_logged(message, device)
+            self.received += 1
+            for writer in (mm.loop_out, mm.led_out):
+                if writer.depth > self.high_water:
+                    start = clock()
+                    self.backpressure_waits += 1
+                    await writer.drained(self.high_water // 2)
+                    self.backpressure_time += clock() - start
+            routed += 1
+            if routed % 16 == 0:
+                await asyncio.sleep(0)  # let writers and timers in during a burst
+
+    def _shed(self):
+        """Keep only the newest move per control between two non-CC messages, in arrival order."""
+        inbox = self._inbox
+        # the backend only appends on the right, so the first n stay ours
+        items = [inbox.popleft() for _ in range(len(inbox))]
+        seen = set()
+        kept = []
+        for device, message in reversed(items):
+            if message.type == 'control_change':
+                key = (device.index, message.channel, message.control)
+                if key in seen:
+                    continue
+                seen.add(key)
+            else:
+                seen.clear()  # a note may switch banks; the moves before it belong to the old one
+            kept.append((device, message))
+        self.shed += len(items) - len(kept)
+        inbox.extendleft(kept)  # kept is newest first, extendleft restores the order
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        interval = self.probe_interval
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.lag.record(max(0.0, loop.time() - start - interval))
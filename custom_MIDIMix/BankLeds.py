@@ -0,0 +1,118 @@
+import math
+import threading
+
+import Log
+
+BANK_UP = 25    # LED of the BANK RIGHT button: high digit
+BANK_DOWN = 26  # LED of the BANK LEFT button: low digit
+
+# LED states: OFF and ON are steady, n >= 2 is n - 1 short pulses per cycle
+OFF = 0
+ON = 1
+
+
+def binary(bank, count):
+    """2-bit dial on (LED 25, LED 26): A off/off, B off/on, C on/off, D on/on; repeats every 4 banks."""
+    return (bank >> 1) & 1, bank & 1
+
+
+def blink(bank, count):
+    """
+    Two base-n digits, n the smallest base that covers ``count`` banks.
+
+    Digit 0 is off, 1 is on, k >= 2 is k - 1 pulses per cycle. Four banks
+    read exactly like binary; 16 banks use off/on/1 pulse/2 pulses per LED.
+    """
+    base = max(2, math.isqrt(count - 1) + 1)
+    return bank // base % base, bank % base
+
+
+ENCODINGS = {"binary": binary, "blink": blink}
+
+
+class Blinker:
+    """Drives pulsing LEDs for all units from one thread.
+
+    The thread is started the first time an LED has to pulse and sleeps while
+    none does, so steady encodings never start it. LED writes go through each
+    unit's LedShadow, so a pulse only sends when the LED changes.
+    """
+
+    def __init__(self, tick=0.15):
+        """
+        Initialize the blinker.
+
+        Args:
+            tick (float): Seconds per pulse half-period; a cycle is two ticks per pulse plus a pause.
+        """
+        self.tick = tick
+        self._patterns = {}  # (LedShadow, note) -> pulses per cycle
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def set(self, leds, note, state):
+        """Show an LED state (OFF, ON or pulses) on one LED."""
+        with self._cond:
+            if state < 2:
+                self._patterns.pop((leds, note), None)
+                leds.set(note, 127 if state else 0)
+                return
+            self._patterns[(leds, note)] = state - 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="BankBlinker", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(1.0)
+
+    def _run(self):
+        t = 0
+        with self._cond:
+            while not self._closed:
+                if not self._patterns:
+                    t = 0
+                    self._cond.wait()
+                    continue
+                cycle = 2 * max(self._patterns.values()) + 4
+                phase = t % cycle
+                for (leds, note), pulses in self._patterns.items():
+                    leds.set(note, 127 if phase < 2 * pulses and not phase & 1 else 0)
+                t += 1
+                self._cond.wait(self.tick)
+
+
+class BankDial:
+    """A unit's bank number on its two bank button LEDs, in a configurable encoding."""
+
+    def __init__(self, leds, count, encoding="binary", blinker=None, notes=(BANK_UP, BANK_DOWN)):
+        """
+        Initialize the dial.
+
+        Args:
+            leds (LedShadow): The unit's LED shadow.
+            count (int): Banks on the unit.
+            encoding (str): Key of ENCODINGS.
+            blinker (Blinker): Shared blinker for pulse states; needed when the encoding can pulse.
+            notes (tuple): LED notes of the high and the low digit (the mapping's bank buttons).
+        """
+        self.leds = leds
+        self.count = count
+        self.encode = ENCODINGS[encoding]
+        self.blinker = blinker
+        self.notes = notes
+        if encoding == "binary" and count > 4:
+            Log.leds.warning("Binary bank LEDs repeat every 4 banks; %d banks configured", count)
+
+    def show(self, bank):
+        high, low = self.encode(bank, self.count)
+        for note, state in zip(self.notes, (high, low)):
+            if self.blinker:
+                self.blinker.set(self.leds, note, state)
+            else:
+                self.leds.set(note, 127 if state else 0)
@@ -0,0 +1,456 @@
+"""Micro-benchmarks for the Masterator hot paths.
+
+    python Benchmarks.py dispatch [--messages N]
+    python Benchmarks.py output [--messages N]
+    python Benchmarks.py gui [--frames N]          (needs a display)
+    python Benchmarks.py ui [--seconds S] [--modes none,tui,tk]
+    python Benchmarks.py devices [--seconds S] [--counts 1,2,3]
+    python Benchmarks.py banks [--counts 4,16,64] [--backend json|session|journal]
+    python Benchmarks.py async [--seconds S] [--rates 2000,8000,32000]
+    python Benchmarks.py mapping [--loads N] [--seconds S]
+    python Benchmarks.py macros [--counts 100,300,1000] [--spread S]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import random
+import threading
+import time
+
+import mido
+
+import Log
+import MappingProfile
+import RawMidi
+from MidiHandler import MidiHandler
+from StateHandler import StateHandler
+
+# the note lists the original routing scanned
+shifted_notes = MappingProfile.current().shifted
+after_shift = MappingProfile.current().after_shift
+
+
+class NullState(StateHandler):
+    """State backend that never touches the disk, so only routing is measured."""
+
+    def load_state(self, bid):
+        return self.default_toggle_states.copy(), self.default_cc.copy()
+
+    def save_state(self, toggle_states, cc_values, bid):
+        pass
+
+
+class LegacyRouting(MidiHandler):
+    """MidiHandler with the original if/elif routing and list scans, as the baseline (logging as today)."""
+
+    def process_messages(self, message):
+        try:
+            Log.routing.debug("%s received: %s", self.ID, message)
+            if message.type == 'control_change':
+                self.process_control_change_message(message)
+            elif message.note == 25 and message.type in ['note_on', 'note_off']:
+                self.handle_bank_up()
+            elif message.note == 26 and message.type in ['note_on', 'note_off']:
+                self.handle_bank_down()
+            elif message.note == 27 and message.type in ['note_on', 'note_off']:
+                self.handle_switch_button(message)
+            elif message.type == 'note_on':
+                self.process_note_message(message)
+            elif message.type == 'note_off':
+                self.process_note_off_message(message)
+            else:
+                self.send_message(message)
+        except Exception:
+            Log.routing.exception("%s: error processing %s", self.ID, message)
+
+    def process_note_off_message(self, message):
+        if message.note in shifted_notes and self.note_27_state:
+            message.note = message.note + 32
+        self.send_note_off_message(message)
+
+    def process_note_message(self, message):
+        if message.note not in [25, 26, 27]:
+            if message.note in shifted_notes and self.note_27_state:
+                message.note = message.note + 32
+            self.send_note_message(message)
+
+    def update_lights(self):
+        for note_number, state in self.toggle_states.items():
+            if note_number in after_shift and self.note_27_state:
+                note_number -= 32
+            self.cb2(mido.Message('note_on', note=int(note_number), velocity=127 if state else 0))
+
+    def send_light_update(self, note_number):
+        if note_number in self.toggle_states:
+            velocity = 127 if self.toggle_states[note_number] else 0
+            if note_number in after_shift:
+                note_number = note_number - 32
+            self.cb2(mido.Message('note_on', note=note_number, velocity=velocity))
+
+
+def gesture_mix(count):
+    """A mix of fader moves, button presses and shift holds, like a busy set."""
+    msgs = []
+    fader = [19, 23, 27, 31, 49, 53, 57, 61]
+    buttons = [1, 3, 4, 6, 9, 12, 22, 24]
+    i = 0
+    while len(msgs) < count:
+        msgs.append(mido.Message('control_change', control=fader[i % 8], value=i % 128))
+        if i % 16 == 0:
+            note = buttons[(i // 16) % 8]
+            msgs.append(mido.Message('note_on', note=note, velocity=127))
+            msgs.append(mido.Message('note_off', note=note, velocity=0))
+        if i % 64 == 0:
+            msgs.append(mido.Message('note_on', note=27, velocity=127))
+            msgs.append(mido.Message('note_on', note=3, velocity=127))
+            msgs.append(mido.Message('note_off', note=27, velocity=0))
+        i += 1
+    return msgs[:count]
+
+
+def rate(handler_cls, messages):
+    """Messages per second through handler_cls.process_messages, with console output discarded."""
+    sent = []
+    bank = handler_cls(sent.append, sent.append, "Bench", 1, state_handler=NullState())
+    copies = [m.copy() for m in messages]
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        start = time.perf_counter()
+        for m in copies:
+            bank.process_messages(m)
+            if sink.tell() > 1 << 20:
+                sink.seek(0); sink.truncate()
+        elapsed = time.perf_counter() - start
+    return len(messages) / elapsed
+
+
+def bench_dispatch(args):
+    messages = gesture_mix(args.messages)
+    rate(MidiHandler, messages[:1000])  # warm up
+    before = rate(LegacyRouting, messages)
+    after = rate(MidiHandler, messages)
+    print(f"if/elif + list scans : {before:12,.0f} msg/s")
+    print(f"compiled tables      : {after:12,.0f} msg/s  ({after / before:.2f}x)")
+
+
+class NullMidiOut:
+    """Stands in for rtmidi.MidiOut; the cost of the USB write itself is the same on both paths."""
+
+    def send_message(self, data):
+        pass
+
+
+class RtmidiLikeOutput:
+    """What mido's rtmidi Output.send does: encode the message and hand the bytes to rtmidi under a lock."""
+
+    def __init__(self):
+        self._rt = NullMidiOut()
+        self._send_lock = threading.RLock()
+
+    def send(self, message):
+        with self._send_lock:
+            self._rt.send_message(message.bytes())
+
+
+def bench_output(args):
+    # LED frames and toggles: note_on with velocity 0/127 on the bank channels
+    stream = [(i % 4 + 1, (i * 7) % 128, 127 if i % 3 else 0) for i in range(args.messages)]
+    port = RtmidiLikeOutput()
+    start = time.perf_counter()
+    for channel, note, velocity in stream:
+        port.send(mido.Message('note_on', channel=channel, note=note, velocity=velocity))
+    mido_rate = len(stream) / (time.perf_counter() - start)
+    send_raw = RawMidi.raw_sender(port)
+    encode = RawMidi.note_on
+    start = time.perf_counter()
+    for channel, note, velocity in stream:
+        send_raw(encode(channel, note, velocity))
+    raw_rate = len(stream) / (time.perf_counter() - start)
+    print(f"mido.Message + send  : {mido_rate:12,.0f} msg/s")
+    print(f"preencoded raw bytes : {raw_rate:12,.0f} msg/s  ({raw_rate / mido_rate:.2f}x)")
+
+
+def bench_gui(args):
+    import tkinter as tk
+    from MasteratorGui import MasteratorGUI, BankSnapshot
+    root = tk.Tk()
+    root.geometry("1280x860")
+    gui = MasteratorGUI(root)
+    root.update()
+    snap = BankSnapshot(name="Bank A", toggle_states={n: n % 3 == 0 for n in range(1, 57)},
+                        cc_values={cc: 64 for cc in range(128)}, note27_on=False, active_bank=0)
+    gui.set_snapshot(snap)
+    gui.render_now()
+
+    def frames(rebuild):
+        start = time.perf_counter()
+        for i in range(args.frames):
+            snap.cc_values[19] = i % 128  # one fader moved since the last frame
+            if rebuild:
+                gui._layout = None        # every item deleted and recreated, as the old renderer did
+            gui._draw()
+            root.update_idletasks()
+        return (time.perf_counter() - start) * 1000 / args.frames
+
+    full = frames(rebuild=True)
+    retained = frames(rebuild=False)
+    root.destroy()
+    print(f"delete-all redraw    : {full:8.3f} ms/frame")
+    print(f"retained update      : {retained:8.3f} ms/frame  ({full / retained:.1f}x)")
+
+
+def bench_ui(args):
+    import Replay
+    from MidiMasterator import MidiMasterator
+    events = Replay.for_duration(Replay.busy_set(200000, random.Random(1)), args.seconds)
+    print(f"{len(events)} events over {args.seconds:.0f} s at real time; CPU includes the replay thread")
+    for mode in args.modes.split(","):
+        root = view = None
+        if mode == "tk":
+            import tkinter as tk
+            root = tk.Tk()
+        elif mode == "tui":
+            from TerminalView import TerminalView
+            view = TerminalView(open(os.devnull, "w"))
+        with Replay.scratch_dir(), Replay.fake_ports() as ports:
+            mm = MidiMasterator("bench in", "bench loopback", "bench leds", root, view=view)
+            mm.open_ports()
+            mm.start_input()
+            stop = threading.Event()
+
+            def feed():
+                port = ports["bench in"]
+                due = time.perf_counter()
+                for delay, message in events:
+                    due += delay
+                    wait = due - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                    port.inject(message.copy())
+                stop.set()
+
+            cpu, wall = time.process_time(), time.perf_counter()
+            threading.Thread(target=feed, daemon=True).start()
+            if root:
+                def check():
+                    if stop.is_set(): root.quit()
+                    else: root.after(100, check)
+                check()
+                root.mainloop()
+            elif view:
+                view.run(stop)
+            else:
+                stop.wait()
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            frames = mm.gui.frame_stats()["frames"] if mm.gui else 0
+            mm.close_ports()
+            if root:
+                root.destroy()
+        print(f"{mode:<5} CPU {cpu / wall * 100:6.1f} %  ({cpu * 1000:7.0f} ms CPU in {wall:.1f} s, {frames} frames)")
+
+
+def bench_devices(args):
+    import Replay
+    print(f"each unit plays its own busy set for {args.seconds:.0f} s in real time, all on one Masterator")
+    print(f"{'units':>5} {'events':>7} {'threads':>7}  {'loopback p50/p99/max us':>24}  {'LED p50/p99/max us':>20}")
+    for count in (int(n) for n in args.counts.split(",")):
+        streams = [Replay.for_duration(Replay.busy_set(200000, random.Random(unit + 1)), args.seconds)
+                   for unit in range(count)]
+        with Replay.scratch_dir():
+            result = Replay.replay(Replay.merge(streams), speed=1.0, devices=count)
+        cols = []
+        for path in ("input->loopback", "input->LED"):
+            classes = result["latency_us"].get(path, {}).values()
+            n = sum(c["n"] for c in classes) or 1
+            # weighted over the message classes; p99 and max as the worst class
+            p50 = sum(c["p50"] * c["n"] for c in classes) / n
+            cols.append(f"{p50:6.0f} / {max((c['p99'] for c in classes), default=0):6.0f} / "
+                        f"{max((c['max'] for c in classes), default=0):6.0f}")
+        print(f"{count:>5} {result['events']:>7} {result['threads']:>7}  {cols[0]:>24}  {cols[1]:>20}")
+
+
+def bench_banks(args):
+    import tracemalloc
+    import Replay
+    from MidiMasterator import MidiMasterator
+    nav = mido.Message('note_on', note=MappingProfile.current().bank_up, velocity=127)
+    print("all under tracemalloc; KB is what the Masterator holds, 4 MB of it the flight recorder")
+    print(f"{'banks':>5} {'startup ms':>10} {'KB':>6}  {'first visit us':>14} {'revisit us':>10} {'KB after':>8}")
+    for count in (int(n) for n in args.counts.split(",")):
+        with Replay.scratch_dir(), Replay.fake_ports():
+            tracemalloc.start()
+            start = time.perf_counter()
+            mm = MidiMasterator("bench in", "bench loopback", "bench leds", None, banks=count, state_backend=args.backend)
+            mm.open_ports()
+            startup = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            # one lap through every bank loads each on its first visit, the second lap finds them loaded
+            laps = []
+            for _ in range(2):
+                start = time.perf_counter()
+                for _ in range(count):
+                    mm.handle_message(nav.copy(time=time.perf_counter()))
+                laps.append((time.perf_counter() - start) / count)
+            visited = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            mm.close_ports()
+        print(f"{count:>5} {startup * 1000:>10.2f} {memory / 1024:>6.0f}  {laps[0] * 1e6:>14.0f} {laps[1] * 1e6:>10.0f} "
+              f"{visited / 1024:>8.0f}")
+
+
+def fader_storm(rate, seconds):
+    """All eight faders swept at once, ``rate`` messages per second in total."""
+    faders = MappingProfile.current().cc_map["faders"]
+    return [(1.0 / rate, mido.Message('control_change', control=faders[i % 8], value=i // 8 % 128))
+            for i in range(int(rate * seconds))]
+
+
+def bench_async(args):
+    import Replay
+    print(f"eight faders at once for {args.seconds:.0f} s in real time; loopback latency per runtime")
+    print(f"{'msg/s':>6} {'runtime':>7}  {'p50/p99/max us':>22}  {'loop lag p50/p99/max us':>24}  "
+          f"{'inbox':>5} {'waits':>5} {'shed':>6}")
+    for rate in (int(n) for n in args.rates.split(",")):
+        events = fader_storm(rate, args.seconds)
+        for runtime in ("threads", "async"):
+            with Replay.scratch_dir():
+                result = Replay.replay(events, speed=1.0, runtime=runtime)
+            cc = result["latency_us"]["input->loopback"]["cc"]
+            rt = result["runtime"]
+            lag = (f"{rt['lag_ms_p50'] * 1000:6.0f} / {rt['lag_ms_p99'] * 1000:6.0f} / {rt['lag_ms_max'] * 1000:6.0f}"
+                   if rt else "-")
+            print(f"{rate:>6} {runtime:>7}  {cc['p50']:6.0f} / {cc['p99']:6.0f} / {cc['max']:6.0f}  {lag:>24}  "
+                  f"{rt['max_inbox'] if rt else '-':>5} {rt['backpressure_waits'] if rt else '-':>5} "
+                  f"{rt['shed'] if rt else '-':>6}")
+
+
+def bench_mapping(args):
+    import json
+    import shutil
+    import Replay
+    from MidiMasterator import MidiMasterator
+    with Replay.scratch_dir():
+        shutil.copy(MappingProfile.DEFAULT_PATH, "Mapping.json")
+        profile = json.load(open("Mapping.json"))
+        # cold: parse and compile, writing the cache; warm: stat and unpickle the cache
+        timings = {}
+        for name, prepare in (("cold", lambda: os.path.exists("Mapping.json.cache") and os.remove("Mapping.json.cache")),
+                              ("warm", lambda: None)):
+            total = 0.0
+            for _ in range(args.loads):
+                prepare()
+                start = time.perf_counter()
+                MappingProfile.load("Mapping.json")
+                total += time.perf_counter() - start
+            timings[name] = total / args.loads
+        print(f"load, compiled from JSON : {timings['cold'] * 1e6:8.0f} us")
+        print(f"load, from compiled cache: {timings['warm'] * 1e6:8.0f} us")
+
+        swapped = dict(profile, cc=dict(profile["cc"], knob_row_1=profile["cc"]["knob_row_2"],
+                                        knob_row_2=profile["cc"]["knob_row_1"]))
+        variants = [MappingProfile.Mapping(p) for p in (swapped, profile)]
+        with Replay.fake_ports():
+            mm = MidiMasterator(None, "bench loopback", "bench leds", None, mapping="Mapping.json")
+            mm.open_ports()
+            start = time.perf_counter()
+            for i in range(args.loads):
+                mm.swap_mapping(variants[i % 2])
+            print(f"swap, 1 bank loaded      : {(time.perf_counter() - start) / args.loads * 1e6:8.0f} us under the routing lock")
+            mm.close_ports()
+
+        # a real-time fader storm while the file flips between the two maps: every input must come out
+        events = fader_storm(4000, args.seconds)
+        stop = threading.Event()
+
+        def edit():
+            for i in itertools.count():
+                if stop.wait(0.1):
+                    return
+                with open("Mapping.json.tmp", "w") as file:  # saved the way editors do, in one rename
+                    json.dump(swapped if i % 2 == 0 else profile, file)
+                os.replace("Mapping.json.tmp", "Mapping.json")
+
+        editor = threading.Thread(target=edit)
+        editor.start()
+        try:
+            result = Replay.replay(events, speed=1.0, mapping="Mapping.json", mapping_reload=0.02)
+        finally:
+            stop.set()
+            editor.join()
+        out = result["outputs"]["loopback"]
+        print(f"reloads during a {args.seconds:.0f} s storm: {result['mapping_reloads']}, "
+              f"{len(events)} CCs in, {out} out{'' if out == len(events) else '  (MISSING)'}")
+
+
+def bench_macros(args):
+    import json
+    import Replay
+    # every toggle button gets a four-part macro with its own waits, 30-130 ms long in all
+    toggles = sorted(MappingProfile.current().default_toggle_states)
+    config = {"default": {str(note): [
+        {"cc": 19, "value": 0}, {"wait": 1 + note * 7 % 40},
+        {"note": 60 + k % 12, "channel": 10}, {"wait": 10 + note * 13 % 50},
+        {"note": 60 + k % 12, "velocity": 0, "channel": 10}, {"wait": 20 + note * 5 % 40},
+        {"cc": 19, "value": 127}] for k, note in enumerate(toggles)}}
+    print(f"N button presses spread over {args.spread * 1000:.0f} ms in real time, each starting a macro "
+          f"(1 CC now, 3 timed steps later)")
+    print(f"{'macros':>6} {'timed steps':>11} {'running':>7}  {'jitter p50/p99/max us':>22}  "
+          f"{'press->loopback p50/p99 us':>26}")
+    for count in (int(n) for n in args.counts.split(",")):
+        events = [(args.spread / count, mido.Message('note_on', note=toggles[i % len(toggles)], velocity=127))
+                  for i in range(count)]
+        row = []
+        for macros in (False, True):
+            with Replay.scratch_dir():
+                if macros:
+                    with open("Macros.json", "w") as file:
+                        json.dump(config, file)
+                result = Replay.replay(events, speed=1.0)
+            note = result["latency_us"]["input->loopback"]["note"]
+            row.append((result, note))
+        (_, plain), (result, note) = row
+        m = result["macros"]
+        print(f"{count:>6} {m['steps'] - m['started']:>11} {m['max_pending']:>7}  "
+              f"{m['jitter_us_p50']:6.0f} / {m['jitter_us_p99']:6.0f} / {m['jitter_us_max']:6.0f}  "
+              f"{note['p50']:6.0f} / {note['p99']:6.0f} (toggle {plain['p50']:.0f} / {plain['p99']:.0f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("dispatch", help="MidiHandler.process_messages throughput, before/after table dispatch")
+    p.add_argument("--messages", type=int, default=50000)
+    p.set_defaults(func=bench_dispatch)
+    p = sub.add_parser("output", help="note_on messages/s to an rtmidi-style port, mido messages vs preencoded bytes")
+    p.add_argument("--messages", type=int, default=200000)
+    p.set_defaults(func=bench_output)
+    p = sub.add_parser("gui", help="MasteratorGUI frame time for a single CC change, full redraw vs retained items")
+    p.add_argument("--frames", type=int, default=200)
+    p.set_defaults(func=bench_gui)
+    p = sub.add_parser("ui", help="CPU use while replaying a busy set in real time: headless, terminal view, Tk GUI")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--modes", default="none,tui,tk", help="comma separated: none, tui, tk (tk needs a display)")
+    p.set_defaults(func=bench_ui)
+    p = sub.add_parser("devices", help="routing latency and thread count with 1..N MIDImix units on fake ports")
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--counts", default="1,2,3", help="comma separated unit counts (3 at most)")
+    p.set_defaults(func=bench_devices)
+    p = sub.add_parser("banks", help="startup time, memory and bank switch cost for growing bank counts")
+    p.add_argument("--counts", default="4,16,64")
+    p.add_argument("--backend", default="json", choices=["json", "session", "journal"])
+    p.set_defaults(func=bench_banks)
+    p = sub.add_parser("async", help="loopback latency and event loop lag under a fader storm, threads vs asyncio")
+    p.add_argument("--seconds", type=float, default=3.0)
+    p.add_argument("--rates", default="2000,8000,32000", help="comma separated messages per second, all faders")
+    p.set_defaults(func=bench_async)
+    p = sub.add_parser("mapping", help="mapping profile load (JSON vs compiled cache), swap cost, reloads under load")
+    p.add_argument("--loads", type=int, default=200)
+    p.add_argument("--seconds", type=float, default=3.0)
+    p.set_defaults(func=bench_mapping)
+    p = sub.add_parser("macros", help="dispatch jitter of timed macro steps with hundreds of macros running at once")
+    p.add_argument("--counts", default="100,300,1000", help="comma separated numbers of macros started")
+    p.add_argument("--spread", type=float, default=0.1, metavar="S", help="seconds over which they are started")
+    p.set_defaults(func=bench_macros)
+    args = parser.parse_args()
+    args.func(args)
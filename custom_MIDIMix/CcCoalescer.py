@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import threading
+import time
+from array import array
+
+
+class CcCoalescer:
+    """Last-value-wins decimation of control_change messages on the way to one output.
+
+    Per (channel, CC) at most one message leaves per window. The first move
+    after a quiet period goes out immediately; moves inside the window only
+    replace the held value, and a timer thread sends the held value when the
+    window closes, so the resting value of a fader always arrives. On an
+    asyncio loop the timers are loop timers instead of the thread. Other
+    message types pass straight through, after the CCs held on their channel,
+    so a note never overtakes a fader move that came before it. Every send
+    downstream happens under the coalescer's lock, so a timer's send cannot
+    fall behind a note that arrives while it is under way.
+    """
+
+    def __init__(self, send, window=0.002, max_rate=None, loop=None):
+        """
+        Start the flush thread.
+
+        Args:
+            send (function): Downstream sender taking a ``stamp`` keyword, e.g. OutputWriter.send.
+            window (float): Seconds between two messages of the same control.
+            max_rate (float): Alternatively, messages per second per control; overrides window.
+            loop (asyncio.AbstractEventLoop): Flush with this loop's timers instead of a thread.
+        """
+        self.send = send
+        self.window = 1.0 / max_rate if max_rate else window
+        self._last_sent = array('d', [-1e300]) * 2048  # index: channel << 7 | control
+        self._held = [None] * 2048  # (message, stamp) waiting for its window
+        self._held_on = bytearray(16)  # held CCs per channel
+        self._due = []  # heap of (time, index)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.messages_in = 0
+        self.messages_out = 0
+        self.loop = loop
+        self._thread = None
+        if loop is None:
+            self._thread = threading.Thread(target=self._run, name="CcCoalescer", daemon=True)
+            self._thread.start()
+
+    def submit(self, message, stamp=None):
+        """Send or hold a message; stamp is its input's (arrival time, latency class), passed on downstream."""
+        if type(message) is tuple or message.type != 'control_change':
+            channel = message[0] & 0x0F if type(message) is tuple else getattr(message, "channel", None)
+            with self._cond:
+                if channel is not None and self._held_on[channel]:
+                    self._flush_channel(channel)
+                self.send(message, stamp=stamp)
+            return
+        i = message.channel << 7 | message.control
+        now = time.perf_counter()
+        with self._cond:
+            self.messages_in += 1
+            if self._held[i] is None and now - self._last_sent[i] >= self.window:
+                self._last_sent[i] = now
+                self.messages_out += 1
+                self.send(message, stamp=stamp)
+            else:
+                if self._held[i] is None:
+                    self._held_on[message.channel] += 1
+                    due = self._last_sent[i] + self.window
+                    if self.loop:
+                        self._call_later(due - now, i, due)
+                    else:
+                        heapq.heappush(self._due, (due, i))
+                        self._cond.notify()
+                self._held[i] = (message, stamp)
+
+    def stats(self):
+        return {"in": self.messages_in, "out": self.messages_out}
+
+    def close(self):
+        """Send every held value now and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        with self._cond:
+            for i, held in enumerate(self._held):
+                if held is not None:
+                    self._held[i] = None
+                    self.messages_out += 1
+                    self.send(held[0], stamp=held[1])
+            self._held_on[:] = bytes(16)
+
+    def _flush_channel(self, channel):
+        """Send every CC held on one channel now; their pending timers find nothing left to send. Caller holds the lock."""
+        now = time.perf_counter()
+        for i in range(channel << 7, (channel + 1) << 7):
+            held = self._held[i]
+            if held is not None:
+                self._held[i] = None
+                self._last_sent[i] = now
+                self.messages_out += 1
+                self.send(held[0], stamp=held[1])
+        self._held_on[channel] = 0
+
+    def _call_later(self, delay, i, due):
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.loop.call_later(delay, self._release, i, due)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, self._release, i, due)
+
+    def _take(self, i, due, now):
+        """(message, stamp) held for control i if timer due is still current, else None. Caller holds the lock."""
+        held = self._held[i]
+        # a timer set before a flush is stale; the hold that followed the flush set its own
+        if held is None or due < self._last_sent[i] + self.window:
+            return None
+        self._held[i] = None
+        self._held_on[i >> 7] -= 1
+        self._last_sent[i] = now
+        self.messages_out += 1
+        return held
+
+    def _release(self, i, due):
+        """Loop timer: send the value held for one control, if it is still held."""
+        with self._cond:
+            held = self._take(i, due, time.perf_counter())
+            if held is not None:
+                self.send(held[0], stamp=held[1])
+
+    def _run(self):
+        clock = time.perf_counter
+        while True:
+            with self._cond:
+                while not self._due and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                due, i = self._due[0]
+                delay = due - clock()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._due)
+                held = self._take(i, due, clock())
+                if held is not None:
+                    self.send(held[0], stamp=held[1])
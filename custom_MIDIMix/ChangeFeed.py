@@ -0,0 +1,53 @@
+import threading
+from dataclasses import dataclass
+
+
+@dataclass
+class BankSnapshot:
+    name: str
+    toggle_states: dict[int, bool]   # note -> bool
+    cc_values: dict[int, int]        # cc   -> 0..127
+    note27_on: bool
+    active_bank: int                 # bank index on its unit (0 = A)
+
+
+class ChangeFeed:
+    """What changed in one bank since the GUI last looked.
+
+    The MIDI thread only marks (a set add or a flag, O(1) per event); the GUI
+    thread takes the marks once per frame and copies just those values. Marks
+    and takes share a lock, held for one add or one swap, so a mark made while
+    the GUI takes lands either in this frame's sets or in the next one's,
+    never in a set the GUI is already reading. Mark after changing the value.
+    """
+
+    def __init__(self):
+        self.cc = set()
+        self.notes = set()
+        self.all = True  # everything, e.g. after a scene recall; the first take is always complete
+        self._lock = threading.Lock()
+
+    def mark_cc(self, cc):
+        with self._lock:
+            self.cc.add(cc)
+
+    def mark_note(self, note):
+        with self._lock:
+            self.notes.add(note)
+
+    def mark_all(self):
+        with self._lock:
+            self.all = True
+
+    def take(self):
+        """
+        Take the marks made since the previous call.
+
+        Returns:
+            tuple: (everything changed, set of CCs, set of toggle notes).
+        """
+        with self._lock:
+            everything, self.all = self.all, False
+            cc, self.cc = self.cc, set()
+            notes, self.notes = self.notes, set()
+        return everything, cc, notes
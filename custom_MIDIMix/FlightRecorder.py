@@ -0,0 +1,259 @@
+"""Always-on flight recorder for MIDI traffic and routing decisions.
+
+    python FlightRecorder.py show Flight-20250101-201500.akfr [--last N]
+    python FlightRecorder.py mid Flight-20250101-201500.akfr out.mid [--inputs-only]
+"""
+import argparse
+import itertools
+import struct
+import sys
+import threading
+import time
+
+import mido
+
+import Log
+from MidiDevice import bank_label
+
+# Record kinds
+IN = 0        # input message: a, b, c = MIDI bytes
+LOOPBACK = 1  # message queued for the loopback port
+LED = 2       # message queued for the LED port
+BANK = 3      # bank switch: bank = new bank
+SHIFT = 4     # shift (27) pressed/released: a = 1/0
+TAKEOVER = 5  # soft takeover decision: a = CC, b = hardware value, c = output value or REJECTED
+KINDS = ("in", "loopback", "led", "bank", "shift", "takeover")
+
+REJECTED = 0xFF
+
+# time (perf_counter), kind, unit, bank (index on the unit), a, b, c
+RECORD = struct.Struct('<dBBHBBBx')
+RECORD_V1 = struct.Struct('<dBBBBB3x')  # version 1: one byte for unit and bank together
+# magic, version, record size, records, wall clock and perf_counter at dump (to date the records)
+HEADER = struct.Struct('<4sHHQdd')
+MAGIC = b'AKFR'
+VERSION = 2
+
+ERROR_DUMP_INTERVAL = 30.0  # seconds between two dumps for caught routing errors
+
+
+class FlightRecorder:
+    """Preallocated ring buffer of the last ``capacity`` MIDI events and routing decisions.
+
+    Recording packs one 16-byte record into a fixed bytearray; nothing is
+    allocated and no lock is taken (slots come from an itertools counter,
+    whose next() is atomic). When full, the oldest records are overwritten.
+    """
+
+    def __init__(self, capacity=1 << 18, clock=time.perf_counter):
+        """
+        Allocate the buffer.
+
+        Args:
+            capacity (int): Records kept; rounded up to a power of two. 2**18 is 4 MB, minutes of a busy set.
+            clock (function): Timestamp source, the same clock as message arrival times.
+        """
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._buf = bytearray(RECORD.size * capacity)
+        self._seq = itertools.count()
+        self.count = 0  # records written so far, including overwritten ones
+        self.clock = clock
+        self._dump_prefix = None  # set by install_crash_dump; error dumps only happen once installed
+        self._last_error_dump = -ERROR_DUMP_INTERVAL
+
+    def record(self, kind, unit=0, bank=0, a=0, b=0, c=0, t=None):
+        i = next(self._seq)
+        RECORD.pack_into(self._buf, (i & self._mask) * RECORD.size,
+                         self.clock() if t is None else t, kind, unit, bank, a, b, c)
+        self.count = i + 1
+
+    def message(self, kind, unit, bank, message, t=None):
+        """Record a mido message or raw byte tuple (first three bytes)."""
+        if type(message) is tuple:
+            data = message
+        else:
+            # notes and CCs straight from the attributes, message.bytes() costs as much as the record
+            kind_of = message.type
+            if kind_of == 'control_change':
+                return self.record(kind, unit, bank, 0xB0 | message.channel, message.control, message.value, t)
+            if kind_of == 'note_on' or kind_of == 'note_off':
+                return self.record(kind, unit, bank, (0x90 if kind_of == 'note_on' else 0x80) | message.channel,
+                                   message.note, message.velocity, t)
+            data = message.bytes()
+        n = len(data)
+        self.record(kind, unit, bank, data[0], data[1] if n > 1 else 0, data[2] if n > 2 else 0, t)
+
+    def records(self):
+        """The buffered records, oldest first, as (time, kind, unit, bank, a, b, c)."""
+        count = self.count
+        first = max(0, count - self.capacity)
+        return [RECORD.unpack_from(self._buf, (i & self._mask) * RECORD.size) for i in range(first, count)]
+
+    def dump(self, filename):
+        """Write the buffered records to a binary file; returns the number written."""
+        records = self.records()
+        with open(filename, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(records), time.time(), self.clock()))
+            for record in records:
+                file.write(RECORD.pack(*record))
+        return len(records)
+
+    def install_crash_dump(self, prefix="Flight", root=None):
+        """
+        Dump to <prefix>-<date>-<time>.akfr when any thread dies with an unhandled exception.
+
+        Routing errors are caught and logged where they happen, so those
+        handlers call dump_on_error, which this enables.
+
+        Args:
+            prefix (str): Start of the dump file names.
+            root: Tk root whose callback errors (report_callback_exception) dump too.
+        """
+        self._dump_prefix = prefix
+        chained_sys, chained_thread = sys.excepthook, threading.excepthook
+
+        def on_exception(*args):
+            self.dump_now(prefix)
+            chained_sys(*args)
+
+        def on_thread_exception(args):
+            self.dump_now(prefix)
+            chained_thread(args)
+
+        sys.excepthook = on_exception
+        threading.excepthook = on_thread_exception
+        if root is not None:
+            chained_tk = root.report_callback_exception
+
+            def on_tk_exception(*args):
+                self.dump_on_error()
+                chained_tk(*args)
+
+            root.report_callback_exception = on_tk_exception
+
+    def dump_on_error(self):
+        """
+        Dump after a caught error, at most once per ERROR_DUMP_INTERVAL; a no-op until install_crash_dump.
+
+        Returns:
+            str: The dump's file name, or None if nothing was written.
+        """
+        now = time.monotonic()
+        if self._dump_prefix is None or now - self._last_error_dump < ERROR_DUMP_INTERVAL:
+            return None
+        self._last_error_dump = now
+        try:
+            filename = self.dump_now(self._dump_prefix)
+        except OSError as e:
+            Log.general.error("Flight recorder not dumped: %s", e)
+            return None
+        Log.general.error("Flight recorder dumped to %s after an error", filename)
+        return filename
+
+    def dump_now(self, prefix="Flight"):
+        """Dump to a timestamped file in the working directory; returns its name."""
+        filename = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}.akfr"
+        self.dump(filename)
+        return filename
+
+
+def read(filename):
+    """
+    Read a dump.
+
+    Returns:
+        tuple: (wall clock at dump, perf_counter at dump, [(time, kind, unit, bank, a, b, c), ...]).
+    """
+    with open(filename, "rb") as file:
+        data = file.read()
+    magic, version, size, count, wall, perf = HEADER.unpack_from(data)
+    layout = {1: RECORD_V1, VERSION: RECORD}.get(version)
+    if magic != MAGIC or layout is None or size != layout.size:
+        raise ValueError(f"{filename} is not a flight recorder dump")
+    records = [layout.unpack_from(data, HEADER.size + i * size) for i in range(count)]
+    if version == 1:
+        # the one-byte bank counted across units; bank switches carried the new bank in a
+        records = [(t, kind, 0, a if kind == BANK else bank, a, b, c) for t, kind, bank, a, b, c in records]
+    return wall, perf, records
+
+
+def describe(record):
+    t, kind, unit, bank, a, b, c = record
+    if kind in (IN, LOOPBACK, LED):
+        try:
+            what = str(mido.Message.from_bytes([a, b, c][:len_of(a)]))
+        except ValueError:
+            what = f"bytes {a:02x} {b:02x} {c:02x}"
+    elif kind == BANK:
+        what = f"bank -> {bank_label(bank)}"
+    elif kind == SHIFT:
+        what = "shift on" if a else "shift off"
+    else:
+        what = f"cc {a} hw {b} -> " + ("rejected" if c == REJECTED else str(c))
+    return f"{KINDS[kind]:<8} {f'unit {unit + 1} ' if unit else ''}bank {bank_label(bank)}  {what}"
+
+
+def len_of(status):
+    """Byte length of a channel message with this status byte (1 for anything else)."""
+    if status < 0x80:
+        return 1
+    return 2 if 0xC0 <= status < 0xE0 or status in (0xF1, 0xF3) else (3 if status < 0xF0 or status == 0xF2 else 1)
+
+
+def to_midi(records, filename, inputs_only=False):
+    """
+    Write records to a standard .mid file.
+
+    Inputs, loopback output and LED output go on separate tracks; routing
+    decisions become marker events on a fourth track. With inputs_only the
+    file holds just the input track, ready for ``Replay.py --file``.
+    """
+    midi = mido.MidiFile(ticks_per_beat=960)
+    tempo = 500000
+    names = ("input",) if inputs_only else ("input", "loopback", "leds", "routing")
+    tracks = [mido.MidiTrack([mido.MetaMessage('track_name', name=name, time=0)]) for name in names]
+    tracks[0].insert(0, mido.MetaMessage('set_tempo', tempo=tempo, time=0))
+    midi.tracks.extend(tracks)
+    start = records[0][0] if records else 0.0
+    last_tick = [0] * len(tracks)
+    for record in records:
+        t, kind = record[:2]
+        a, b, c = record[4:]
+        track = kind if kind < BANK else 3
+        if track >= len(tracks):
+            continue
+        if kind < BANK:
+            try:
+                event = mido.Message.from_bytes([a, b, c][:len_of(a)])
+            except ValueError:
+                continue
+        else:
+            event = mido.MetaMessage('marker', text=describe(record).split("  ", 1)[1])
+        tick = int(round(mido.second2tick(t - start, midi.ticks_per_beat, tempo)))
+        tracks[track].append(event.copy(time=tick - last_tick[track]))
+        last_tick[track] = tick
+    midi.save(filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("show", help="print a dump as text")
+    p.add_argument("dump")
+    p.add_argument("--last", type=int, default=0, help="only the last N records")
+    p = sub.add_parser("mid", help="convert a dump to a .mid file")
+    p.add_argument("dump")
+    p.add_argument("output")
+    p.add_argument("--inputs-only", action="store_true", help="only the input track, for Replay.py --file")
+    args = parser.parse_args()
+
+    wall, perf, records = read(args.dump)
+    if args.command == "show":
+        for record in records[-args.last:] if args.last else records:
+            at = wall - (perf - record[0])
+            print(time.strftime('%H:%M:%S', time.localtime(at)) + f"{at % 1:.6f}"[1:], describe(record))
+    else:
+        to_midi(records, args.output, inputs_only=args.inputs_only)
+        print(f"{len(records)} records -> {args.output}")
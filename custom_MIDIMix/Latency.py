@@ -0,0 +1,109 @@
+from array import array
+from bisect import bisect_left
+
+from MappingProfile import ROUTE_BANK_DOWN, ROUTE_BANK_UP, ROUTE_SHIFT
+
+# Input message classes
+NOTE = 0   # toggle buttons
+CC = 1     # knobs and faders
+SHIFT = 2  # the mapping's shift note
+NAV = 3    # its bank up/down notes
+CLASSES = ("note", "cc", "shift", "nav")
+
+# Output paths
+LOOPBACK = 0
+LED = 1
+PATHS = ("input->loopback", "input->LED")
+
+# Bucket upper edges in microseconds: four per octave from 1 us to ~16 s
+EDGES = array('d', (2 ** (i / 4) for i in range(97)))
+
+
+def classify(message, tables):
+    """Latency class of an input message, by its note's route in tables (MappingProfile.RoutingTables)."""
+    if message.type == 'control_change':
+        return CC
+    note = getattr(message, "note", None)
+    if note is None:
+        return NOTE
+    route = tables.route[note]
+    if route == ROUTE_SHIFT:
+        return SHIFT
+    if route == ROUTE_BANK_UP or route == ROUTE_BANK_DOWN:
+        return NAV
+    return NOTE
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; recording is a bisect and an increment."""
+
+    def __init__(self):
+        self.counts = array('Q', [0]) * (len(EDGES) + 1)  # last bucket: beyond the top edge
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        us = seconds * 1e6
+        self.counts[bisect_left(EDGES, us)] += 1
+        self.count += 1
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile, in microseconds (capped at max)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(EDGES[i] if i < len(EDGES) else self.max, self.max)
+        return self.max
+
+    def reset(self):
+        self.counts[:] = array('Q', [0]) * len(self.counts)
+        self.count = 0
+        self.max = 0.0
+
+
+class LatencyStats:
+    """Input-to-output latency per output path and input class."""
+
+    def __init__(self):
+        self.hist = [[Histogram() for _ in CLASSES] for _ in PATHS]
+
+    def record(self, path, cls, seconds):
+        self.hist[path][cls].record(seconds)
+
+    def summary(self):
+        """{path: {class: {"n", "p50", "p95", "p99", "max"}}} in microseconds, only for classes seen."""
+        out = {}
+        for path, row in zip(PATHS, self.hist):
+            out[path] = {name: {"n": h.count, "p50": h.percentile(50), "p95": h.percentile(95),
+                                "p99": h.percentile(99), "max": h.max}
+                         for name, h in zip(CLASSES, row) if h.count}
+        return out
+
+    def report(self):
+        """Text table of the summary."""
+        lines = [f"{'path':<16} {'class':<6} {'n':>8} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>9}"]
+        for path, row in self.summary().items():
+            for name, s in row.items():
+                lines.append(f"{path:<16} {name:<6} {s['n']:>8} {s['p50']:>9.0f} {s['p95']:>9.0f} "
+                             f"{s['p99']:>9.0f} {s['max']:>9.0f}")
+        return "\n".join(lines)
+
+    def readout(self):
+        """One line for the GUI: p95 per class on the loopback path, LED p95 overall."""
+        row = self.hist[LOOPBACK]
+        parts = [f"{name} {h.percentile(95) / 1000:.2f}" for name, h in zip(CLASSES, row) if h.count]
+        led = max((h.percentile(95) for h in self.hist[LED] if h.count), default=None)
+        if led is not None:
+            parts.append(f"LED {led / 1000:.2f}")
+        return ("p95 ms  " + "  ".join(parts)) if parts else ""
+
+    def reset(self):
+        for row in self.hist:
+            for h in row:
+                h.reset()
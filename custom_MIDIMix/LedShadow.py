@@ -0,0 +1,66 @@
+import threading
+
+import Log
+import RawMidi
+
+UNKNOWN = 0xFF  # shadow value for an LED whose state on the device is not known
+
+
+class LedShadow:
+    """Model of what the MIDImix LEDs currently show.
+
+    Every LED write goes through here and is only sent when the LED would
+    actually change. After the device has been power-cycled the shadow no
+    longer matches, so ``invalidate`` forgets it and the next frame is sent
+    in full.
+    """
+
+    def __init__(self, send, encode=RawMidi.note_on_message):
+        """
+        Initialize the shadow with every LED unknown.
+
+        Args:
+            send (function): Callback that delivers a note_on message to the LED port.
+            encode (function): (channel, note, velocity) -> message; RawMidi.note_on for preencoded bytes.
+        """
+        self.send = send
+        self.encode = encode
+        self._shown = bytearray([UNKNOWN]) * 128
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+    def set(self, note, velocity):
+        """Show one LED, sending only if it differs from what is displayed."""
+        with self._lock:
+            if self._shown[note] == velocity:
+                self.suppressed += 1
+                return
+            self._shown[note] = velocity
+            self.sent += 1
+        self.send(self.encode(0, note, velocity))
+
+    def apply(self, frame):
+        """
+        Show a whole frame, sending only the LEDs that differ.
+
+        Args:
+            frame (dict): {LED note: velocity}.
+        """
+        changed = []
+        with self._lock:
+            shown = self._shown
+            for note, velocity in frame.items():
+                if shown[note] != velocity:
+                    shown[note] = velocity
+                    changed.append(note)
+            self.sent += len(changed)
+            self.suppressed += len(frame) - len(changed)
+        for note in changed:
+            self.send(self.encode(0, note, frame[note]))
+
+    def invalidate(self):
+        """Forget the displayed state so the next frame is sent in full."""
+        with self._lock:
+            self._shown[:] = bytearray([UNKNOWN]) * 128
+        Log.leds.info("LED shadow invalidated, next frame is a full resync")
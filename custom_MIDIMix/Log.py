@@ -0,0 +1,88 @@
+"""Leveled, per-category logging that never writes to the console from the MIDI thread.
+
+Records are handed to a queue unformatted and are formatted and written by a background
+listener thread. Hot-path call sites log at DEBUG with %-style arguments, so at
+the default INFO level a call is a cached level check and nothing is formatted.
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+
+ROUTING = "masterator.routing"          # message routing, bank/shift handling
+LEDS = "masterator.leds"                # LED output
+HYSTERESIS = "masterator.hysteresis"    # CC pickup / takeover decisions
+PERSISTENCE = "masterator.persistence"  # state files, journal, scenes
+
+CATEGORIES = {"routing": ROUTING, "leds": LEDS, "hysteresis": HYSTERESIS, "persistence": PERSISTENCE}
+
+routing = logging.getLogger(ROUTING)
+leds = logging.getLogger(LEDS)
+hysteresis = logging.getLogger(HYSTERESIS)
+persistence = logging.getLogger(PERSISTENCE)
+general = logging.getLogger("masterator")
+
+_listener = None
+
+
+_IMMUTABLE = (str, int, float, bool, bytes, tuple, type(None))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue the record unformatted; the stock QueueHandler would format it on the caller's thread.
+
+    Arguments that can change before the sink formats them (a mido message the
+    shift layer rewrites in place, a state dict) are copied when the record is
+    queued, so the line shows them as they were at the call. This only runs for
+    records that passed the level check.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if isinstance(args, tuple) and not all(type(a) in _IMMUTABLE for a in args):
+            record.args = tuple(_snapshot(a) for a in args)
+        return record
+
+
+def _snapshot(arg):
+    if type(arg) in _IMMUTABLE:
+        return arg
+    copy = getattr(arg, "copy", None)
+    return copy() if callable(copy) else str(arg)
+
+
+def start(level=logging.INFO, categories=None, stream=None):
+    """
+    Attach the queue and start the background sink.
+
+    Args:
+        level (int | str): Level for all categories, e.g. logging.DEBUG or "DEBUG".
+        categories (list): Category names (keys of CATEGORIES) to enable; None enables all.
+        stream: Where the sink writes; defaults to stderr.
+    """
+    global _listener
+    stop()
+    q = queue.SimpleQueue()
+    general.handlers[:] = [_DeferredQueueHandler(q)]
+    general.setLevel(level)
+    general.propagate = False
+    sink = logging.StreamHandler(stream or sys.stderr)
+    sink.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(q, sink)
+    _listener.start()
+    if categories is not None:
+        for name in CATEGORIES:
+            set_category(name, name in categories)
+
+
+def set_category(name, enabled):
+    """Switch a category (e.g. "leds") on or off at runtime."""
+    logging.getLogger(CATEGORIES[name]).disabled = not enabled
+
+
+def stop():
+    """Drain the queue and stop the sink thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import namedtuple
+
+import mido
+
+import Log
+from Latency import Histogram
+
+# A compiled macro: steps are (offset from the press in seconds, messages to send then), offsets ascending
+Macro = namedtuple("Macro", "name slot steps")
+
+SPIN = 0.0005  # seconds before a step is due that the scheduler stops sleeping and yields in a loop
+
+
+def load_config(filename="Macros.json"):
+    """
+    Read button macros per bank, e.g.
+    {"default": {"24": [{"cc": 20, "value": 0}, {"wait": 20}, {"cc": 19, "value": 0}, {"note": 1}]},
+     "Bank B": {"3": [{"note": 60, "channel": 10}, {"wait": 100}, {"note": 60, "velocity": 0, "channel": 10}]}}.
+
+    Keys are the notes the button sends (shifted notes for the shift layer). Steps are
+    {"note": n, "velocity": 0-127 (127), "channel": 1-16}, {"cc": n, "value": 0-127, "channel": 1-16}
+    and {"wait": ms}; the channel defaults to the bank's loopback channel. "default" applies to every
+    bank, a bank's own entries replace it per button.
+
+    Returns:
+        dict: Bank name -> {note: steps}; empty if the file does not exist.
+    """
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def compile_macro(name, steps, channel, encode_note_on, slot=(0, 0)):
+    """
+    Preencode a macro's messages and group them by when they are due.
+
+    Args:
+        name (str): For the log.
+        steps (list): Steps as in Macros.json.
+        channel (int): Loopback channel of the bank (0-based), for steps without a channel.
+        encode_note_on (function): RawMidi.note_on or RawMidi.note_on_message, as the bank's output mode.
+        slot (tuple): (unit, bank index) for the flight recorder.
+
+    Raises:
+        ValueError: A step is not a note, cc or wait, or a number is out of range.
+    """
+    offset = 0.0
+    groups = []
+    for step in steps:
+        try:
+            if "wait" in step:
+                wait = float(step["wait"])
+                if not wait >= 0:
+                    raise ValueError("negative wait")
+                offset += wait / 1000.0
+                continue
+            ch = _ranged(step["channel"], 1, 16) - 1 if "channel" in step else channel
+            # checked before encoding: the raw encoder indexes tables, a note of -1 would become 127
+            if "note" in step:
+                message = encode_note_on(ch, _ranged(step["note"]), _ranged(step.get("velocity", 127)))
+            else:
+                message = mido.Message('control_change', channel=ch, control=_ranged(step["cc"]),
+                                       value=_ranged(step["value"]))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ValueError(f"{name}: bad step {step!r} ({e})") from None
+        if groups and groups[-1][0] == offset:
+            groups[-1][1].append(message)
+        else:
+            groups.append((offset, [message]))
+    return Macro(name, slot, tuple((offset, tuple(messages)) for offset, messages in groups))
+
+
+def _ranged(value, low=0, high=127):
+    if type(value) is not int or not low <= value <= high:
+        raise ValueError(f"{value!r} is not in {low}-{high}")
+    return value
+
+
+def bank_macros(config, bank_name, channel, encode_note_on, slot=(0, 0)):
+    """{note: Macro} for one bank: the "default" macros overridden by the bank's own."""
+    steps = dict(config.get("default", {}))
+    steps.update(config.get(bank_name, {}))
+    macros = {}
+    for note, macro_steps in steps.items():
+        try:
+            macros[int(note)] = compile_macro(f"{bank_name} note {note}", macro_steps, channel, encode_note_on, slot)
+        except ValueError as e:
+            Log.routing.error("Macro not loaded: %s", e)
+    return macros
+
+
+class MacroScheduler:
+    """Runs the timed steps of button macros on one thread, from a heap of due steps.
+
+    ``start`` sends the steps due at once on the calling (input) thread and
+    only pushes the rest on the heap, so a press costs one heap push however
+    long the macro is. Step times are absolute offsets from the press, so
+    waits do not add up drift. The thread sleeps on a condition until a step
+    is close, then yields in a loop for the last ``spin`` seconds, looking
+    at the heap again on every turn so a step started meanwhile with an
+    earlier due time is not held back. Every step's lateness goes into a
+    histogram. The thread starts with the first timed step. Jitter still
+    depends on the other Python threads: one that holds the GIL delays the
+    scheduler until it lets go.
+    """
+
+    def __init__(self, send, spin=SPIN):
+        """
+        Initialize the scheduler.
+
+        Args:
+            send (function): send(message, slot) for the steps that come after a wait.
+            spin (float): Seconds before a step is due to stop sleeping and yield in a loop.
+        """
+        self.send = send
+        self.spin = spin
+        self._heap = []  # (due time, tie breaker, macro, step index, start time)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._dispatching = False
+        self.started = 0
+        self.steps_sent = 0
+        self.max_pending = 0
+        self.jitter = Histogram()  # how late each timed step went out
+
+    @property
+    def pending(self):
+        """Timed steps waiting on the heap: at most one per running macro."""
+        return len(self._heap)
+
+    def start(self, macro, send_now):
+        """
+        Run a macro from now.
+
+        Args:
+            macro (Macro): The compiled macro.
+            send_now (function): Sender for the steps due at once (the bank's loopback path).
+        """
+        now = time.perf_counter()
+        self.started += 1
+        steps = macro.steps
+        first = 0
+        if steps and steps[0][0] == 0.0:
+            for message in steps[0][1]:
+                send_now(message)
+            self.steps_sent += 1
+            first = 1
+        if first < len(steps):
+            self._push(now + steps[first][0], macro, first, now)
+
+    def wait_idle(self, timeout=None):
+        """Wait until every timed step started so far has been sent."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._heap and not self._dispatching, timeout)
+
+    def stats(self):
+        return {"started": self.started, "steps": self.steps_sent, "pending": self.pending,
+                "max_pending": self.max_pending, "jitter_us_p50": self.jitter.percentile(50),
+                "jitter_us_p99": self.jitter.percentile(99), "jitter_us_max": self.jitter.max}
+
+    def close(self):
+        """Stop the thread; steps still waiting are dropped."""
+        with self._cond:
+            self._closed = True
+            dropped = len(self._heap)
+            self._heap.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(1.0)
+        if dropped:
+            Log.routing.info("Macros: %d timed steps dropped at shutdown", dropped)
+
+    def _push(self, due, macro, index, start):
+        with self._cond:
+            if self._closed:
+                return
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (due, seq, macro, index, start))
+            if len(self._heap) > self.max_pending:
+                self.max_pending = len(self._heap)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="MacroScheduler", daemon=True)
+                self._thread.start()
+            elif self._heap[0][1] == seq:
+                self._cond.notify()  # new earliest step: the thread may be sleeping for a later one
+
+    def _run(self):
+        clock = time.perf_counter
+        heap = self._heap
+        while True:
+            with self._cond:
+                while not heap and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                due = heap[0][0]
+                delay = due - clock()
+                if delay > self.spin:
+                    self._cond.wait(delay - self.spin)
+                    continue
+            while True:
+                now = clock()
+                try:
+                    top = heap[0][0]  # a push is atomic under the GIL, the top can be read without the lock
+                    if top < due:
+                        due = top
+                except IndexError:  # emptied by close()
+                    pass
+                if now >= due:
+                    break
+                time.sleep(0)  # hand the GIL around until the step is due
+            with self._cond:
+                ready = []
+                while heap and heap[0][0] <= now:
+                    ready.append(heapq.heappop(heap))
+                self._dispatching = True
+            for due, _, macro, index, start in ready:
+                self.jitter.record(clock() - due)
+                for message in macro.steps[index][1]:
+                    self.send(message, macro.slot)
+                self.steps_sent += 1
+                if index + 1 < len(macro.steps):
+                    self._push(start + macro.steps[index + 1][0], macro, index + 1, start)
+            with self._cond:
+                self._dispatching = False
+                if not heap:
+                    self._cond.notify_all()  # wait_idle
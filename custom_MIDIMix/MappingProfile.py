@@ -0,0 +1,249 @@
+"""Mapping profile: the MIDImix note/CC map, read from one JSON file and compiled into dense tables.
+
+    python MappingProfile.py [FILE]     check a profile and print what it compiles to
+"""
+import json
+import os
+import pickle
+import sys
+import threading
+
+import Log
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Mapping.json")
+CACHE_VERSION = 1  # bump when Mapping or RoutingTables change shape
+
+CC_ROWS = ("knob_row_1", "knob_row_2", "knob_row_3", "faders")
+NOTE_ROWS = ("mute", "solo", "recarm")
+STRIPS = 8
+
+# Routing codes stored in RoutingTables.route
+ROUTE_TOGGLE = 0
+ROUTE_BANK_UP = 1
+ROUTE_BANK_DOWN = 2
+ROUTE_SHIFT = 3
+
+
+class RoutingTables:
+    """Dense 128-entry lookup tables compiled from the note lists, indexed by note number."""
+
+    def __init__(self, shifted, shift_offset=32, bank_up=25, bank_down=26, shift=27):
+        """
+        Compile the tables.
+
+        Args:
+            shifted (list): Notes that move by shift_offset while the shift button is held.
+            shift_offset (int): Distance between a note and its shifted twin.
+            bank_up (int): Bank Up button note.
+            bank_down (int): Bank Down button note.
+            shift (int): Shift button note.
+        """
+        # what a note_on/note_off on this note does
+        self.route = bytearray(128)
+        self.route[bank_up] = ROUTE_BANK_UP
+        self.route[bank_down] = ROUTE_BANK_DOWN
+        self.route[shift] = ROUTE_SHIFT
+        # note actually sent while shift is held
+        self.shift_target = list(range(128))
+        # LED that displays a stored note while shift is held
+        self.led_shifted = list(range(128))
+        for note in shifted:
+            self.shift_target[note] = note + shift_offset
+            self.led_shifted[note + shift_offset] = note
+        self.led_base = list(range(128))
+
+
+class Mapping:
+    """A compiled profile: routing tables, state defaults and the panel map for the views.
+
+    Treated as immutable once compiled; a reload compiles a new Mapping and
+    the Masterator swaps it in (see MidiMasterator.swap_mapping).
+    """
+
+    def __init__(self, profile, source=None):
+        """
+        Compile a profile.
+
+        Args:
+            profile (dict): Parsed profile, as in Mapping.json.
+            source (str): File the profile came from, for messages.
+
+        Raises:
+            ValueError: The profile is incomplete, malformed or maps a number twice.
+        """
+        self.source = source
+        try:
+            self._compile(profile)
+        except KeyError as e:
+            raise ValueError(f"{source or 'profile'}: missing {e}") from None
+        except (TypeError, IndexError, AttributeError) as e:
+            # e.g. a number where a row of eight belongs, or a row where a number belongs
+            raise ValueError(f"{source or 'profile'}: malformed ({e})") from None
+
+    def _compile(self, profile):
+        source = self.source
+        cc, notes, shift, bank = profile["cc"], profile["notes"], profile["shift"], profile["bank"]
+        self.cc_map = {row: [_number(n) for n in cc[row]] for row in CC_ROWS}
+        self.cc_map["master"] = _number(cc["master"])
+        self.notes = {row: [_number(n) for n in notes[row]] for row in NOTE_ROWS}
+        self.shift_note = _number(shift["note"])
+        self.shift_offset = int(shift["offset"])
+        self.shift_rows = list(shift["rows"])
+        self.bank_up = _number(bank["up"])
+        self.bank_down = _number(bank["down"])
+        rows = [self.cc_map[r] for r in CC_ROWS] + [self.notes[r] for r in NOTE_ROWS]
+        if any(len(r) != STRIPS for r in rows):
+            raise ValueError(f"{source or 'profile'}: every row needs {STRIPS} numbers, one per strip")
+        if any(r not in NOTE_ROWS for r in self.shift_rows):
+            raise ValueError(f"{source or 'profile'}: shift rows must be among {', '.join(NOTE_ROWS)}")
+        self.controls = sorted(n for r in CC_ROWS for n in self.cc_map[r]) + [self.cc_map["master"]]
+        toggles = [n for r in NOTE_ROWS for n in self.notes[r]]
+        self.shifted = [n for r in self.shift_rows for n in self.notes[r]]
+        self.after_shift = [_number(n + self.shift_offset) for n in self.shifted]
+        buttons = (self.bank_up, self.bank_down, self.shift_note)
+        for name, numbers in (("CC", self.controls), ("note", toggles + self.after_shift + list(buttons))):
+            if len(set(numbers)) != len(numbers):
+                raise ValueError(f"{source or 'profile'}: a {name} number is mapped twice")
+        self.tables = RoutingTables(self.shifted, self.shift_offset, self.bank_up, self.bank_down, self.shift_note)
+        self.default_toggle_states = {n: False for n in sorted(toggles) + self.after_shift}
+        self.default_cc = {n: 0 for n in self.controls}
+
+
+def _number(value):
+    if not isinstance(value, int) or not 0 <= value <= 127:
+        raise ValueError(f"{value!r} is not a MIDI note or CC number (0-127)")
+    return value
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load(path=DEFAULT_PATH):
+    """
+    Load a profile, from its compiled cache when the file has not changed since it was compiled.
+
+    The cache (``<file>.cache``, next to the profile) holds the pickled Mapping
+    keyed by the file's modification time and size, so a warm start is a stat
+    and an unpickle. A cache that cannot be read (whatever unpickling raises,
+    e.g. for a class that has changed since) or written is ignored.
+
+    Raises:
+        OSError: The profile cannot be read.
+        ValueError: The profile does not compile.
+    """
+    signature = _signature(path)
+    cache = path + ".cache"
+    try:
+        with open(cache, "rb") as file:
+            version, cached_signature, mapping = pickle.load(file)
+        if version == CACHE_VERSION and cached_signature == signature:
+            return mapping
+    except Exception:  # a stale or damaged cache is a miss
+        pass
+    with open(path, "r") as file:
+        try:
+            profile = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+    mapping = Mapping(profile, path)
+    try:
+        with open(cache + ".tmp", "wb") as file:
+            pickle.dump((CACHE_VERSION, signature, mapping), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(cache + ".tmp", cache)
+    except OSError as e:
+        Log.general.debug("Mapping cache not written: %s", e)
+    return mapping
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def current():
+    """The mapping in use: the default profile until another one is set with use()."""
+    global _current
+    if _current is None:
+        with _current_lock:
+            if _current is None:
+                _current = load()
+    return _current
+
+
+def use(mapping):
+    """Make mapping the one current() returns (banks created from now on get it)."""
+    global _current
+    _current = mapping
+
+
+class MappingWatcher:
+    """Reloads a profile when its file changes and hands the new Mapping to a callback.
+
+    The file is checked with one stat per interval on a daemon thread, and
+    compiled on that thread, so the routing thread only ever sees a finished
+    Mapping. A profile that does not compile is logged and the old one stays;
+    nothing a reload raises stops the watcher.
+    """
+
+    def __init__(self, path, on_change, interval=1.0):
+        """
+        Start watching.
+
+        Args:
+            path (str): Profile file.
+            on_change (function): Called with the new Mapping, on the watcher thread.
+            interval (float): Seconds between two checks of the file.
+        """
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        try:
+            self._signature = _signature(path)
+        except OSError:
+            self._signature = None
+        self._thread = threading.Thread(target=self._run, name="MappingWatcher", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(1.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                signature = _signature(self.path)
+            except OSError:
+                continue  # being replaced by an editor; look again next time
+            if signature == self._signature:
+                continue
+            self._signature = signature
+            try:
+                mapping = load(self.path)
+            except (OSError, ValueError) as e:
+                self.failures += 1
+                Log.general.error("Mapping %s not reloaded, keeping the current one: %s", self.path, e)
+                continue
+            except Exception:
+                self.failures += 1
+                Log.general.exception("Mapping %s not reloaded, keeping the current one", self.path)
+                continue
+            self.reloads += 1
+            Log.general.info("Mapping %s reloaded", self.path)
+            try:
+                self.on_change(mapping)
+            except Exception:
+                Log.general.exception("Mapping %s reloaded but not applied", self.path)
+
+
+if __name__ == "__main__":
+    m = Mapping(json.load(open(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)))
+    for row in CC_ROWS + ("master",):
+        print(f"CC   {row:<11} {m.cc_map[row]}")
+    for row in NOTE_ROWS:
+        print(f"note {row:<11} {m.notes[row]}")
+    print(f"shift note {m.shift_note}, +{m.shift_offset}: {m.shifted} -> {m.after_shift}")
+    print(f"bank up {m.bank_up}, bank down {m.bank_down}")
@@ -1,22 +1,13 @@
 # MasteratorGui.py
 import tkinter as tk
 import math
-from dataclasses import dataclass
-
-# ---- Device map (Akai MIDImix) ----
-CC_MAP = {
-    "knob_row_1": [16, 20, 24, 28, 46, 50, 54, 58],
-    "knob_row_2": [17, 21, 25, 29, 47, 51, 55, 59],
-    "knob_row_3": [18, 22, 26, 30, 48, 52, 56, 60],
-    "faders":     [19, 23, 27, 31, 49, 53, 57, 61],
-    "master":     127,
-}
-NOTES = {
-    "mute":   [1, 4, 7, 10, 13, 16, 19, 22],  # base
-    "solo":   [2, 5, 8, 11, 14, 17, 20, 23],  # device sends while SOLO held
-    "recarm": [3, 6, 9, 12, 15, 18, 21, 24],  # base; shifted = +32 (your hook)
-}
-SHIFT_OFFSET = 32
+import threading
+import time
+
+from ChangeFeed import BankSnapshot
+from Latency import Histogram
+import MappingProfile
+from MidiDevice import bank_label
 
 # ---- visuals ----
 COL_BG       = "#111418"
@@ -26,18 +17,11 @@ COL_TEXT     = "#d9dde3"
 COL_OFF      = "#2a2f34"
 COL_ON       = "#9be9a8"
 COL_INACTIVE = "#5a7a62"
-BANK_COLORS  = ["#6ee7b7", "#93c5fd", "#fca5a5", "#fcd34d"]  # A,B,C,D
-
-@dataclass
-class BankSnapshot:
-    name: str
-    toggle_states: dict[int, bool]   # note -> bool
-    cc_values: dict[int, int]        # cc   -> 0..127
-    note27_on: bool
-    active_bank: int                 # 0..3 (A..D)
+BANK_COLORS  = ["#6ee7b7", "#93c5fd", "#fca5a5", "#fcd34d"]  # A,B,C,D, repeating for every page of 4 banks
+PAGE = 4  # banks shown at once by the bank selector and the micro view
 
 class MasteratorGUI:
-    """Detailed view (current bank) + Micro view (all banks)."""
+    """Detailed view (current bank) + Micro view (the page of 4 banks around the current one)."""
     def __init__(self, root: tk.Tk):
         self.root = root
         self.canvas = tk.Canvas(root, bg=COL_BG, highlightthickness=0)
@@ -56,8 +40,31 @@ class MasteratorGUI:
         self.root.bind("<Configure>", lambda e: self._invalidate())
 
         self._latest_snapshot: BankSnapshot | None = None
-        self._bank_snaps: list[BankSnapshot | None] = [None]*4
+        self._bank_snaps: list[BankSnapshot | None] = [None]*PAGE
+        self._status = ""  # one-line readout at the bottom (latency)
+        self._change_source = None  # called once per frame to pull what changed, see set_change_source
         self._dirty = True
+        self.mapping = MappingProfile.current()  # note/CC numbers behind the controls
+
+        # Retained mode: items are created once per layout, frames only update the ones whose value changed
+        self._layout = None                # (micro, w, h, has snapshot) the items were built for
+        self._views: list[list] = []       # [value_fn, apply_fn, last value] per dynamic item group
+        self.rebuilds = 0
+        self.last_frame_ms = 0.0
+
+        # Frame scheduler: a frame is requested on change and runs at most every _interval; idle = no timer
+        self._interval = 1 / 60
+        self._frame_requested = False
+        self._frame_after = None   # pending root.after id
+        self._frame_due = 0.0      # when the pending frame should run
+        self._last_frame = -1e9
+        self._cross_thread = True  # Tcl accepts events from other threads (threaded build)
+        self._tk_thread = threading.get_ident()
+        self._wake = threading.Event()  # set by request_frame off the Tk thread, see _notify
+        self.frames = 0            # frames drawn
+        self.requests = 0          # request_frame calls that woke the scheduler
+        self.dropped_frames = 0    # frame intervals missed because Tk was busy
+        self.frame_time = Histogram()
 
     # ---------- producer API ----------
     def set_snapshot(self, snapshot: BankSnapshot):
@@ -69,18 +76,125 @@ class MasteratorGUI:
         self._bank_snaps[snapshot.active_bank] = snapshot
         self._dirty = True
 
-    def start_render_loop(self, fps: int = 3):
-        delay = max(1, int(1000 / max(1, fps)))
-        def tick():
-            if self._dirty:
-                self._draw()
-                self._dirty = False
-            self.root.after(delay, tick)
-        tick()
+    def set_bank_count(self, count: int):
+        """Number of banks of the shown unit; forgets the bank snapshots."""
+        self._bank_snaps = [None]*count
+        self._latest_snapshot = None
+        self._layout = None  # bank labels depend on the count
+        self._invalidate()
+
+    def set_mapping(self, mapping):
+        """Show the controls with another mapping's numbers (after a profile reload)."""
+        self.mapping = mapping
+        self._layout = None  # the items are bound to note/CC numbers
+        self._invalidate()
+
+    def set_change_source(self, pull):
+        """pull() is called on the Tk thread before each frame and feeds changes in through set_*snapshot."""
+        self._change_source = pull
+
+    def set_status(self, text: str):
+        if text != self._status:
+            self._status = text
+            self._dirty = True
+
+    def render_now(self):
+        """Draw immediately if anything changed (used for the first frame at startup)."""
+        if self._change_source: self._change_source()
+        if self._dirty:
+            self._draw()
+            self._dirty = False
+            self.root.update_idletasks()
+
+    def start_render_loop(self, max_fps: int = 60):
+        """
+        Event driven frames: request_frame() schedules one, at most max_fps per second.
+        No timer runs while nothing changes. If the Tcl build cannot take events from
+        other threads, fall back to polling at max_fps.
+        """
+        self._interval = 1.0 / max(1, max_fps)
+        self.root.bind("<<MasteratorFrame>>", lambda e: self._schedule_frame())
+        try:
+            self._cross_thread = self.root.tk.eval("set tcl_platform(threaded)") == "1"
+        except Exception:
+            self._cross_thread = False
+        if not self._cross_thread:
+            def poll():
+                self._run_frame()
+                self.root.after(max(1, int(self._interval * 1000)), poll)
+            self.root.after_idle(poll)
+            return
+        threading.Thread(target=self._notify, name="GuiFrameNotifier", daemon=True).start()
+        self.request_frame()
+
+    def request_frame(self):
+        """Ask for a frame soon; safe from any thread and never blocks, a flag check when one is already pending."""
+        if self._frame_requested or not self._cross_thread:
+            return
+        self._frame_requested = True
+        self.requests += 1
+        if threading.get_ident() == self._tk_thread:
+            self._schedule_frame()
+        else:
+            self._wake.set()
+
+    def _notify(self):
+        """
+        Notifier thread: post <<MasteratorFrame>> to Tk for requests made on other threads.
+
+        Posting from a thread that is not Tk's waits until the Tk main loop has
+        taken the event (or about a second, when the main loop is not running),
+        so it happens here and the MIDI thread or event loop only sets _wake.
+        """
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                try:
+                    self.root.event_generate("<<MasteratorFrame>>", when="tail")
+                    break
+                except RuntimeError:  # main loop not running (yet / any more): keep the request, try again
+                    time.sleep(0.05)
+                except tk.TclError:  # window destroyed
+                    return
+
+    def frame_stats(self):
+        return {"frames": self.frames, "requests": self.requests, "rebuilds": self.rebuilds,
+                "dropped": self.dropped_frames, "frame_ms_p50": self.frame_time.percentile(50) / 1000,
+                "frame_ms_p95": self.frame_time.percentile(95) / 1000, "frame_ms_max": self.frame_time.max / 1000}
+
+    def _schedule_frame(self):
+        if self._frame_after is not None:
+            return
+        now = time.perf_counter()
+        self._frame_due = max(now, self._last_frame + self._interval)
+        delay_ms = int((self._frame_due - now) * 1000 + 0.999)
+        self._frame_after = self.root.after(delay_ms, self._run_frame) if delay_ms else self.root.after_idle(self._run_frame)
+
+    def _run_frame(self):
+        start = time.perf_counter()
+        if self._frame_after is not None:
+            self._frame_after = None
+            late = start - self._frame_due
+            if late > self._interval:
+                self.dropped_frames += int(late / self._interval)
+        self._frame_requested = False  # before pulling, so a change made during this frame asks for the next
+        if self._change_source: self._change_source()
+        if self._dirty:
+            self._dirty = False
+            self._draw()
+            self.frames += 1
+            self.frame_time.record(time.perf_counter() - start)
+            self._last_frame = start
 
     # ---------- internals ----------
-    def _invalidate(self): self._dirty = True
-    def _accent_for(self, idx: int): return BANK_COLORS[idx]
+    def _invalidate(self):
+        self._dirty = True
+        self.request_frame()
+    def _accent_for(self, idx: int): return BANK_COLORS[idx % len(BANK_COLORS)]
+    def _page_start(self):
+        s = self._latest_snapshot
+        return s.active_bank - s.active_bank % PAGE if s else 0
 
     # Tk angle -> canvas point (y is down)
     def _tk_angle_to_point(self, cx, cy, r, angle_deg):
@@ -88,14 +202,48 @@ class MasteratorGUI:
         return cx + r*math.cos(theta), cy - r*math.sin(theta)
 
     def _draw(self):
+        t0 = time.perf_counter()
         c = self.canvas
-        c.delete("all")
         w = c.winfo_width() or 800
         h = c.winfo_height() or 600
-        if self.micro_var.get():
+        micro = bool(self.micro_var.get())
+        layout = (micro, w, h, micro or self._latest_snapshot is not None)
+        if layout != self._layout:
+            self._layout = layout
+            self._build(micro, w, h)
+        else:
+            self._refresh()
+        self.last_frame_ms = (time.perf_counter() - t0) * 1000
+
+    def _build(self, micro, w, h):
+        """Create every item for the current layout (first frame, resize, view switch)."""
+        c = self.canvas
+        c.delete("all")
+        self._views = []
+        self.rebuilds += 1
+        if micro:
             self._draw_micro(w, h)
         else:
             self._draw_detail(w, h)
+        status = c.create_text(8, h-6, anchor="sw", fill=COL_GRID, font=("Segoe UI", 9))
+        self._bind(lambda: self._status, lambda text: c.itemconfigure(status, text=text))
+
+    def _bind(self, value_fn, apply_fn):
+        """Register a dynamic item group: apply_fn(value) runs now and whenever value_fn() changes."""
+        value = value_fn()
+        apply_fn(value)
+        self._views.append([value_fn, apply_fn, value])
+
+    def _refresh(self):
+        for view in self._views:
+            value = view[0]()
+            if value != view[2]:
+                view[2] = value
+                view[1](value)
+
+    # values of the detail view (active bank)
+    def _cc(self, cc): return self._latest_snapshot.cc_values.get(cc, 0)
+    def _accent(self): return self._accent_for(self._latest_snapshot.active_bank)
 
     # ===== Detailed single-bank view =====
     def _draw_detail(self, w, h):
@@ -104,7 +252,6 @@ class MasteratorGUI:
             self.canvas.create_text(w//2, h//2, text="Waiting for MIDI…", fill=COL_TEXT, font=("Segoe UI", 14))
             return
         c = self.canvas
-        accent = self._accent_for(s.active_bank)
 
         base_cell, base_gap, base_pad = 96, 12, 16
         needed_w = base_pad*2 + 8*base_cell + 7*base_gap + 160
@@ -116,33 +263,34 @@ class MasteratorGUI:
         left = PAD; top = PAD + 28 * S
 
         # Header + bank squares
-        c.create_text(PAD+60, 12, anchor="nw",
-                      text=f"{s.name} | Shift(27)={'ON' if s.note27_on else 'OFF'}",
-                      fill=COL_TEXT, font=("Segoe UI", int(14*S), "bold"))
-        self._bank_selector(c, w - PAD - 4*50*S, 12, int(50*S), int(26*S), s.active_bank)
+        header = c.create_text(PAD+60, 12, anchor="nw", fill=COL_TEXT, font=("Segoe UI", int(14*S), "bold"))
+        self._bind(lambda: (self._latest_snapshot.name, self._latest_snapshot.note27_on),
+                   lambda v: c.itemconfigure(header, text=f"{v[0]} | Shift({self.mapping.shift_note})={'ON' if v[1] else 'OFF'}"))
+        self._bank_selector(c, w - PAD - PAGE*50*S, 12, int(50*S), int(26*S))
 
         # Knob rows
+        cc_map, notes = self.mapping.cc_map, self.mapping.notes
         for r_idx, key in enumerate(["knob_row_1","knob_row_2","knob_row_3"]):
             y = top + r_idx*(CELL+GAP)
-            for i, cc in enumerate(CC_MAP[key]):
+            for i, cc in enumerate(cc_map[key]):
                 x = left + i*(CELL+GAP)
-                self._knob(c, x, y, CELL, KNOB_R, cc, s.cc_values.get(cc, 0), accent)
+                self._knob(c, x, y, CELL, KNOB_R, cc)
 
-        # Buttons (MUTE uses SOLO for shift; REC uses +32)
+        # Buttons (MUTE uses SOLO for shift; REC uses the shift offset, +32)
         strip_top = top + 3*(CELL+GAP) + 10*S
         dx = CELL + GAP
         self._dual_row_buttons(c, left+8*S, strip_top, "MUTE",
-                               base_notes=NOTES["mute"], shift_notes=NOTES["solo"],
-                               s=s, dx=dx, cell=CELL, S=S, accent=accent)
+                               base_notes=notes["mute"], shift_notes=notes["solo"],
+                               dx=dx, cell=CELL, S=S)
         self._dual_row_buttons(c, left+8*S, strip_top+68*S, "REC",
-                               base_notes=NOTES["recarm"], shift_notes=None, use_offset=True,
-                               s=s, dx=dx, cell=CELL, S=S, accent=accent)
+                               base_notes=notes["recarm"], shift_notes=None, use_offset=True,
+                               dx=dx, cell=CELL, S=S)
 
         # Faders + labels
-        for i, cc in enumerate(CC_MAP["faders"]):
+        for i, cc in enumerate(cc_map["faders"]):
             x = left + i*dx
-            val = s.cc_values.get(cc, 0)
-            self._fader(c, x + (CELL/2 - FADER_W/2), strip_top+140*S, FADER_W, FADER_H, val, accent)
+            self._fader(c, x + (CELL/2 - FADER_W/2), strip_top+140*S, FADER_W, FADER_H,
+                        lambda cc=cc: self._cc(cc), self._accent)
             c.create_text(x+CELL/2, strip_top+140*S+FADER_H+16*S,
                           text=str(i+1), fill=COL_TEXT, font=("Segoe UI", int(10*S)))
 
@@ -150,7 +298,7 @@ class MasteratorGUI:
         mx = left + 8*dx + 36*S; m_top = strip_top
         self._panel(c, mx-24*S, m_top-6*S, 88*S, FADER_H+100*S)
         c.create_text(mx+20*S, m_top-2*S, text="MASTER", fill=COL_TEXT, font=("Segoe UI", int(10*S), "bold"))
-        self._fader(c, mx, m_top+24*S, FADER_W, FADER_H, s.cc_values.get(CC_MAP["master"], 0), accent)
+        self._fader(c, mx, m_top+24*S, FADER_W, FADER_H, lambda: self._cc(cc_map["master"]), self._accent)
 
     # ===== Micro ALL-banks view =====
     def _draw_micro(self, w, h):
@@ -158,156 +306,170 @@ class MasteratorGUI:
         PAD = 14; cols = 2; rows = 2
         tile_w = (w - PAD*(cols+1)) / cols
         tile_h = (h - PAD*(rows+1)) / rows
-        for idx in range(4):
+        for idx in range(PAGE):
             r = idx // cols; col = idx % cols
             x0 = PAD + col*(tile_w + PAD); y0 = PAD + r*(tile_h + PAD)
             self._draw_bank_micro_tile(c, x0, y0, tile_w, tile_h, idx)
 
     def _draw_bank_micro_tile(self, c, x, y, w, h, idx):
-        snap = self._bank_snaps[idx]
+        """Tile idx of the current page; its bank follows the page, so paging needs no rebuild."""
         accent = self._accent_for(idx)
         self._panel(c, x, y, w, h)
 
-        label = "ABCD"[idx]
-        c.create_text(x+10, y+8, anchor="nw", text=f"Bank {label}", fill=COL_TEXT, font=("Segoe UI", 11, "bold"))
-        if snap:
-            c.create_text(x+w-10, y+10, anchor="ne",
-                          text=("Shift ON" if snap.note27_on else "Shift OFF"),
-                          fill=COL_TEXT, font=("Segoe UI", 9))
+        title = c.create_text(x+10, y+8, anchor="nw", fill=COL_TEXT, font=("Segoe UI", 11, "bold"))
+        self._bind(lambda: self._page_start() + idx,
+                   lambda bank: c.itemconfigure(title, text=f"Bank {bank_label(bank)}" if bank < len(self._bank_snaps) else ""))
+        shift_text = c.create_text(x+w-10, y+10, anchor="ne", fill=COL_TEXT, font=("Segoe UI", 9))
+        self._bind(lambda: self._micro_shift(idx),
+                   lambda on: c.itemconfigure(shift_text, text="" if on is None else ("Shift ON" if on else "Shift OFF")))
 
         left = x + 12; top = y + 30
         width = w - 24; height = h - 42
         cols = 8; col_w = width / cols
-        ccvals = snap.cc_values if snap else {}
-        toggles = snap.toggle_states if snap else {}
-        shift_on = snap.note27_on if snap else False
+        faders, notes, offset = self.mapping.cc_map["faders"], self.mapping.notes, self.mapping.shift_offset
 
         for i in range(cols):
             cx = left + i*col_w
             gx = cx + col_w*0.1; gw = col_w*0.55; bx = cx + col_w*0.7
-            self._bar_triplet(c, gx, top+8, gw, height*0.55, i, ccvals, accent)
+            self._bar_triplet(c, gx, top+8, gw, height*0.55, i, idx, accent)
             self._bar_single(c, bx, top+8, col_w*0.2, height*0.55,
-                             self._cc_for("faders", i, ccvals), accent)
+                             lambda cc=faders[i]: self._micro_cc(idx, cc), accent)
 
             sq = min(col_w*0.22, 14); gap = sq*0.25; by = top + 8 + height*0.62
-            m_base = toggles.get(NOTES["mute"][i], False)
-            m_sh   = toggles.get(NOTES["solo"][i], False)              # SOLO for MUTE shift
-            r_base = toggles.get(NOTES["recarm"][i], False)
-            r_sh   = toggles.get(NOTES["recarm"][i] + SHIFT_OFFSET, False)
-            self._tiny_square(c, cx+col_w*0.12,        by,           sq, m_base, not shift_on, accent)
-            self._tiny_square(c, cx+col_w*0.12+sq+gap, by,           sq, m_sh,    shift_on,    accent)
-            self._tiny_square(c, cx+col_w*0.12,        by+sq+gap,    sq, r_base, not shift_on, accent)
-            self._tiny_square(c, cx+col_w*0.12+sq+gap, by+sq+gap,    sq, r_sh,    shift_on,    accent)
+            for note, sx, sy, shifted in ((notes["mute"][i],            0,        0,        False),
+                                          (notes["solo"][i],            sq+gap,   0,        True),   # SOLO for MUTE shift
+                                          (notes["recarm"][i],          0,        sq+gap,   False),
+                                          (notes["recarm"][i] + offset, sq+gap,   sq+gap,   True)):
+                self._tiny_square(c, cx+col_w*0.12+sx, by+sy, sq,
+                                  lambda note=note, shifted=shifted: self._micro_toggle(idx, note, shifted, accent))
+
+    def _micro_snap(self, idx):
+        bank = self._page_start() + idx
+        return self._bank_snaps[bank] if bank < len(self._bank_snaps) else None
+
+    def _micro_shift(self, idx):
+        snap = self._micro_snap(idx)
+        return snap.note27_on if snap else None
+
+    def _micro_cc(self, idx, cc):
+        snap = self._micro_snap(idx)
+        return snap.cc_values.get(cc, 0) if snap else 0
+
+    def _micro_toggle(self, idx, note, shifted, accent):
+        snap = self._micro_snap(idx)
+        if not snap:
+            return False, not shifted, accent
+        return snap.toggle_states.get(note, False), snap.note27_on == shifted, accent
 
     # ===== helpers =====
-    def _cc_for(self, key, i, ccvals): return ccvals.get(CC_MAP[key][i], 0)
-
-    def _bar_triplet(self, c, x, y, w, h, i, ccvals, accent):
-        vals = [self._cc_for("knob_row_1", i, ccvals),
-                self._cc_for("knob_row_2", i, ccvals),
-                self._cc_for("knob_row_3", i, ccvals)]
+    def _bar_triplet(self, c, x, y, w, h, i, idx, accent):
         bw = w/3 - 2
-        for k, v in enumerate(vals):
+        for k, key in enumerate(("knob_row_1", "knob_row_2", "knob_row_3")):
             vx = x + k*(bw+2)
-            self._bar_single(c, vx, y, bw, h, v, accent)
+            self._bar_single(c, vx, y, bw, h, lambda cc=self.mapping.cc_map[key][i]: self._micro_cc(idx, cc), accent)
 
-    def _bar_single(self, c, x, y, w, h, value, accent):
+    def _bar_single(self, c, x, y, w, h, value_fn, accent):
         c.create_rectangle(x, y, x+w, y+h, outline=COL_GRID, fill=COL_SURFACE)
-        t = (value or 0) / 127.0
-        yy = y + (1.0 - t) * h
-        c.create_rectangle(x+1, yy, x+w-1, y+h-1, outline="", fill=accent)
-
-    def _tiny_square(self, c, x, y, s, on, active_layer, accent):
+        bar = c.create_rectangle(x+1, y, x+w-1, y+h-1, outline="", fill=accent)
+        def apply(value):
+            yy = y + (1.0 - (value or 0) / 127.0) * h
+            c.coords(bar, x+1, yy, x+w-1, y+h-1)
+        self._bind(value_fn, apply)
+
+    def _toggle_rect(self, c, x0, y0, x1, y1, value_fn):
+        """Inner button square; value_fn() -> (on, layer active, accent)."""
+        rect = c.create_rectangle(x0, y0, x1, y1, width=1)
+        def apply(v):
+            on, active_layer, accent = v
+            fill = COL_ON if on else COL_OFF
+            if not active_layer:
+                fill = COL_INACTIVE if on else COL_OFF
+            c.itemconfigure(rect, fill=fill, outline=accent if active_layer else COL_GRID)
+        self._bind(value_fn, apply)
+
+    def _tiny_square(self, c, x, y, s, value_fn):
         c.create_rectangle(x, y, x+s, y+s, outline=COL_GRID, fill=COL_SURFACE)
-        fill = COL_ON if on else COL_OFF
-        if not active_layer:
-            fill = COL_INACTIVE if on else COL_OFF
-        c.create_rectangle(x+2, y+2, x+s-2, y+s-2,
-                           outline=accent if active_layer else COL_GRID,
-                           width=1, fill=fill)
+        self._toggle_rect(c, x+2, y+2, x+s-2, y+s-2, value_fn)
 
     def _panel(self, c, x, y, w, h):
         c.create_rectangle(x, y, x+w, y+h, outline=COL_GRID, fill=COL_SURFACE)
 
-    def _bank_selector(self, c, x, y, w, h, active_idx: int):
-        labels = "ABCD"
-        for i in range(4):
-            bx = x + i*w; color = BANK_COLORS[i]
+    def _bank_selector(self, c, x, y, w, h):
+        frames = []; texts = []
+        for i in range(PAGE):
+            bx = x + i*w
             self._panel(c, bx, y, w-6, h)
-            self.canvas.create_rectangle(bx+6, y+6, bx+w-12, y+h-6,
-                                         outline=color if i == active_idx else COL_GRID, width=2)
-            self.canvas.create_text(bx+(w-6)/2, y+h/2, text=labels[i],
-                                    fill=COL_TEXT, font=("Segoe UI", int(h*0.5), "bold"))
-
-    def _knob(self, c, x, y, cell, r, cc, value, accent):
+            frames.append(c.create_rectangle(bx+6, y+6, bx+w-12, y+h-6, width=2))
+            texts.append(c.create_text(bx+(w-6)/2, y+h/2, fill=COL_TEXT, font=("Segoe UI", int(h*0.5), "bold")))
+        def apply(active_idx):
+            start = active_idx - active_idx % PAGE
+            for i, (frame, text) in enumerate(zip(frames, texts)):
+                bank = start + i
+                c.itemconfigure(frame, outline=self._accent_for(i) if bank == active_idx else COL_GRID)
+                c.itemconfigure(text, text=bank_label(bank) if bank < len(self._bank_snaps) else "")
+        self._bind(lambda: self._latest_snapshot.active_bank, apply)
+
+    def _knob(self, c, x, y, cell, r, cc):
         self._panel(c, x, y, cell, cell)
         cx = x + cell/2; cy = y + cell/2
         c.create_oval(cx-r, cy-r, cx+r, cy+r, outline=COL_GRID, width=2, fill=COL_SURFACE)
-        START_DEG = 210.0; t = float(value)/127.0; sweep = 300.0 * t
-        c.create_arc(cx-r, cy-r, cx+r, cy+r, start=START_DEG, extent=-sweep,
-                     style="arc", width=6, outline=accent)
-        end_deg = (START_DEG - sweep) % 360.0
-        px, py = self._tk_angle_to_point(cx, cy, r-6, end_deg)
-        c.create_line(cx, cy, px, py, fill=accent, width=3)
-        c.create_text(cx, y+cell-12, text=f"CC {cc} ({int(value)})", fill=COL_TEXT, font=("Segoe UI", 9))
-
-    def _fader(self, c, x, y, fw, fh, value, accent):
+        START_DEG = 210.0
+        arc = c.create_arc(cx-r, cy-r, cx+r, cy+r, start=START_DEG, extent=0, style="arc", width=6)
+        line = c.create_line(cx, cy, cx, cy, width=3)
+        text = c.create_text(cx, y+cell-12, fill=COL_TEXT, font=("Segoe UI", 9))
+        def apply(v):
+            value, accent = v
+            sweep = 300.0 * float(value)/127.0
+            c.itemconfigure(arc, extent=-sweep, outline=accent)
+            px, py = self._tk_angle_to_point(cx, cy, r-6, (START_DEG - sweep) % 360.0)
+            c.coords(line, cx, cy, px, py)
+            c.itemconfigure(line, fill=accent)
+            c.itemconfigure(text, text=f"CC {cc} ({int(value)})")
+        self._bind(lambda: (self._cc(cc), self._accent()), apply)
+
+    def _fader(self, c, x, y, fw, fh, value_fn, accent_fn):
         self._panel(c, x-10, y-8, fw+20, fh+16)
         c.create_rectangle(x, y, x+fw, y+fh, outline=COL_GRID, fill=COL_SURFACE)
-        t = (value or 0)/127.0; knob_y = y + (1.0 - t) * (fh-14)
-        c.create_rectangle(x-2, knob_y, x+fw+2, knob_y+14, outline="", fill=accent)
+        knob = c.create_rectangle(x-2, y, x+fw+2, y+14, outline="")
+        def apply(v):
+            value, accent = v
+            knob_y = y + (1.0 - (value or 0)/127.0) * (fh-14)
+            c.coords(knob, x-2, knob_y, x+fw+2, knob_y+14)
+            c.itemconfigure(knob, fill=accent)
+        self._bind(lambda: (value_fn(), accent_fn()), apply)
 
 
-    def _dual_row_buttons(self, c, left, top, label, base_notes, shift_notes=None, use_offset=False, s=None, dx=0, cell=0, S=1, accent=COL_ON):
+    def _dual_row_buttons(self, c, left, top, label, base_notes, shift_notes=None, use_offset=False, dx=0, cell=0, S=1):
         """
-        Draws two stacked button rows (base + shift layer).
+        Creates two stacked button rows (base + shift layer) bound to the active snapshot.
         base_notes: list of note numbers for row 1
-        shift_notes: list of note numbers for row 2 (if None, uses base+SHIFT_OFFSET if use_offset=True)
-        use_offset: if True, second row note = base_note + SHIFT_OFFSET
-        s: BankSnapshot
+        shift_notes: list of note numbers for row 2 (if None, uses base + shift offset if use_offset=True)
+        use_offset: if True, second row note = base_note + the mapping's shift offset
         """
-        if not s:
-            return
-
         for i, base_note in enumerate(base_notes):
             x = left + i * dx
-            base_on = s.toggle_states.get(base_note, False)
 
-            # Second row note numbers & states
+            # Second row note numbers
             if shift_notes:
                 shift_note = shift_notes[i]
             elif use_offset:
-                shift_note = base_note + SHIFT_OFFSET
+                shift_note = base_note + self.mapping.shift_offset
             else:
                 shift_note = None
 
-            if shift_note is not None:
-                shift_on = s.toggle_states.get(shift_note, False)
-            else:
-                shift_on = False
-
-            # Which layer is currently "active"
-            active_layer_base = not s.note27_on
-            active_layer_shift = s.note27_on
-
-            # Base row
+            # Base row, active while shift is off; shift row, active while it is on
             self._panel(c, x, top, cell, 28 * S)
-            fill_base = COL_ON if base_on else COL_OFF
-            if not active_layer_base:
-                fill_base = COL_INACTIVE if base_on else COL_OFF
-            c.create_rectangle(x+4*S, top+4*S, x+cell-4*S, top+24*S,
-                               outline=accent if active_layer_base else COL_GRID,
-                               width=1, fill=fill_base)
-
-            # Shift row
+            self._toggle_rect(c, x+4*S, top+4*S, x+cell-4*S, top+24*S,
+                              lambda note=base_note: self._detail_toggle(note, False))
             self._panel(c, x, top + 32 * S, cell, 28 * S)
-            fill_shift = COL_ON if shift_on else COL_OFF
-            if not active_layer_shift:
-                fill_shift = COL_INACTIVE if shift_on else COL_OFF
-            c.create_rectangle(x+4*S, top+36*S, x+cell-4*S, top+56*S,
-                               outline=accent if active_layer_shift else COL_GRID,
-                               width=1, fill=fill_shift)
+            self._toggle_rect(c, x+4*S, top+36*S, x+cell-4*S, top+56*S,
+                              lambda note=shift_note: self._detail_toggle(note, True))
 
         # Group label
         c.create_text(left - 50*S, top + 14*S, text=label, fill=COL_TEXT,
                       font=("Segoe UI", int(10*S), "bold"), anchor="w")
+
+    def _detail_toggle(self, note, shifted):
+        s = self._latest_snapshot
+        on = s.toggle_states.get(note, False) if note is not None else False
+        return on, s.note27_on == shifted, self._accent()
@@ -0,0 +1,88 @@
+from collections import namedtuple
+
+LAST_CHANNEL = 15  # loopback channels 1..15 (0 is left to the host)
+
+# A bank that was never visited, as stored: enough for a scene (see SceneLibrary.save)
+StoredBank = namedtuple("StoredBank", "ID toggle_states last_cc_values")
+
+
+def bank_label(idx):
+    """A..Z, then numbers from 27 on."""
+    return chr(ord("A") + idx) if idx < 26 else str(idx + 1)
+
+
+class MidiDevice:
+    """One MIDImix unit driven by the Masterator.
+
+    A unit has its own input port, LED port and LED shadow, its own banks
+    with their bank LED dial, and its own state namespace: bank IDs are
+    prefixed with ``namespace``, so every unit persists on its own (the first
+    unit keeps the plain "Bank A", "Bank B", ...). Banks are loaded on first
+    visit; until then a bank is just its stored state in the backend. Ports,
+    banks and LEDs are set up by the Masterator, which routes all units
+    through one lock and one pair of writer threads.
+    """
+
+    def __init__(self, index, input_port_name, led_port_name, namespace=None, bank_count=4, channels=4):
+        """
+        Initialize the unit.
+
+        Args:
+            index (int): Position in the Masterator's device list.
+            input_port_name (str): Name of the unit's input port.
+            led_port_name (str): Name of the unit's output port, for its LEDs.
+            namespace (str): Prefix of the unit's bank IDs; "Unit <n> " by default, none for the first unit.
+            bank_count (int): Banks on the unit.
+            channels (int): Loopback channels the unit gets; banks share them round robin if fewer than banks.
+        """
+        self.index = index
+        self.input_port_name = input_port_name
+        self.led_port_name = led_port_name
+        if namespace is None:
+            namespace = f"Unit {index + 1} " if index else ""
+        self.namespace = namespace
+        self.input_port = None
+        self.led_port = None
+        self.midi_input = None  # TimestampedInput in callback mode
+        self.leds = None  # LedShadow of this unit's panel
+        self.dial = None  # BankDial on the two bank button LEDs
+        self.led_target = 0  # the LED port's target number in the shared LED writer
+        self.load = None  # idx -> MidiHandler, set by the Masterator
+        self.banks = [None] * bank_count  # None until first visited
+        self.bankstate = 0
+        self.channels = channels
+        self.first_channel = index * channels + 1
+        if channels < 1 or self.first_channel + channels - 1 > LAST_CHANNEL:
+            raise ValueError(f"No loopback channels left for unit {index + 1}")
+
+    def bank_name(self, idx):
+        return f"{self.namespace}Bank {bank_label(idx)}"
+
+    def channel_of(self, idx):
+        return self.first_channel + idx % self.channels
+
+    def bank(self, idx):
+        """The bank at idx, loaded from the state backend on first use."""
+        bank = self.banks[idx]
+        if bank is None:
+            bank = self.banks[idx] = self.load(idx)
+        return bank
+
+    @property
+    def active(self):
+        """The bank the unit currently shows."""
+        return self.bank(self.bankstate)
+
+    def step_bank(self, step):
+        """Move step banks right (negative: left), wrapping around."""
+        self.bankstate = (self.bankstate + step) % len(self.banks)
+
+    def show_bank(self):
+        # The dial's shadow only sends what differs from the previous bank.
+        self.dial.show(self.bankstate)
+        self.active.update_lights()
+
+    def scene_banks(self, state):
+        """Every bank for a scene: loaded banks as they are, the others as stored, without loading them."""
+        return [b if b is not None else StoredBank(self.bank_name(idx), *state.load_state(self.bank_name(idx)))
+                for idx, b in enumerate(self.banks)]
@@ -1,34 +1,16 @@
 import mido
 import time
+import FlightRecorder
+from ChangeFeed import ChangeFeed
+import Log
+import MappingProfile
+import RawMidi
+from LedShadow import LedShadow
+from MappingProfile import ROUTE_TOGGLE
+from SoftTakeover import SoftTakeover
 from StateHandler import StateHandler
 
 
-# Notes
-notes = [
-    1, 2, 3, 4, 5, 6, 7, 8, 9, 10,
-    11, 12, 13, 14, 15, 16, 17, 18, 19, 20,
-    21, 22, 23, 24, 25, 26, 27]
-
-# Control Changes
-control_changes = [
-    16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
-    26, 27, 28, 29, 30, 31, 46, 47, 48, 49,
-    50, 51, 52, 53, 54, 55, 56, 57, 58, 59,
-    60, 61, 127]
-
-# Shifted Notes
-shifted_notes = [3, 6, 9, 12, 15, 18, 21, 24]
-
-# Notes after shift
-after_shift = [35, 38, 41, 44, 47, 50, 53, 56]
-
-# Notes with no light
-no_light = [25, 26, 27]
-
-# Add shifted notes after offset to the notes list
-notes.extend([note + 32 for note in shifted_notes])
-
-
 # def print_available_midi_connections():
 #     """
 #     Print out all available MIDI connections.
@@ -45,7 +27,7 @@ notes.extend([note + 32 for note in shifted_notes])
 class MidiHandler:
     """Class for handling MIDI messages."""
 
-    def __init__(self, cb1, cb2, name, mchannel):
+    def __init__(self, cb1, cb2, name, mchannel, state_handler=None, leds=None, raw_output=False, mapping=None):
         """
         Initialize MIDI handler.
 
@@ -53,48 +35,68 @@ class MidiHandler:
             name (str): Name of the input port.
             cb1 (function): Callback function for channel 1
             cb2 (function): Callback function for channel 2
+            state_handler (StateHandler): Persistence backend, shared between banks. Defaults to a private StateHandler.
+            leds (LedShadow): Shadow of the device LEDs, shared between banks. Defaults to a private one around cb2.
+            raw_output (bool): Hand preencoded byte triples instead of mido messages to cb1/cb2 for note_on.
+            mapping (MappingProfile.Mapping): Note/CC map to route with. Defaults to MappingProfile.current().
         """
         self.ID = name
         self.cb1 = cb1
         self.cb2 = cb2
         self.channel = mchannel
         self.note_27_state = False  # Attribute to track the state of note 27
-        self.last_output_time = {}  # Track last output time for each CC
-        self.sh = StateHandler()
+        self.sh = state_handler or StateHandler()
+        # note_on outputs: preencoded bytes (see RawMidi) or mido messages
+        self.encode_note_on = RawMidi.note_on if raw_output else RawMidi.note_on_message
+        self.leds = leds or LedShadow(cb2, encode=self.encode_note_on)
         self.toggle_states = self.sh.default_toggle_states
         self.last_cc_values = self.sh.default_cc
         self.toggle_states, self.last_cc_values = self.sh.load_state(self.ID)
+        # backends that write single changes in place (SessionStore); the others are given the whole bank
+        self._set_toggle = getattr(self.sh, "set_toggle", None)
+        self._set_cc = getattr(self.sh, "set_cc", None)
+        self.takeover = SoftTakeover(self.last_cc_values)
+        self.recorder = None  # FlightRecorder for routing decisions, set by the Masterator
+        self.unit_index = 0  # unit and position on it, for the recorder
+        self.bank_index = 0
+        self.changes = ChangeFeed()  # CCs/toggles changed since the GUI last pulled
+        self.macros = {}  # note -> Macros.Macro sent instead of the note, set by the Masterator
+        self.scheduler = None  # Macros.MacroScheduler that runs them
+        self.tables = None  # MappingProfile.RoutingTables, swapped whole by remap
+        self.remap(mapping or MappingProfile.current())
+        # Handlers indexed by message type and by RoutingTables.route code
+        self._by_type = {
+            'control_change': self.process_control_change_message,
+            'note_on': self._route_note_on,
+            'note_off': self._route_note_off,
+        }
+        self._note_on_routes = (self.process_note_message,
+                                lambda message: self.handle_bank_up(),
+                                lambda message: self.handle_bank_down(),
+                                self.handle_switch_button)
+        self._note_off_routes = (self.process_note_off_message,
+                                 lambda message: self.handle_bank_up(),
+                                 lambda message: self.handle_bank_down(),
+                                 self.handle_switch_button)
 
     def process_messages(self, message):
         """Process incoming MIDI messages."""
         try:
-            print(self.ID, "Processing MIDI messages. Press Ctrl+C to exit.")
-            # Print the received message for all message types
-            print("Received:", message)
-            if message.type == 'control_change':
-                self.process_control_change_message(message)
-            # Check if the received message is a special message
-            elif message.note == 25 and message.type in ['note_on', 'note_off']:
-                self.handle_bank_up()
-            elif message.note == 26 and message.type in ['note_on', 'note_off']:
-                self.handle_bank_down()
-            elif message.note == 27 and message.type in ['note_on', 'note_off']:
-                self.handle_switch_button(message)
-            # Process regular MIDI messages
-            elif message.type == 'note_on':
-                self.process_note_message(message)
-            elif message.type == 'note_off':
-                self.process_note_off_message(message)
-            else:
-                # Send all other message types to the output port
-                self.send_message(message)
+            Log.routing.debug("%s received: %s", self.ID, message)
+            self._by_type.get(message.type, self.send_message)(message)
 
         except KeyboardInterrupt:
-            print("Exiting...")
-        except Exception as e:
-            print(f"Error processing messages: {e}")
-        finally:
-            print("BYE")
+            Log.general.info("Exiting...")
+        except Exception:
+            Log.routing.exception("%s: error processing %s", self.ID, message)
+            if self.recorder:
+                self.recorder.dump_on_error()
+
+    def _route_note_on(self, message):
+        self._note_on_routes[self.tables.route[message.note]](message)
+
+    def _route_note_off(self, message):
+        self._note_off_routes[self.tables.route[message.note]](message)
 
     def process_note_off_message(self, message):
         """
@@ -104,13 +106,11 @@ class MidiHandler:
             message (mido.Message): The MIDI message.
         """
 
-        # Check if the note should be shifted and note 27 is on
-        if message.note in shifted_notes and self.note_27_state:
-            message.note = message.note + 32
-            self.send_note_off_message(message)
-        else:
-            # Send note-off messages to the output port
-            self.send_note_off_message(message)
+        # Move the note to its shifted twin while note 27 is held
+        if self.note_27_state:
+            message.note = self.tables.shift_target[message.note]
+        # Send note-off messages to the output port
+        self.send_note_off_message(message)
 
     def process_note_message(self, message):
         """
@@ -120,12 +120,10 @@ class MidiHandler:
             message (mido.Message): The MIDI message.
         """
         # Send note messages to the output port
-        if message.note not in [25, 26, 27]:
-            if message.note in shifted_notes and self.note_27_state:
-                message.note = message.note + 32
-                self.send_note_message(message)
-            else:
-                self.send_note_message(message)
+        if self.tables.route[message.note] == ROUTE_TOGGLE:
+            if self.note_27_state:
+                message.note = self.tables.shift_target[message.note]
+            self.send_note_message(message)
 
     def process_control_change_message(self, message):
         """
@@ -139,11 +137,11 @@ class MidiHandler:
 
     def handle_bank_up(self):
         """Placeholder for handling Bank Up functionality."""
-        print("Received special message: Bank Up")
+        Log.routing.debug("Received special message: Bank Up")
 
     def handle_bank_down(self):
         """Placeholder for handling Bank Down functionality."""
-        print("Received special message: Bank Down")
+        Log.routing.debug("Received special message: Bank Down")
 
     def handle_switch_button(self, message):
         """
@@ -152,115 +150,138 @@ class MidiHandler:
         Args:
             message (mido.Message): The MIDI message.
         """
-        print("Received special message: Switch Button")
 
         # Toggle the state of note 27 based on the message type
+        if self.recorder:
+            self.recorder.record(FlightRecorder.SHIFT, self.unit_index, self.bank_index, message.type == 'note_on')
         if message.type == 'note_on':
             self.note_27_state = True
-            print("Switch Button is on")
+            Log.routing.debug("%s: Switch Button is on", self.ID)
             self.update_lights()  # Update lights
         else:  # message.type == 'note_off'
             self.note_27_state = False
-            print("Switch Button is off")
+            Log.routing.debug("%s: Switch Button is off", self.ID)
             self.update_lights()
 
     def send_note_message(self, message):
-        """Send note messages to the output port."""
-        outbound = mido.Message('note_on', note=message.note, velocity=message.velocity, channel=self.channel)
-        print("Sent note:", outbound)
+        """Send note messages to the output port, or start the button's macro. The toggle state flips either way."""
+        macro = self.macros.get(message.note)
         self.toggle_note_state(message.note)
-        self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
-        self.cb1(outbound)
+        self.save_toggle(message.note)
+        if macro is None:
+            outbound = self.encode_note_on(self.channel, message.note, message.velocity)
+            Log.routing.debug("Sent note: %s", outbound)
+            self.cb1(outbound)
+        else:
+            Log.routing.debug("Macro: %s", macro.name)
+            self.scheduler.start(macro, self.cb1)
         self.update_lights()
 
     def send_note_off_message(self, message):
         """Send note-off messages to the output port."""
         outbound = mido.Message('note_off', note=message.note, velocity=message.velocity, channel=self.channel)
-        if message.note not in [25, 26, 27]:
-            self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
-            print("Sent note:", outbound)
+        if self.tables.route[message.note] == ROUTE_TOGGLE and message.note not in self.macros:
+            self.save_unchanged()
+            Log.routing.debug("Sent note: %s", outbound)
             self.cb1(outbound)
 
     def send_message(self, message):
         """Send other types of MIDI messages to the output port."""
-        self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
+        self.save_unchanged()
         self.cb1(message)
 
-    def within_10(self, ccn, cco):
-        """
-        Check if two numbers are within 10 integers of each other.
-
-        Args:
-            ccn (int): New CC
-            cco (int): Old CC
-
-        Returns:
-            bool: True if the numbers are within 10 integers of each other, False otherwise.
-        """
-        difference = abs(ccn - cco)
-        if difference <= 10:
-            print(f"{ccn} and {cco} are within 10 integers of each other.")
-            return True
-        else:
-            print(f"{ccn} and {cco} are not within 10 integers of each other.")
-            return False
-
     def send_control_change_message(self, message):
-        """Send control change MIDI messages to the output port."""
-        print("Sent control change:", message)
+        """Send control change MIDI messages to the output port, if soft takeover accepts the move."""
         cc = message.control
-        now = time.time()
-        last_time = self.last_output_time.get(cc, 0)
-        within_time = (now - last_time) <= 2
-        if self.within_10(message.value, self.last_cc_values[cc]) or within_time:
-            self.last_cc_values[cc] = message.value
-            self.last_output_time[cc] = now
-            self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
-            self.cb1(mido.Message('control_change', control=cc, value=message.value, channel=self.channel))
+        value = self.takeover.process(cc, message.value, time.monotonic())
+        if self.recorder:
+            self.recorder.record(FlightRecorder.TAKEOVER, self.unit_index, self.bank_index, cc, message.value,
+                                 value if value >= 0 else FlightRecorder.REJECTED)
+        if value >= 0:
+            self.last_cc_values[cc] = value
+            self.changes.mark_cc(cc)
+            self.save_cc(cc)
+            self.cb1(mido.Message('control_change', control=cc, value=value, channel=self.channel))
+            Log.routing.debug("Sent control change: %d=%d ch%d", cc, value, self.channel)
         else:
-            print("Not close enough to the Stored Value and not recently moved. Ignoring")
+            Log.hysteresis.debug("CC %d=%d has not caught up with the stored value. Ignoring", cc, message.value)
 
     def toggle_note_state(self, note_number):
         """Toggle the state of the note with the given note number."""
         if note_number in self.toggle_states:
             self.toggle_states[note_number] = not self.toggle_states[note_number]
-            state_message = "turned" if self.toggle_states[note_number] else "turned off"
-            print(f"Note {note_number} is now {state_message}.")
+            self.changes.mark_note(note_number)
+            Log.routing.debug("Note %d is now %s.", note_number, "on" if self.toggle_states[note_number] else "off")
             self.send_light_update(note_number)
         else:
             self.toggle_states[note_number] = True  # Default to True if note not found
-            print(f"Note {note_number} is now turned on.")
+            self.changes.mark_note(note_number)
+            Log.routing.debug("Note %d is now on.", note_number)
             self.send_light_update(note_number)
 
-    def update_lights(self):
-        """Update lights based on the toggle states."""
+    def save_toggle(self, note_number):
+        """Persist one toggle: in place where the backend can, else the whole bank."""
+        if self._set_toggle is None or not self._set_toggle(self.ID, note_number, self.toggle_states[note_number]):
+            self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
+
+    def save_cc(self, cc):
+        """Persist one CC value: in place where the backend can, else the whole bank."""
+        if self._set_cc is None or not self._set_cc(self.ID, cc, self.last_cc_values[cc]):
+            self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
+
+    def save_unchanged(self):
+        """Save the bank after a message that changed nothing; in-place backends already hold every change."""
+        if self._set_toggle is None:
+            self.sh.save_state(self.toggle_states, self.last_cc_values, self.ID)
+
+    def led_frame(self):
+        """Return {LED note: velocity} as update_lights would leave the panel."""
+        leds = self.tables.led_shifted if self.note_27_state else self.tables.led_base
+        frame = {}
         for note_number, state in self.toggle_states.items():
-            if state:
-                if note_number in after_shift and self.note_27_state:
-                    note_number -= 32
-                    self.cb2(mido.Message('note_on', note=int(note_number), velocity=127))
-                else:
-                    self.cb2(mido.Message('note_on', note=int(note_number), velocity=127))
-            else:
-                if note_number in after_shift and self.note_27_state:
-                    note_number -= 32
-                    self.cb2(mido.Message('note_on', note=int(note_number), velocity=0))
-                else:
-                    self.cb2(mido.Message('note_on', note=int(note_number), velocity=0))
+            frame[leds[note_number]] = 127 if state else 0
+        return frame
+
+    def swap_state(self, toggle_states, cc_values):
+        """
+        Replace the bank state in one step.
+
+        Args:
+            toggle_states (dict): New toggle states (taken over, not copied).
+            cc_values (dict): New CC values (taken over, not copied).
+
+        Returns:
+            tuple: The previous (toggle_states, cc_values).
+        """
+        old = self.toggle_states, self.last_cc_values
+        self.toggle_states, self.last_cc_values = toggle_states, cc_values
+        self.takeover.load(cc_values)
+        self.changes.mark_all()
+        return old
+
+    def remap(self, mapping):
+        """
+        Route with another mapping from the next message on.
+
+        Controls and toggles the mapping adds start from their defaults; stored
+        values of numbers it drops are kept, so mapping them back restores them.
+
+        Args:
+            mapping (MappingProfile.Mapping): The compiled mapping.
+        """
+        for note, state in mapping.default_toggle_states.items():
+            self.toggle_states.setdefault(note, state)
+        for cc, value in mapping.default_cc.items():
+            self.last_cc_values.setdefault(cc, value)  # 0, as the takeover engine already has it
+        self.tables = mapping.tables
+        self.changes.mark_all()
+
+    def update_lights(self):
+        """Update lights based on the toggle states. Only LEDs that differ from the panel are sent."""
+        self.leds.apply(self.led_frame())
 
     def send_light_update(self, note_number):
         """Send light updates based on the toggle states."""
         if note_number in self.toggle_states:
-            if self.toggle_states[note_number]:
-                if note_number in after_shift:
-                    note_number = note_number - 32
-                    self.cb2(mido.Message('note_on', note=note_number, velocity=127))
-                else:
-                    self.cb2(mido.Message('note_on', note=note_number, velocity=127))
-
-            elif not self.toggle_states[note_number]:
-                if note_number in after_shift:
-                    note_number = note_number - 32
-                    self.cb2(mido.Message('note_on', note=note_number, velocity=0))
-                else:
-                    self.cb2(mido.Message('note_on', note=note_number, velocity=0))
+            velocity = 127 if self.toggle_states[note_number] else 0
+            self.leds.set(self.tables.led_shifted[note_number], velocity)
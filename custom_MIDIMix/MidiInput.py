@@ -0,0 +1,84 @@
+import time
+
+import mido
+
+import Log
+
+RESYNC = 0.5  # seconds the backend timeline may trail the host clock before it is re-anchored
+
+
+class TimestampedInput:
+    """Callback-driven input: every message is handled on arrival, stamped with when it arrived.
+
+    On mido's rtmidi backend the rtmidi callback is installed directly, so the
+    per-message delta time that mido drops is kept. Arrival times follow the
+    backend's timeline (driver timestamps) anchored to time.perf_counter, which
+    takes the callback's own wakeup delay out of the stamp. Other backends get
+    a mido callback stamped with time.perf_counter on entry. The stamp is
+    stored in ``message.time``. Messages already queued when ``start`` is
+    called are handled first, in order.
+    """
+
+    def __init__(self, port, handler, lock, clock=time.perf_counter):
+        """
+        Initialize the input.
+
+        Args:
+            port: Open mido input port.
+            handler (function): Called with each mido message, message.time set to its arrival time.
+            lock: Lock the handler takes; held while the queued messages are drained so new ones wait.
+            clock (function): Host clock for the stamps.
+        """
+        self.port = port
+        self.handler = handler
+        self.lock = lock
+        self.clock = clock
+        self._last = None  # arrival time of the previous message
+        self.received = 0
+        self.pending = 0        # messages that were queued before start
+        self.invalid = 0
+        self.max_lag = 0.0      # longest delay between backend arrival and callback
+
+    def start(self):
+        rt = getattr(self.port, "_rt", None)
+        with self.lock:
+            if rt is not None and hasattr(rt, "set_callback"):
+                rt.set_callback(self._on_rtmidi)
+                for message in self.port.iter_pending():
+                    self.pending += 1
+                    self._dispatch(message, self.clock())
+            else:
+                # mido hands the queued messages to a new callback before live ones
+                self.port.callback = self._on_message
+                self.pending = self.received
+
+    def stats(self):
+        return {"received": self.received, "pending": self.pending, "invalid": self.invalid,
+                "max_lag_ms": self.max_lag * 1000}
+
+    def _on_rtmidi(self, event, data=None):
+        now = self.clock()
+        raw, delta = event
+        try:
+            message = mido.Message.from_bytes(raw)
+        except ValueError:
+            self.invalid += 1
+            return
+        arrival = now if self._last is None else min(now, self._last + delta)
+        if now - arrival > RESYNC:
+            arrival = now
+        elif now - arrival > self.max_lag:
+            self.max_lag = now - arrival
+        self._dispatch(message, arrival)
+
+    def _on_message(self, message):
+        self._dispatch(message, self.clock())
+
+    def _dispatch(self, message, arrival):
+        self._last = arrival
+        self.received += 1
+        message.time = arrival
+        try:
+            self.handler(message)
+        except Exception:
+            Log.routing.exception("Error processing %s", message)
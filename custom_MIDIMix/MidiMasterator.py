@@ -1,9 +1,32 @@
 # MidiMasterator.py
 import mido
+import Log
 from MidiHandler import MidiHandler as Bank
-import tkinter as tk
+from StateHandler import StateHandler
+from StateWriter import StateWriter
+from SessionStore import SessionStore
+from StateJournal import StateJournal
+from SceneLibrary import SceneLibrary
+from LedShadow import LedShadow
+from OutputWriter import OutputWriter
+from CcCoalescer import CcCoalescer
+from MidiInput import TimestampedInput
+from MidiDevice import MidiDevice, LAST_CHANNEL
+from MappingProfile import MappingWatcher, ROUTE_BANK_UP, ROUTE_BANK_DOWN
+import MappingProfile
+import BankLeds
+import Macros
+import RawMidi
+import Latency
+import FlightRecorder
+import SoftTakeover
 import threading
-from MasteratorGui import MasteratorGUI, BankSnapshot
+import time
+import argparse
+import functools
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from ChangeFeed import BankSnapshot
 
 def print_available_midi_connections():
     print("Available MIDI Input Ports:")
@@ -12,147 +35,475 @@ def print_available_midi_connections():
     for port in mido.get_output_names(): print(port)
 
 class MidiMasterator:
-    def __init__(self, input_port_name, output_port_name, output_port_name_2, root):
-        self.input_port_name = input_port_name
+    def __init__(self, input_port_name, output_port_name, output_port_name_2, root, state_debounce=0.5, state_backend="json",
+                 cc_window=0.0, cc_max_rate=None, output_mode="raw", input_mode="callback",
+                 flight_records=1 << 18, gui_fps=60, view=None, devices=None, banks=4, bank_leds="binary",
+                 state=None, writer=OutputWriter, coalescer=CcCoalescer,
+                 mapping=MappingProfile.DEFAULT_PATH, mapping_reload=0.0):
+        # note/CC map from the profile file (compiled, cached); everything created below routes with it
+        t0 = time.perf_counter()
+        self.mapping_path = mapping; self.mapping_reload = mapping_reload
+        self.mapping = MappingProfile.load(mapping)
+        MappingProfile.use(self.mapping)
+        self.mapping_watcher = None  # started by open_ports when mapping_reload is set
+        mapping_load = time.perf_counter() - t0
+        # one MIDImix unit per (input port, LED port) pair, all sharing the loopback output;
+        # each unit gets an equal share of the loopback channels, one per bank while they last
+        devices = devices or [(input_port_name, output_port_name_2)]
+        channels = min(banks, LAST_CHANNEL // len(devices))
+        self.devices = [MidiDevice(i, names[0], names[1], bank_count=banks, channels=channels)
+                        for i, names in enumerate(devices)]
+        if channels < banks:
+            Log.routing.warning("%d banks per unit, %d loopback channels each: banks %d apart share a channel",
+                                banks, channels, channels)
+        self.focus = self.devices[0]  # unit that was last played, shown by the GUI
         self.output_port_name = output_port_name
-        self.output_port_name_2 = output_port_name_2
-        self.input_port = None; self.output_port = None; self.output_port_2 = None
-        self.bank_A = self.bank_B = self.bank_C = self.bank_D = None
-        self.bankstate = 0  # 0=A .. 3=D
+        self.output_port = None
+        # "callback": handle each message on arrival, timestamped (MidiInput.py); "blocking": iterate the ports on threads
+        self.input_mode = input_mode
+        self.loop_out = None; self.led_out = None  # writer threads: loopback port, LED ports of all units
+        # optional last-value-wins CC decimation in front of the loopback writer (window in seconds)
+        self.cc_window = cc_window; self.cc_max_rate = cc_max_rate
+        self.cc_coalescer = None; self._to_loopback = None
+        # how outputs and CC timers run: threads by default, loop tasks under AsyncRuntime
+        self.writer = writer; self.coalescer = coalescer
+        # "json": one file per bank, written behind; "session": one mmap'd binary file, written in place;
+        # "journal": snapshot + append-only change journal that survives a crash mid-write
+        if state is not None:  # ready-made, e.g. AsyncRuntime's
+            self.state = state
+        elif state_backend == "session":
+            self.state = SessionStore()
+        elif state_backend == "journal":
+            self.state = StateJournal()
+        else:
+            self.state = StateWriter(StateHandler(), debounce=state_debounce)
+        self.scenes = SceneLibrary()
+        # "raw": preencoded byte triples straight to rtmidi for notes/LEDs; "mido": mido messages throughout
+        self.raw_output = output_mode == "raw"
+        self.encode_note_on = RawMidi.note_on if self.raw_output else RawMidi.note_on_message
+        # bank number on the bank button LEDs: "binary" 2-bit dial, or "blink" with pulses for higher banks
+        self.blinker = BankLeds.Blinker() if bank_leds != "binary" else None
+        for device in self.devices:  # one physical panel per unit, shared by its banks
+            device.leds = LedShadow(functools.partial(self.receive_from_bank_2, device=device), encode=self.encode_note_on)
+            device.dial = BankLeds.BankDial(device.leds, banks, bank_leds, self.blinker,
+                                            (self.mapping.bank_up, self.mapping.bank_down))
+            device.load = functools.partial(self._load_bank, device)
+        self.takeover_config = SoftTakeover.load_config()  # per-bank modes/thresholds/windows, Takeover.json
+        self.macro_config = Macros.load_config()  # per-bank button macros, Macros.json
+        self.macros = Macros.MacroScheduler(self._send_macro_step)  # its thread starts with the first timed step
+        self._lock = threading.RLock()  # serializes MIDI processing with scene recall
+        self.startup_times = {"mapping load": mapping_load}  # phase -> seconds, the rest filled by open_ports
+        self.latency = Latency.LatencyStats()
+        # .stamp: (arrival time, latency class) of the input message being routed, on the routing thread only;
+        # sends from other threads (Blinker pulses, timed macro steps) have none and are not measured
+        self._routing = threading.local()
+        self.recorder = FlightRecorder.FlightRecorder(flight_records)  # last N inputs, outputs and routing decisions
 
-        self.gui = MasteratorGUI(root)
-        self.gui.start_render_loop(fps=3)
+        # status view: the Tk GUI when a root is given (imported only then), any view object with the
+        # MasteratorGUI producer API (e.g. TerminalView), or None for headless (Replay.py, CI)
+        self.gui = view
+        self._gui_snaps = []  # per-bank snapshots of the shown unit, owned by the Tk thread, see pull_gui_changes
+        self._gui_active = -1
+        self._gui_device = None
+        if root is not None:
+            from MasteratorGui import MasteratorGUI
+            self.gui = MasteratorGUI(root)
+        if self.gui:
+            self.gui.start_render_loop(max_fps=gui_fps)
+        self.notify_view = self.gui.request_frame if self.gui else None  # after every routed message
+        self._readout_at = 0.0  # last latency readout for the GUI, refreshed with the frames
 
-    # MIDI outs from banks
+    # MIDI outs from banks: only enqueue, the writer threads do the port I/O and record the latency once sent
     def receive_from_bank_1(self, message):
-        print("To Output", message); self.output_port.send(message)
-    def receive_from_bank_2(self, message):
-        print("Lightswitch for:", getattr(message, "note", None)); self.output_port_2.send(message)
+        Log.routing.debug("To Output %s", message); self._to_loopback(message, stamp=getattr(self._routing, "stamp", None))
+        self.recorder.message(FlightRecorder.LOOPBACK, self.focus.index, self.focus.bankstate, message)
+    def _send_macro_step(self, message, slot):
+        # a timed macro step, on the scheduler thread: no input message to measure latency against
+        Log.routing.debug("Macro step to Output %s", message); self._to_loopback(message)
+        self.recorder.message(FlightRecorder.LOOPBACK, slot[0], slot[1], message)
+    def _send_recalled(self, message, unit, bank):
+        # a scene recall catching up a bank that need not have the focus: recorded for that unit and bank
+        Log.routing.debug("Scene to Output %s", message); self._to_loopback(message)
+        self.recorder.message(FlightRecorder.LOOPBACK, unit, bank, message)
+    def receive_from_bank_2(self, message, device):
+        Log.leds.debug("Lightswitch for: %s", message)
+        self.led_out.send(message, device.led_target, getattr(self._routing, "stamp", None))
+        self.recorder.message(FlightRecorder.LED, device.index, device.bankstate, message)
 
     def open_ports(self):
+        clock = time.perf_counter
         try:
-            self.input_port  = mido.open_input(self.input_port_name)
-            self.output_port = mido.open_output(self.output_port_name)
-            self.output_port_2 = mido.open_output(self.output_port_name_2)
-            self.bank_A = Bank(self.receive_from_bank_1, self.receive_from_bank_2, mchannel=1, name="Bank A")
-            self.bank_B = Bank(self.receive_from_bank_1, self.receive_from_bank_2, mchannel=2, name="Bank B")
-            self.bank_C = Bank(self.receive_from_bank_1, self.receive_from_bank_2, mchannel=3, name="Bank C")
-            self.bank_D = Bank(self.receive_from_bank_1, self.receive_from_bank_2, mchannel=4, name="Bank D")
-            for b in (self.bank_A, self.bank_B, self.bank_C, self.bank_D):
-                self._bind_bank_to_gui(b)
-            self.bank_A.update_lights()
-            self._publish_all_banks()
-            self._push_active_snapshot()
+            # The units' first banks load on worker threads while the ports open on this one;
+            # every other bank loads on its first visit, so startup does not grow with the bank count
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                t0 = clock()
+                loads = [(d, pool.submit(self._load_bank, d, d.bankstate)) for d in self.devices]
+                self.output_port = mido.open_output(self.output_port_name)
+                self.loop_out = self.writer(self.output_port, "loopback")
+                for d in self.devices:
+                    d.input_port = mido.open_input(d.input_port_name)
+                    d.led_port = mido.open_output(d.led_port_name)
+                    # every unit's LED port is served by the one LED writer
+                    if self.led_out is None:
+                        self.led_out = self.writer(d.led_port, "leds", yield_to=self.loop_out)
+                    else:
+                        d.led_target = self.led_out.add_port(d.led_port)
+                self.loop_out.latency = self.latency.hist[Latency.LOOPBACK]
+                self.led_out.latency = self.latency.hist[Latency.LED]
+                self._to_loopback = self.loop_out.send
+                if self.cc_window or self.cc_max_rate:
+                    self.cc_coalescer = self.coalescer(self.loop_out.send, window=self.cc_window, max_rate=self.cc_max_rate)
+                    self._to_loopback = self.cc_coalescer.submit
+                self.startup_times["port open"] = clock() - t0
+                t1 = clock()
+                for d, load in loads:
+                    d.banks[d.bankstate] = load.result()
+                self.startup_times["state load"] = clock() - t0
+                self.startup_times["state load wait"] = clock() - t1
+            t0 = clock()
+            for d in self.devices:
+                d.show_bank()
+            self.startup_times["first LED frame"] = clock() - t0
+            t0 = clock()
+            if self.gui:
+                self.gui.set_change_source(self.pull_gui_changes)
+                self.gui.render_now()
+            self.startup_times["first GUI frame"] = clock() - t0
+            if self.mapping_reload:
+                self.mapping_watcher = MappingWatcher(self.mapping_path, self.swap_mapping, self.mapping_reload)
         except OSError as e:
-            print(f"Error: {e}"); return False
+            Log.general.error("Error: %s", e); return False
         return True
 
+    def _load_bank(self, device, idx):
+        name = device.bank_name(idx)
+        bank = Bank(self.receive_from_bank_1, device.leds.send, mchannel=device.channel_of(idx), name=name,
+                    state_handler=self.state, leds=device.leds, raw_output=self.raw_output, mapping=self.mapping)
+        bank.takeover.configure_from(self.takeover_config.get(name, {}))
+        bank.recorder = self.recorder; bank.unit_index = device.index; bank.bank_index = idx
+        bank.macros = Macros.bank_macros(self.macro_config, name, bank.channel, self.encode_note_on, (device.index, idx))
+        bank.scheduler = self.macros
+        return bank
+
+    def swap_mapping(self, mapping):
+        """
+        Route with another compiled mapping from the next message on (MappingWatcher calls this on a reload).
+
+        The swap happens under the routing lock: a message is routed entirely
+        with the old or entirely with the new tables, and messages arriving
+        meanwhile wait for the lock instead of being dropped.
+        """
+        with self._lock:
+            self.mapping = mapping
+            MappingProfile.use(mapping)
+            for d in self.devices:
+                d.dial.notes = (mapping.bank_up, mapping.bank_down)
+                for b in d.banks:
+                    if b is not None: b.remap(mapping)
+                d.show_bank()
+        if self.notify_view: self.notify_view()
+
     def close_ports(self):
-        for p in (self.input_port, self.output_port, self.output_port_2):
+        if self.mapping_watcher:
+            self.mapping_watcher.close()
+        if self.gui:
+            Log.general.info("GUI frames: %s", self.gui.frame_stats())
+        for d in self.devices:
+            if d.midi_input:
+                Log.routing.info("Input %s: %s", d.input_port_name, d.midi_input.stats())
+        if self.blinker:
+            self.blinker.close()
+        self.macros.close()
+        if self.macros.started:
+            Log.routing.info("Macros: %s", self.macros.stats())
+        if self.cc_coalescer:
+            self.cc_coalescer.close()
+            Log.routing.info("CC coalescer: %s", self.cc_coalescer.stats())
+        for w in (self.loop_out, self.led_out):
+            if w:
+                w.close()
+                Log.routing.info("%s writer: %s", w.name, w.stats())
+        for p in [self.output_port] + [p for d in self.devices for p in (d.input_port, d.led_port)]:
             try:
                 if p: p.close()
             except: pass
+        self.state.close()
+        self.scenes.close()
+
+    def start_input(self):
+        """Start handling input of every unit: backend callbacks, or the blocking loops on daemon threads.
 
-    def process_midi_messages(self):
+        In callback mode the units add no thread of our own: each port's callback routes under the
+        one lock, so all units are handled in arrival order by the same code path.
+        """
+        for d in self.devices:
+            handler = functools.partial(self._handle_logged, device=d)
+            if self.input_mode == "callback":
+                d.midi_input = TimestampedInput(d.input_port, handler, self._lock)
+                d.midi_input.start()
+            else:
+                threading.Thread(target=self.process_midi_messages, args=(d,), daemon=True).start()
+
+    def handle_message(self, message, device=None):
+        """Route one input message of a unit (the first by default); message.time is its arrival time (time.perf_counter)."""
+        Log.routing.debug("Received: %s", message)
+        device = device or self.devices[0]
+        with self._lock:
+            self.focus = device
+            arrival = message.time or time.perf_counter()
+            self._routing.stamp = (arrival, Latency.classify(message, self.mapping.tables))
+            self.recorder.message(FlightRecorder.IN, device.index, device.bankstate, message, arrival)
+            try:
+                route = self.mapping.tables.route[message.note] if message.type in ('note_on','note_off') else 0
+                if route == ROUTE_BANK_UP or route == ROUTE_BANK_DOWN:
+                    self._handle_bank_nav(device, route, message.type)
+                else:
+                    device.active.process_messages(message)
+            finally:
+                self._routing.stamp = None
+        if self.notify_view: self.notify_view()
+
+    def process_midi_messages(self, device=None):
+        # messages queued before we got here are handled too, then block on the port
+        device = device or self.devices[0]
+        clock = time.perf_counter
+        for message in device.input_port.iter_pending():
+            message.time = clock()
+            self._handle_logged(message, device)
+        for message in device.input_port:
+            message.time = clock()
+            self._handle_logged(message, device)
+
+    def _handle_logged(self, message, device):
         try:
-            while True:
-                for message in self.input_port.iter_pending(): print("Pending:", message)
-                for message in self.input_port:
-                    print("Received:", message)
-                    if message.type in ('note_on','note_off') and message.note in (25,26):
-                        self._handle_bank_nav(message.note, message.type); continue
-                    (self.bank_A, self.bank_B, self.bank_C, self.bank_D)[self.bankstate].process_messages(message)
-        except Exception as e:
-            print(f"Error processing messages: {e}")
+            self.handle_message(message, device)
+        except Exception:
+            Log.routing.exception("Error processing %s", message)
+            self.recorder.dump_on_error()
 
     # --- bank nav + LEDs
-    def _handle_bank_nav(self, note, typ):
+    def _handle_bank_nav(self, device, route, typ):
         if typ != 'note_on': return
-        self.bankstate = (self.bankstate - 1) % 4 if note == 26 else (self.bankstate + 1) % 4
-        print(f"Bank state: {self.bankstate}")
-        self._apply_bank_leds_and_update()
-
-    def _apply_bank_leds_and_update(self):
-        if self.bankstate == 0:
-            self.output_port_2.send(mido.Message('note_on', note=25, velocity=0,   channel=0))
-            self.output_port_2.send(mido.Message('note_on', note=26, velocity=0,   channel=0))
-            self.bank_A.update_lights()
-        elif self.bankstate == 1:
-            self.output_port_2.send(mido.Message('note_on', note=25, velocity=0,   channel=0))
-            self.output_port_2.send(mido.Message('note_on', note=26, velocity=127, channel=0))
-            self.bank_B.update_lights()
-        elif self.bankstate == 2:
-            self.output_port_2.send(mido.Message('note_on', note=25, velocity=127, channel=0))
-            self.output_port_2.send(mido.Message('note_on', note=26, velocity=0,   channel=0))
-            self.bank_C.update_lights()
-        else:
-            self.output_port_2.send(mido.Message('note_on', note=25, velocity=127, channel=0))
-            self.output_port_2.send(mido.Message('note_on', note=26, velocity=127, channel=0))
-            self.bank_D.update_lights()
-        self._push_active_snapshot()
-
-    # --- GUI publishing
-    def _bind_bank_to_gui(self, bank_obj):
-        def wrap(method_name):
-            if not hasattr(bank_obj, method_name): return
-            orig = getattr(bank_obj, method_name)
-            def wrapped(*args, **kwargs):
-                r = orig(*args, **kwargs)
-                self._publish_bank(bank_obj)              # micro cache always fresh
-                if self._is_active_bank(bank_obj):        # detail if active
-                    self._push_active_snapshot()
-                return r
-            setattr(bank_obj, method_name, wrapped)
-        for m in ("update_lights", "send_control_change_message", "send_note_message"):
-            wrap(m)
-
-    def _publish_bank(self, bank_obj):
-        idx = (0 if bank_obj is self.bank_A else
-               1 if bank_obj is self.bank_B else
-               2 if bank_obj is self.bank_C else 3)
-        # normalize keys: JSON persisted as strings -> cast to int
-        ts = {int(k): v for k, v in bank_obj.toggle_states.items()}
-        cc = {int(k): v for k, v in bank_obj.last_cc_values.items()}
-        snap = BankSnapshot(
-            name=("Bank A","Bank B","Bank C","Bank D")[idx],
-            toggle_states=ts, cc_values=cc,
-            note27_on=getattr(bank_obj, "note_27_state", False),
-            active_bank=idx
-        )
-        self.gui.set_bank_snapshot(snap)
-
-    def _publish_all_banks(self):
-        for b in (self.bank_A, self.bank_B, self.bank_C, self.bank_D):
-            self._publish_bank(b)
-
-    def _is_active_bank(self, b):
-        return (self.bankstate == 0 and b is self.bank_A) or \
-               (self.bankstate == 1 and b is self.bank_B) or \
-               (self.bankstate == 2 and b is self.bank_C) or \
-               (self.bankstate == 3 and b is self.bank_D)
-
-    def _push_active_snapshot(self):
-        b, idx = ((self.bank_A,0),(self.bank_B,1),(self.bank_C,2),(self.bank_D,3))[self.bankstate]
-        ts = {int(k): v for k, v in b.toggle_states.items()}
-        cc = {int(k): v for k, v in b.last_cc_values.items()}
-        snap = BankSnapshot(
-            name=("Bank A","Bank B","Bank C","Bank D")[idx],
-            toggle_states=ts, cc_values=cc,
-            note27_on=getattr(b,"note_27_state",False),
-            active_bank=idx
-        )
-        self.gui.set_snapshot(snap)
+        device.step_bank(-1 if route == ROUTE_BANK_DOWN else 1)
+        Log.routing.info("%sBank state: %d", device.namespace, device.bankstate)
+        self.recorder.record(FlightRecorder.BANK, device.index, device.bankstate)
+        self.state.flush(wait=False)
+        device.show_bank()
+
+    def resync_leds(self):
+        """Resend every LED of every unit, e.g. after a MIDImix has been power-cycled."""
+        with self._lock:
+            for d in self.devices:
+                d.leds.invalidate()
+                d.show_bank()
+
+    # --- latency
+    def dump_latency(self):
+        """Log p50/p95/p99/max input-to-output latency per path and message class."""
+        Log.general.info("Latency (input to loopback/LED port send):\n%s", self.latency.report())
+
+    def dump_flight(self):
+        """Write the flight recorder to Flight-<date>-<time>.akfr (see FlightRecorder.py to read it)."""
+        filename = self.recorder.dump_now()
+        Log.general.info("Flight recorder dumped to %s", filename)
+        return filename
+
+    # --- scenes
+    def save_scene(self, name):
+        with self._lock:
+            self.scenes.save(name, [b for d in self.devices for b in d.scene_banks(self.state)])
+        Log.persistence.info("Scene saved: %s", name)
+
+    def recall_scene(self, name):
+        """Swap all banks to a stored scene, sending only the notes/CCs/LEDs that change."""
+        if name not in self.scenes:
+            Log.persistence.warning("No scene named %r", name); return False
+        stored = {bid: (t, c) for bid, t, c in self.scenes.get(name)}
+        with self._lock:
+            for d in self.devices:
+                for idx, b in enumerate(d.banks):
+                    bid = d.bank_name(idx)
+                    if bid not in stored: continue
+                    toggles, ccs = dict(stored[bid][0]), dict(stored[bid][1])
+                    # a bank not visited yet is diffed against its stored state and picks up the scene on first visit
+                    old_t, old_c = b.swap_state(toggles, ccs) if b else self.state.load_state(bid)
+                    channel = d.channel_of(idx)
+                    for note, on in toggles.items():
+                        if old_t.get(note, False) != on:   # DAW toggles on every press
+                            self._send_recalled(self.encode_note_on(channel, note, 127), d.index, idx)
+                    for cc, value in ccs.items():
+                        if old_c.get(cc) != value:
+                            self._send_recalled(mido.Message('control_change', control=cc, value=value, channel=channel), d.index, idx)
+                    self.state.save_state(toggles, ccs, bid)
+                d.active.update_lights()
+        if self.notify_view: self.notify_view()
+        return True
+
+    # --- GUI publishing: the Tk thread pulls the banks' change feeds once per frame
+    def pull_gui_changes(self):
+        """Fold what changed in each bank of the focused unit since the last frame into the GUI snapshots (Tk thread)."""
+        if self.gui.mapping is not self.mapping:  # reloaded: controls move to their new numbers
+            self.gui.set_mapping(self.mapping)
+        device = self.focus
+        refocus = device is not self._gui_device  # another unit was played: show all of its banks
+        if refocus:
+            self._gui_device = device
+            self._gui_snaps = [None] * len(device.banks)
+            self.gui.set_bank_count(len(device.banks))
+        for idx, b in enumerate(device.banks):
+            if b is None: continue  # not visited yet
+            everything, ccs, notes = b.changes.take()
+            snap = self._gui_snaps[idx]
+            if snap is None or everything or refocus:
+                snap = self._gui_snaps[idx] = BankSnapshot(
+                    name=b.ID, toggle_states=dict(b.toggle_states), cc_values=dict(b.last_cc_values),
+                    note27_on=b.note_27_state, active_bank=idx)
+            elif ccs or notes or snap.note27_on != b.note_27_state:
+                cc_values, toggle_states = b.last_cc_values, b.toggle_states
+                for cc in ccs: snap.cc_values[cc] = cc_values[cc]
+                for note in notes: snap.toggle_states[note] = toggle_states[note]
+                snap.note27_on = b.note_27_state
+            else:
+                continue
+            self.gui.set_bank_snapshot(snap)
+            if idx == device.bankstate: self.gui.set_snapshot(snap)
+        if self._gui_active != device.bankstate or refocus:
+            self._gui_active = device.bankstate
+            self.gui.set_snapshot(self._gui_snaps[device.bankstate])
+        now = time.monotonic()
+        if now - self._readout_at >= 1.0:  # only while frames run, i.e. while something happens
+            self._readout_at = now
+            self.gui.set_status(self.latency.readout())
 
 # ---- entrypoint
 if __name__ == "__main__":
-    print_available_midi_connections()
+    parser = argparse.ArgumentParser(description="MIDI Masterator for the Akai MIDImix")
+    parser.add_argument("--list-ports", action="store_true", help="print the available MIDI ports first")
+    parser.add_argument("--bench-startup", action="store_true",
+                        help="start up, report the time spent in each phase and exit")
+    parser.add_argument("--device", nargs=2, action="append", metavar=("INPUT", "LEDS"),
+                        help="a MIDImix unit by its input and LED port names; repeat for more units. The units share "
+                             "the loopback channels (3 units of 4 banks: channels 2-5, 6-9, 10-13)")
+    parser.add_argument("--banks", type=int, default=4, metavar="N",
+                        help="banks per unit (default 4); banks load on first visit")
+    parser.add_argument("--bank-leds", default="binary", choices=sorted(BankLeds.ENCODINGS),
+                        help="bank number on the bank button LEDs: binary 2-bit dial (repeats every 4 banks) "
+                             "or blink (off/on/pulses per LED, covers any bank count)")
+    parser.add_argument("--mapping", default=MappingProfile.DEFAULT_PATH, metavar="FILE",
+                        help="note/CC mapping profile (default: Mapping.json next to this script)")
+    parser.add_argument("--mapping-reload", type=float, default=1.0, metavar="SECONDS",
+                        help="check the mapping profile for changes this often and swap a changed one in; 0 turns it off")
+    parser.add_argument("--cc-window", type=float, default=0.0, metavar="MS",
+                        help="coalesce loopback CCs: at most one message per control per MS milliseconds (e.g. 1-5)")
+    parser.add_argument("--cc-max-rate", type=float, default=None, metavar="HZ",
+                        help="coalesce loopback CCs: at most HZ messages per second per control")
+    parser.add_argument("--output-mode", default="raw", choices=["raw", "mido"],
+                        help="raw: preencoded note/LED bytes straight to rtmidi (default); mido: mido messages")
+    parser.add_argument("--input-mode", default="callback", choices=["callback", "blocking"],
+                        help="callback: handle messages on arrival with backend timestamps (default); blocking: port iteration thread")
+    parser.add_argument("--runtime", default="threads", choices=["threads", "async"],
+                        help="threads: writer and timer threads (default); async: routing, outputs, persistence and "
+                             "view updates as tasks on one asyncio loop (AsyncRuntime.py)")
+    parser.add_argument("--ui", default="tk", choices=["tk", "tui", "none"],
+                        help="tk: GUI window (default); tui: status view in this terminal; none: headless")
+    parser.add_argument("--gui-fps", type=int, default=60, metavar="FPS",
+                        help="highest GUI frame rate; frames are only drawn after a change (default 60)")
+    parser.add_argument("--latency-report", action="store_true",
+                        help="print input-to-output latency percentiles per message class on exit (F11 logs them live)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--log", default=",".join(Log.CATEGORIES), metavar="CATEGORIES",
+                        help="comma separated categories to log: " + ", ".join(Log.CATEGORIES))
+    args = parser.parse_args()
+    # the terminal view owns the terminal, so its log goes to a file
+    log_stream = open("Masterator.log", "a") if args.ui == "tui" else None
+    Log.start(args.log_level, categories=args.log.split(","), stream=log_stream)
+
     input_port_name   = "MIDI Mix 14"
     output_port_name  = "01. Internal MIDI 3"
     output_port_name_2 = "MIDI Mix 0"
+    state_backend = "json"  # or "session" (SessionStore.py) / "journal" (StateJournal.py)
+
+    t_start = time.perf_counter()
+    if args.list_ports:
+        print_available_midi_connections()
+    elif args.bench_startup:
+        mido.get_input_names(); mido.get_output_names()
+    t_enum = time.perf_counter() - t_start
 
-    root = tk.Tk()
-    mm = MidiMasterator(input_port_name, output_port_name, output_port_name_2, root)
-    if mm.open_ports():
-        threading.Thread(target=mm.process_midi_messages, daemon=True).start()
-        root.mainloop()
-    mm.close_ports()
+    root = view = None
+    if args.ui == "tk":
+        import tkinter as tk
+        root = tk.Tk()
+    elif args.ui == "tui":
+        from TerminalView import TerminalView
+        view = TerminalView()
+    runtime = None
+    create = MidiMasterator
+    if args.runtime == "async":
+        from AsyncRuntime import AsyncRuntime
+        runtime = AsyncRuntime()
+        create = runtime.masterator
+    mm = create(input_port_name, output_port_name, output_port_name_2, root, state_backend=state_backend,
+                cc_window=args.cc_window / 1000.0, cc_max_rate=args.cc_max_rate,
+                output_mode=args.output_mode, input_mode=args.input_mode,
+                gui_fps=args.gui_fps if args.ui == "tk" else min(args.gui_fps, 30), view=view,
+                devices=args.device, banks=args.banks, bank_leds=args.bank_leds,
+                mapping=args.mapping, mapping_reload=args.mapping_reload)
+    if runtime: runtime.start()
+    # Tk key bindings run on the loop under the async runtime, directly otherwise
+    call = runtime.call if runtime else (lambda fn, *a: fn(*a))
+    if args.bench_startup:
+        ok = mm.open_ports()
+        total = time.perf_counter() - t_start
+        print(f"{'port enumeration':<18} {t_enum*1000:8.2f} ms")
+        for phase in ("mapping load", "port open", "state load", "first LED frame", "first GUI frame"):
+            if phase in mm.startup_times:
+                print(f"{phase:<18} {mm.startup_times[phase]*1000:8.2f} ms")
+        if "state load wait" in mm.startup_times:
+            print(f"  (state load overlaps port open; waited {mm.startup_times['state load wait']*1000:.2f} ms after the ports were up)")
+        print(f"{'total':<18} {total*1000:8.2f} ms{'' if ok else '  (port open failed)'}")
+        mm.close_ports()
+        if runtime: runtime.stop()
+        if root: root.destroy()
+    else:
+        if mm.open_ports():
+            mm.recorder.install_crash_dump(root=root)
+            (runtime or mm).start_input()
+            if root:
+                # F1..F8 recall "Scene 1".."Scene 8", Shift+F1..F8 store them
+                for n in range(1, 9):
+                    root.bind(f"<F{n}>", lambda e, n=n: call(mm.recall_scene, f"Scene {n}"))
+                    root.bind(f"<Shift-F{n}>", lambda e, n=n: call(mm.save_scene, f"Scene {n}"))
+                root.bind("<F12>", lambda e: call(mm.resync_leds))
+                root.bind("<F11>", lambda e: call(mm.dump_latency))
+                root.bind("<F10>", lambda e: call(mm.dump_flight))
+                root.mainloop()
+            else:
+                # headless / terminal: run until Ctrl+C (or q); commands from keys in the terminal view,
+                # SIGUSR1 (LED resync) and SIGUSR2 (flight recorder dump) in both
+                stop = threading.Event()
+                if view:
+                    for n in range(1, 9):
+                        view.bind(str(n), lambda n=n: call(mm.recall_scene, f"Scene {n}"),
+                                  "1-8/s1-s8 recall/store scene" if n == 1 else None)
+                        view.bind(f"s{n}", lambda n=n: call(mm.save_scene, f"Scene {n}"))
+                    view.bind("r", lambda: call(mm.resync_leds), "resync LEDs")
+                    view.bind("l", lambda: call(mm.dump_latency), "log latency")
+                    view.bind("f", lambda: call(mm.dump_flight), "dump flight recorder")
+                    view.bind("q", stop.set, "quit")
+                if hasattr(signal, "SIGUSR1"):
+                    signal.signal(signal.SIGUSR1, lambda *a: call(mm.resync_leds))
+                    signal.signal(signal.SIGUSR2, lambda *a: call(mm.dump_flight))
+                try:
+                    if view: view.run(stop)
+                    else:
+                        while not stop.wait(0.5): pass
+                except KeyboardInterrupt:
+                    stop.set()
+        mm.close_ports()
+        if runtime:
+            Log.general.info("Async runtime: %s", runtime.stats())
+            runtime.stop()
+        if args.latency_report:
+            print(mm.latency.report())
+    Log.stop()
@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+
+import Log
+import RawMidi
+
+_STOP = object()
+
+
+class OutputWriter:
+    """Bounded queue plus a thread that owns every send to its output port(s).
+
+    The input thread only enqueues, so a slow USB write or a stalled loopback
+    driver no longer delays the next incoming message. A writer created with
+    ``yield_to`` holds back while that writer still has messages queued, which
+    gives the loopback port priority over the LEDs. Further ports added with
+    ``add_port`` share the thread, e.g. the LED ports of several units.
+    Messages queued with an arrival stamp have their input-to-send latency
+    recorded in ``latency`` once they are out of ``port.send``.
+    """
+
+    def __init__(self, port, name, maxsize=1024, yield_to=None, max_yield=0.005):
+        """
+        Start the writer thread.
+
+        Args:
+            port: Open mido output port (target 0).
+            name (str): Name used for the thread and in the stats.
+            maxsize (int): Queue bound; a full queue blocks the sender.
+            yield_to (OutputWriter): Higher priority writer to let drain first.
+            max_yield (float): Longest a single message waits on yield_to, in seconds.
+        """
+        self.port = port
+        self.name = name
+        self._targets = [(port.send, RawMidi.raw_sender(port))]  # per port: mido send, raw send
+        self.yield_to = yield_to
+        self.max_yield = max_yield
+        self._queue = queue.Queue(maxsize)
+        self._idle = threading.Event()
+        self._idle.set()
+        self.enqueued = 0
+        self.sent = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0  # time senders spent waiting on a full queue
+        self.send_time = 0.0     # time spent inside port.send
+        self.yield_time = 0.0    # time spent letting yield_to drain
+        self.latency = None      # Histograms per latency class (Latency.LatencyStats.hist[path]), set by the owner
+        self._thread = threading.Thread(target=self._run, name=f"OutputWriter-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def add_port(self, port):
+        """Serve another output port from this writer; returns its target number for send."""
+        self._targets.append((port.send, RawMidi.raw_sender(port)))
+        return len(self._targets) - 1
+
+    def send(self, message, target=0, stamp=None):
+        """
+        Queue a mido message or raw byte tuple for a port. Only blocks if the queue is full.
+
+        Args:
+            message: mido message or raw byte tuple.
+            target (int): Port number, 0 or as returned by add_port.
+            stamp (tuple): (arrival time, latency class) of the input that caused it, or None.
+        """
+        self._idle.clear()
+        item = (target, message, stamp)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(item)
+            self.blocked_time += time.perf_counter() - start
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def wait_idle(self, timeout=None):
+        """Wait until everything queued so far has been sent."""
+        return self._idle.wait(timeout)
+
+    def stats(self):
+        return {"depth": self.depth, "max_depth": self.max_depth, "enqueued": self.enqueued,
+                "sent": self.sent, "errors": self.errors, "blocked_ms": self.blocked_time * 1000,
+                "send_ms": self.send_time * 1000, "yield_ms": self.yield_time * 1000}
+
+    def close(self, timeout=1.0):
+        """Send what is still queued (up to timeout) and stop the thread."""
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _run(self):
+        clock = time.perf_counter
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._idle.set()
+                return
+            if self.yield_to is not None and self.yield_to.depth:
+                start = clock()
+                self.yield_to.wait_idle(self.max_yield)
+                self.yield_time += clock() - start
+            target, message, stamp = item
+            start = clock()
+            try:
+                if type(message) is tuple:
+                    self._targets[target][1](message)
+                else:
+                    self._targets[target][0](message)
+                self.sent += 1
+            except Exception:
+                self.errors += 1
+                Log.routing.exception("%s: send failed for %s", self.name, message)
+            end = clock()
+            self.send_time += end - start
+            if stamp is not None and self.latency is not None:
+                self.latency[stamp[1]].record(end - stamp[0])
+            if self._queue.empty():
+                self._idle.set()
@@ -0,0 +1,39 @@
+"""Preencoded note messages and a raw-byte send path.
+
+Every LED and toggle output is a note_on with velocity 0 or 127 on one of 16
+channels, so all of them are encoded once at import as byte triples. In raw
+mode those triples go straight to python-rtmidi's ``send_message``, skipping
+mido's message construction, validation and re-encoding. Ports without an
+rtmidi backend get the bytes decoded back into a mido message.
+"""
+import mido
+
+# NOTE_ON[channel][note][on] -> (status, note, velocity), velocity 127 if on else 0
+NOTE_ON = tuple(
+    tuple(((0x90 | channel, note, 0), (0x90 | channel, note, 127)) for note in range(128))
+    for channel in range(16))
+
+
+def note_on(channel, note, velocity):
+    """Raw note_on bytes, from the preencoded table when the velocity is 0 or 127."""
+    if velocity == 127 or velocity == 0:
+        return NOTE_ON[channel][note][velocity == 127]
+    return (0x90 | channel, note, velocity)
+
+
+def note_on_message(channel, note, velocity):
+    """The same note_on as a mido message, for the mido output mode."""
+    return mido.Message('note_on', channel=channel, note=note, velocity=velocity)
+
+
+def raw_sender(port):
+    """
+    Return a function that writes a byte sequence to ``port``.
+
+    Uses the rtmidi MidiOut behind a mido rtmidi port directly; other backends
+    fall back to decoding the bytes into a mido message and calling port.send.
+    """
+    rt = getattr(port, "_rt", None)
+    if rt is not None and hasattr(rt, "send_message"):
+        return rt.send_message
+    return lambda data: port.send(mido.Message.from_bytes(data))
@@ -0,0 +1,410 @@
+"""Hardware-free replay harness: runs MidiMasterator headless against in-memory ports.
+
+    python Replay.py [--scenario set|faders|mash|shift|banks] [--events N] [--speed X]
+    python Replay.py --file recording.mid [--speed X]
+    python Replay.py --devices 3 --speed 1          (one gesture stream per MIDImix unit)
+    python Replay.py --mapping MyMapping.json       (gestures and routing follow another profile)
+
+--speed 1 replays in real time, 0 (default) as fast as possible. The run
+happens in a temporary directory, so no state files are touched.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+
+import mido
+
+import Log
+import MappingProfile
+from MidiMasterator import MidiMasterator
+
+
+class FakeMidiOut:
+    """Stands in for rtmidi.MidiOut: counts what reaches the port."""
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.by_type = {}  # status nibble -> count
+        self.messages = [] if record else None
+
+    def send_message(self, data):
+        self.count += 1
+        kind = data[0] & 0xF0
+        self.by_type[kind] = self.by_type.get(kind, 0) + 1
+        if self.messages is not None:
+            self.messages.append(tuple(data))
+
+
+class FakeOutput:
+    """In-memory output port that sends like mido's rtmidi backend (bytes to _rt.send_message)."""
+
+    def __init__(self, name, record=False):
+        self.name = name
+        self._rt = FakeMidiOut(record)
+        self.closed = False
+
+    def send(self, message):
+        self._rt.send_message(message.bytes())
+
+    def close(self):
+        self.closed = True
+
+
+class FakeInput:
+    """In-memory input port; supports both callback and blocking iteration like a mido port."""
+
+    def __init__(self, name):
+        self.name = name
+        self._queue = queue.Queue()
+        self._callback = None
+        self.closed = False
+
+    @property
+    def callback(self):
+        return self._callback
+
+    @callback.setter
+    def callback(self, func):
+        if func:
+            for message in self.iter_pending():
+                func(message)
+        self._callback = func
+
+    def inject(self, message):
+        """Deliver a message as if it had just arrived from the device."""
+        if self._callback:
+            self._callback(message)
+        else:
+            self._queue.put(message)
+
+    def iter_pending(self):
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._queue.task_done()
+            yield message
+
+    def __iter__(self):
+        while not self.closed:
+            message = self._queue.get()
+            if message is None:
+                return
+            yield message
+            self._queue.task_done()  # the consumer asked for the next one, so this one is processed
+
+    def wait_processed(self):
+        self._queue.join()
+
+    def close(self):
+        self.closed = True
+        self._queue.put(None)
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Run in a temporary working directory, so state, scene and journal files do not touch the real ones."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(cwd)
+
+
+def for_duration(events, seconds):
+    """The leading events that fit in the given real-time duration."""
+    total = 0.0
+    for i, (delay, _) in enumerate(events):
+        total += delay
+        if total > seconds:
+            return events[:i]
+    return events
+
+
+@contextlib.contextmanager
+def fake_ports(record=False):
+    """
+    Swap mido.open_input/open_output for in-memory ports.
+
+    Yields:
+        dict: Port name -> FakeInput/FakeOutput, filled as ports are opened.
+    """
+    ports = {}
+    saved = mido.open_input, mido.open_output
+
+    def open_input(name=None, **kwargs):
+        ports[name] = FakeInput(name)
+        return ports[name]
+
+    def open_output(name=None, **kwargs):
+        ports[name] = FakeOutput(name, record)
+        return ports[name]
+
+    mido.open_input, mido.open_output = open_input, open_output
+    try:
+        yield ports
+    finally:
+        mido.open_input, mido.open_output = saved
+
+
+# ---- gesture streams: lists of (seconds since the previous event, message),
+# on the controls of a mapping profile (MappingProfile.current() by default)
+
+def fader_sweeps(count, rng, step=0.005, mapping=None):
+    """Faders and knobs swept end to end, one CC message per step."""
+    mapping = mapping or MappingProfile.current()
+    controls = [cc for row in ("faders", "knob_row_1", "knob_row_2", "knob_row_3") for cc in mapping.cc_map[row]]
+    events = []
+    while len(events) < count:
+        cc = rng.choice(controls)
+        start, end = (0, 127) if rng.random() < 0.5 else (127, 0)
+        stride = rng.choice((1, 2, 3))
+        for value in range(start, end + (1 if end > start else -1), stride if end > start else -stride):
+            events.append((step, mido.Message('control_change', control=cc, value=value)))
+    return events[:count]
+
+
+def button_mash(count, rng, interval=0.03, mapping=None):
+    """Fast press/release on random mute and rec-arm buttons."""
+    mapping = mapping or MappingProfile.current()
+    buttons = mapping.notes["mute"] + mapping.notes["recarm"]
+    events = []
+    while len(events) < count:
+        note = rng.choice(buttons)
+        events.append((interval, mido.Message('note_on', note=note, velocity=127)))
+        events.append((0.04, mido.Message('note_off', note=note, velocity=0)))
+    return events[:count]
+
+
+def shift_holds(count, rng, mapping=None):
+    """Hold shift, press a few of the buttons it shifts (rec-arm by default), release."""
+    mapping = mapping or MappingProfile.current()
+    shift = mapping.shift_note
+    events = []
+    while len(events) < count:
+        events.append((0.3, mido.Message('note_on', note=shift, velocity=127)))
+        for note in rng.sample(mapping.shifted, min(len(mapping.shifted), rng.randint(1, 3))):
+            events.append((0.08, mido.Message('note_on', note=note, velocity=127)))
+            events.append((0.05, mido.Message('note_off', note=note, velocity=0)))
+        events.append((0.1, mido.Message('note_off', note=shift, velocity=0)))
+    return events[:count]
+
+
+def bank_flips(count, rng, mapping=None):
+    """Bank left/right presses, mostly stepping back and forth."""
+    mapping = mapping or MappingProfile.current()
+    events = []
+    while len(events) < count:
+        note = mapping.bank_up if rng.random() < 0.6 else mapping.bank_down
+        events.append((0.25, mido.Message('note_on', note=note, velocity=127)))
+        events.append((0.06, mido.Message('note_off', note=note, velocity=0)))
+    return events[:count]
+
+
+def busy_set(count, rng, mapping=None):
+    """A mix of all gestures in phrases, like a busy set."""
+    mapping = mapping or MappingProfile.current()
+    kinds = [(fader_sweeps, 64), (fader_sweeps, 128), (button_mash, 12), (shift_holds, 8), (bank_flips, 2)]
+    events = []
+    while len(events) < count:
+        make, size = rng.choice(kinds)
+        events.extend(make(size, rng, mapping=mapping))
+    return events[:count]
+
+
+SCENARIOS = {"set": busy_set, "faders": fader_sweeps, "mash": button_mash, "shift": shift_holds, "banks": bank_flips}
+
+
+def merge(streams):
+    """
+    Interleave the gesture streams of several units by time.
+
+    Returns:
+        list: (seconds since the previous event, message, unit index) triples.
+    """
+    timed = []
+    for unit, events in enumerate(streams):
+        at = 0.0
+        for delay, message in events:
+            at += delay
+            timed.append((at, unit, message))
+    timed.sort(key=lambda e: (e[0], e[1]))
+    merged, last = [], 0.0
+    for at, unit, message in timed:
+        merged.append((at - last, message, unit))
+        last = at
+    return merged
+
+
+def port_names(unit):
+    """Input and LED port names of a replayed unit."""
+    return ("replay in", "replay leds") if unit == 0 else (f"replay in {unit + 1}", f"replay leds {unit + 1}")
+
+
+def read_midi_file(filename):
+    """Events of a recorded .mid file (e.g. a flight recorder export), meta messages skipped."""
+    events = []
+    pending = 0.0
+    for message in mido.MidiFile(filename):
+        pending += message.time
+        if not message.is_meta:
+            events.append((pending, message.copy(time=0)))
+            pending = 0.0
+    return events
+
+
+def replay(events, speed=0.0, record=False, devices=1, runtime="threads", **masterator_kwargs):
+    """
+    Run a headless MidiMasterator against fake ports and feed it events.
+
+    Args:
+        events (list): (delay seconds, mido message) pairs, or (delay, message, unit index) triples (see merge).
+        speed (float): 1.0 real time, 2.0 twice as fast, 0 as fast as possible.
+        record (bool): Keep every output message on the fake ports.
+        devices (int): MIDImix units to drive, each with its own input and LED port.
+        runtime (str): "threads", or "async" to run the Masterator on an AsyncRuntime loop.
+        **masterator_kwargs: Passed to MidiMasterator (state_backend, output_mode, input_mode, ...).
+
+    Returns:
+        dict: Throughput, latency summary, output counts, writer and state stats.
+    """
+    with fake_ports(record) as ports:
+        names = [port_names(unit) for unit in range(devices)]
+        rt = None
+        if runtime == "async":
+            from AsyncRuntime import AsyncRuntime
+            # as fast as possible the whole event list is one backlog: route all of it, shed nothing
+            rt = AsyncRuntime(inbox_limit=256 if speed else None)
+            mm = rt.masterator(None, "replay loopback", None, None, devices=names, **masterator_kwargs)
+            rt.start()
+        else:
+            mm = MidiMasterator(None, "replay loopback", None, None, devices=names, **masterator_kwargs)
+        if not mm.open_ports():
+            raise RuntimeError("could not open the fake ports")
+        mm.loop_out.wait_idle(1.0); mm.led_out.wait_idle(1.0)
+        led_ports = [ports[led]._rt for _, led in names]
+        startup_leds = sum(leds.count for leds in led_ports)
+        mm.latency.reset()
+        inputs = [ports[name] for name, _ in names]
+        (rt or mm).start_input()
+        threads = threading.active_count()
+        clock = time.perf_counter
+        start = due = clock()
+        for event in events:
+            if speed:
+                due += event[0] / speed
+                wait = due - clock()
+                if wait > 0:
+                    time.sleep(wait)
+            inputs[event[2] if len(event) > 2 else 0].inject(event[1].copy())
+        if rt:
+            rt.wait_idle(5.0)
+        elif mm.input_mode != "callback":
+            for port in inputs:
+                port.wait_processed()
+        routed = clock() - start
+        mm.macros.wait_idle(5.0)  # macros still running send their last steps first
+        mm.loop_out.wait_idle(5.0); mm.led_out.wait_idle(5.0)
+        drained = clock() - start
+        writers = {w.name: w.stats() for w in (mm.loop_out, mm.led_out)}
+        reloads = mm.mapping_watcher.reloads if mm.mapping_watcher else 0
+        mm.close_ports()
+        if rt:
+            rt.stop()
+        loop, leds = ports["replay loopback"]._rt, led_ports[0]
+        state = mm.state
+        return {
+            "events": len(events),
+            "devices": devices,
+            "threads": threads,
+            "routed_s": routed,
+            "drained_s": drained,
+            "events_per_s": len(events) / routed if routed else 0.0,
+            "latency_us": mm.latency.summary(),
+            "latency_report": mm.latency.report(),
+            "outputs": {"loopback": loop.count, "loopback_notes": loop.by_type.get(0x90, 0),
+                        "loopback_ccs": loop.by_type.get(0xB0, 0),
+                        "leds": sum(leds.count for leds in led_ports) - startup_leds,
+                        "leds_at_startup": startup_leds},
+            "writers": writers,
+            "coalescer": mm.cc_coalescer.stats() if mm.cc_coalescer else None,
+            "runtime": rt.stats() if rt else None,
+            "mapping_reloads": reloads,
+            "macros": mm.macros.stats() if mm.macros.started else None,
+            "state": {k: getattr(state, k) for k in ("save_requests", "writes", "writes_saved", "compactions")
+                      if hasattr(state, k)},
+            "recorded": {"loopback": loop.messages, "leds": leds.messages,
+                         "leds_by_unit": [l.messages for l in led_ports]} if record else None,
+        }
+
+
+def print_report(result):
+    if result["devices"] > 1:
+        print(f"devices       {result['devices']:>10}  ({result['threads']} threads while routing)")
+    print(f"events        {result['events']:>10}  routed in {result['routed_s'] * 1000:.1f} ms "
+          f"({result['events_per_s']:,.0f} events/s), drained in {result['drained_s'] * 1000:.1f} ms")
+    out = result["outputs"]
+    print(f"loopback out  {out['loopback']:>10}  ({out['loopback_notes']} notes, {out['loopback_ccs']} CCs)")
+    print(f"LED out       {out['leds']:>10}  (+{out['leds_at_startup']} at startup)")
+    for name, w in result["writers"].items():
+        print(f"writer {name:<7}   max depth {w['max_depth']}, send {w['send_ms']:.1f} ms, "
+              f"blocked {w['blocked_ms']:.1f} ms, yielded {w['yield_ms']:.1f} ms")
+    if result["coalescer"]:
+        print(f"CC coalescer  {result['coalescer']}")
+    if result["macros"]:
+        print(f"macros        {result['macros']}")
+    if result["runtime"]:
+        print(f"async runtime {result['runtime']}")
+    print(f"state         {', '.join(f'{k} {v}' for k, v in result['state'].items()) or 'no counters'}")
+    print(result["latency_report"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="set", choices=sorted(SCENARIOS))
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--file", help="replay a recorded .mid file instead of a generated scenario")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=1, help="MIDImix units, each playing its own scenario stream")
+    parser.add_argument("--banks", type=int, default=4, help="banks per unit")
+    parser.add_argument("--bank-leds", default="binary", choices=["binary", "blink"])
+    parser.add_argument("--state-backend", default="json", choices=["json", "session", "journal"])
+    parser.add_argument("--output-mode", default="raw", choices=["raw", "mido"])
+    parser.add_argument("--input-mode", default="callback", choices=["callback", "blocking"])
+    parser.add_argument("--cc-window", type=float, default=0.0, metavar="MS")
+    parser.add_argument("--runtime", default="threads", choices=["threads", "async"])
+    parser.add_argument("--mapping", default=MappingProfile.DEFAULT_PATH, metavar="FILE",
+                        help="note/CC mapping profile the gestures and the routing use")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    Log.start("WARNING")
+    mapping_path = os.path.abspath(args.mapping)  # the replay itself runs in a scratch directory
+    MappingProfile.use(MappingProfile.load(mapping_path))
+
+    if args.file:
+        events = read_midi_file(args.file)
+    elif args.devices > 1:
+        events = merge([SCENARIOS[args.scenario](args.events // args.devices, random.Random(args.seed + unit))
+                        for unit in range(args.devices)])
+    else:
+        events = SCENARIOS[args.scenario](args.events, random.Random(args.seed))
+    with scratch_dir():
+        result = replay(events, speed=args.speed, devices=args.devices, banks=args.banks, bank_leds=args.bank_leds,
+                        state_backend=args.state_backend, runtime=args.runtime,
+                        output_mode=args.output_mode, input_mode=args.input_mode,
+                        cc_window=args.cc_window / 1000.0, mapping=mapping_path)
+    if args.json:
+        print(json.dumps({k: v for k, v in result.items() if k not in ("recorded", "latency_report")}, indent=2))
+    else:
+        print_report(result)
+    Log.stop()
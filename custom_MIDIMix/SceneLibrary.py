@@ -0,0 +1,139 @@
+import json
+import os
+from collections import OrderedDict
+
+import Log
+from StateHandler import StateHandler
+
+
+class SceneLibrary:
+    """Named scenes holding ``toggle_states`` + ``cc_values`` for every bank.
+
+    Scenes live as one JSON file each under ``directory``; ``index.json`` maps
+    names to files and remembers the recall order. The most recently used
+    scenes are kept decoded in memory (LRU, ``cache_size`` entries) and are
+    preloaded on startup, so a recall is a dict copy rather than file I/O.
+    """
+
+    def __init__(self, directory="Scenes", cache_size=8):
+        """
+        Open the library and preload the most recently used scenes.
+
+        Args:
+            directory (str): Folder that holds the scene files and the index.
+            cache_size (int): Number of decoded scenes kept in memory.
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self._writer = StateHandler()
+        self._index_file = os.path.join(directory, "index.json")
+        self._files = {}        # name -> file name
+        self._recent = []       # names, most recent first
+        self._cache = OrderedDict()  # name -> [(bank name, toggle_states, cc_values), ...]
+        self._index_dirty = False
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._index_file, "r") as file:
+                index = json.load(file)
+            self._files = index["scenes"]
+            self._recent = [n for n in index["recent"] if n in self._files]
+        except (OSError, ValueError, KeyError):
+            pass
+        for name in reversed(self._recent[:cache_size]):
+            try:
+                self._load(name)
+            except (OSError, ValueError, KeyError):
+                Log.persistence.warning("Scene %r could not be preloaded", name)
+
+    def names(self):
+        return sorted(self._files)
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def save(self, name, banks):
+        """
+        Capture the current state of ``banks`` under ``name``.
+
+        Args:
+            name (str): Scene name.
+            banks (list): MidiHandler instances, in bank order.
+        """
+        scene = [(b.ID, dict(b.toggle_states), dict(b.last_cc_values)) for b in banks]
+        filename = self._files.get(name) or self._filename_for(name)
+        self._writer._write_atomic(os.path.join(self.directory, filename), {
+            "name": name,
+            "banks": [{"name": bid,
+                       "toggle_states": {str(k): v for k, v in t.items()},
+                       "cc_values": {str(k): v for k, v in c.items()}}
+                      for bid, t, c in scene],
+        })
+        self._files[name] = filename
+        self._remember(name, scene)
+        self._write_index()
+
+    def get(self, name):
+        """Return the scene as ``[(bank name, toggle_states, cc_values), ...]``. Do not mutate the dicts."""
+        scene = self._cache.get(name)
+        if scene is None:
+            scene = self._load(name)
+        else:
+            self._cache.move_to_end(name)
+        if not self._recent or self._recent[0] != name:
+            # recall order is only needed for preloading; written on save/close, not on the recall path
+            self._remember(name, scene)
+            self._index_dirty = True
+        return scene
+
+    def delete(self, name):
+        filename = self._files.pop(name, None)
+        self._cache.pop(name, None)
+        if name in self._recent:
+            self._recent.remove(name)
+        if filename:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+        self._write_index()
+
+    def close(self):
+        if self._index_dirty:
+            self._write_index()
+
+    # ---------- internals ----------
+    def _load(self, name):
+        filename = self._files[name]
+        with open(os.path.join(self.directory, filename), "r") as file:
+            data = json.load(file)
+        scene = [(b["name"],
+                  {int(k): v for k, v in b["toggle_states"].items()},
+                  {int(k): v for k, v in b["cc_values"].items()})
+                 for b in data["banks"]]
+        self._cache[name] = scene
+        self._evict()
+        return scene
+
+    def _remember(self, name, scene):
+        self._cache[name] = scene
+        self._cache.move_to_end(name)
+        self._evict()
+        if name in self._recent:
+            self._recent.remove(name)
+        self._recent.insert(0, name)
+
+    def _evict(self):
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _filename_for(self, name):
+        stem = "".join(ch if ch.isalnum() or ch in " -_" else "_" for ch in name).strip() or "scene"
+        filename, n = stem + ".json", 1
+        while filename in self._files.values() or filename == "index.json":
+            n += 1
+            filename = f"{stem} {n}.json"
+        return filename
+
+    def _write_index(self):
+        self._writer._write_atomic(self._index_file, {"scenes": self._files, "recent": self._recent})
+        self._index_dirty = False
@@ -0,0 +1,208 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from StateHandler import StateHandler
+
+# File layout (little endian):
+#   header: magic "AKGS", version u16, used slots u16, slot size u16, 6 bytes reserved
+#   slot:   bank name (16 bytes, NUL padded)
+#           note mask (16 bytes, one bit per note 0..127 that the bank tracks)
+#           toggle bits (16 bytes, one bit per note)
+#           cc mask (16 bytes, one bit per CC that the bank tracks)
+#           cc values (128 bytes, one per CC number)
+MAGIC = b"AKGS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHH6x")
+NAME_LEN = 16
+NOTE_MASK = NAME_LEN
+TOGGLE_BITS = NOTE_MASK + 16
+CC_MASK = TOGGLE_BITS + 16
+CC_VALUES = CC_MASK + 16
+SLOT_SIZE = CC_VALUES + 128
+INITIAL_SLOTS = 8
+
+
+def _bits_to_keys(bits):
+    return [i for i in range(128) if bits[i >> 3] & (1 << (i & 7))]
+
+
+class SessionStore:
+    """All banks in one fixed-layout binary file, memory-mapped.
+
+    Drop-in replacement for ``StateHandler``: ``load_state``/``save_state`` take
+    and return the same dicts, but a save is an in-place write into the mapped
+    slot of the bank instead of a JSON serialize-and-rewrite. ``set_toggle`` and
+    ``set_cc`` write a single change of a bank that has a slot, so MidiHandler
+    only rewrites the whole slot the first time it saves a bank.
+    """
+
+    def __init__(self, filename="Session.akgs"):
+        """
+        Open (or create) the session file.
+
+        Args:
+            filename (str): Path of the session file.
+        """
+        defaults = StateHandler()
+        self.default_toggle_states = defaults.default_toggle_states
+        self.default_cc = defaults.default_cc
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._slots = {}  # bank name -> slot index
+        self._file = None
+        self._mm = None
+        self._open()
+
+    # ---------- StateHandler API ----------
+    def load_state(self, bid):
+        with self._lock:
+            slot = self._slots.get(bid)
+            if slot is None:
+                return self.default_toggle_states.copy(), self.default_cc.copy()
+            off = self._offset(slot)
+            mm = self._mm
+            notes = _bits_to_keys(mm[off + NOTE_MASK:off + TOGGLE_BITS])
+            bits = mm[off + TOGGLE_BITS:off + CC_MASK]
+            toggle_states = {n: bool(bits[n >> 3] & (1 << (n & 7))) for n in notes}
+            values = mm[off + CC_VALUES:off + SLOT_SIZE]
+            cc_values = {cc: values[cc] for cc in _bits_to_keys(mm[off + CC_MASK:off + CC_VALUES])}
+            return toggle_states, cc_values
+
+    def save_state(self, toggle_states, cc_values, bid):
+        note_mask = bytearray(16)
+        toggle_bits = bytearray(16)
+        for note, on in toggle_states.items():
+            note_mask[note >> 3] |= 1 << (note & 7)
+            if on:
+                toggle_bits[note >> 3] |= 1 << (note & 7)
+        cc_mask = bytearray(16)
+        values = bytearray(128)
+        for cc, value in cc_values.items():
+            cc_mask[cc >> 3] |= 1 << (cc & 7)
+            values[cc] = value
+        with self._lock:
+            off = self._offset(self._slot_for(bid))
+            self._mm[off + NOTE_MASK:off + SLOT_SIZE] = note_mask + toggle_bits + cc_mask + values
+
+    def set_toggle(self, bid, note, on):
+        """Write a single toggle bit in place. False if the bank has no slot yet: save it whole with save_state."""
+        with self._lock:
+            slot = self._slots.get(bid)
+            if slot is None:
+                return False
+            off = self._offset(slot)
+            i, bit = note >> 3, 1 << (note & 7)
+            mm = self._mm
+            mm[off + NOTE_MASK + i] |= bit
+            if on:
+                mm[off + TOGGLE_BITS + i] |= bit
+            else:
+                mm[off + TOGGLE_BITS + i] &= ~bit & 0xFF
+            return True
+
+    def set_cc(self, bid, cc, value):
+        """Write a single CC byte in place. False if the bank has no slot yet: save it whole with save_state."""
+        with self._lock:
+            slot = self._slots.get(bid)
+            if slot is None:
+                return False
+            off = self._offset(slot)
+            self._mm[off + CC_MASK + (cc >> 3)] |= 1 << (cc & 7)
+            self._mm[off + CC_VALUES + cc] = value
+            return True
+
+    def flush(self, wait=True):
+        """Sync the mapping to disk. Without ``wait`` the OS writeback is left to do it."""
+        if wait:
+            with self._lock:
+                self._mm.flush()
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+                self._mm.close()
+                self._file.close()
+                self._mm = None
+
+    # ---------- JSON interop ----------
+    def banks(self):
+        return list(self._slots)
+
+    def import_json(self, bid, source=None):
+        """Copy a bank from ``<source>.json`` (default ``<bid>.json``) into the session file."""
+        toggle_states, cc_values = StateHandler().load_state(source or bid)
+        self.save_state(toggle_states, cc_values, bid)
+
+    def export_json(self, bid, target=None):
+        """Write a bank out as ``<target>.json`` (default ``<bid>.json``)."""
+        toggle_states, cc_values = self.load_state(bid)
+        StateHandler().save_state(toggle_states, cc_values, target or bid)
+
+    # ---------- internals ----------
+    def _open(self):
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) < HEADER.size:
+            with open(self.filename, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, SLOT_SIZE))
+                f.write(bytes(SLOT_SIZE * INITIAL_SLOTS))
+        self._file = open(self.filename, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, version, used, slot_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            self._mm.close()
+            self._file.close()
+            raise ValueError(f"{self.filename} is not a version {VERSION} session file")
+        for slot in range(used):
+            off = self._offset(slot)
+            name = bytes(self._mm[off:off + NAME_LEN]).rstrip(b"\0").decode("utf-8")
+            self._slots[name] = slot
+
+    def _offset(self, slot):
+        return HEADER.size + slot * SLOT_SIZE
+
+    def _capacity(self):
+        return (len(self._mm) - HEADER.size) // SLOT_SIZE
+
+    def _slot_for(self, bid):
+        slot = self._slots.get(bid)
+        if slot is not None:
+            return slot
+        name = bid.encode("utf-8")
+        if len(name) > NAME_LEN:
+            raise ValueError(f"Bank name {bid!r} is longer than {NAME_LEN} bytes")
+        slot = len(self._slots)
+        if slot >= self._capacity():
+            self._grow()
+        off = self._offset(slot)
+        self._mm[off:off + SLOT_SIZE] = name.ljust(NAME_LEN, b"\0") + bytes(SLOT_SIZE - NAME_LEN)
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, slot + 1, SLOT_SIZE)
+        self._slots[bid] = slot
+        return slot
+
+    def _grow(self):
+        size = HEADER.size + 2 * self._capacity() * SLOT_SIZE
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+
+if __name__ == "__main__":
+    # python SessionStore.py import|export [Bank A] [Bank B] ...
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export"):
+        print("Usage: python SessionStore.py import|export [bank name ...]")
+        sys.exit(1)
+    store = SessionStore()
+    names = sys.argv[2:] or (["Bank A", "Bank B", "Bank C", "Bank D"] if sys.argv[1] == "import" else store.banks())
+    for bank in names:
+        if sys.argv[1] == "import" and not os.path.exists(bank + ".json"):
+            continue
+        if sys.argv[1] == "import":
+            store.import_json(bank)
+        else:
+            store.export_json(bank)
+        print(f"{sys.argv[1]}ed {bank}")
+    store.close()
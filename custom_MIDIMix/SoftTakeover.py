@@ -0,0 +1,139 @@
+import json
+from array import array
+
+# Takeover modes
+JUMP = 0       # always follow the hardware
+PICKUP = 1     # ignore until the hardware is within threshold of the stored value
+SCALE = 2      # move the output proportionally so it converges with the hardware at the end of travel
+DIRECTION = 3  # ignore until the hardware crosses the stored value
+
+MODES = {"jump": JUMP, "pickup": PICKUP, "scale": SCALE, "direction": DIRECTION}
+
+NO_VALUE = 0xFF  # hardware position not seen yet
+
+
+class SoftTakeover:
+    """Per-bank soft-takeover state for all 128 CCs.
+
+    When a bank is entered the physical knobs and faders rarely sit where the
+    bank's stored values are. ``process`` decides, per CC and according to the
+    CC's mode, whether a hardware move is output and with which value. Once a
+    control has caught up it stays engaged for as long as it keeps moving
+    within its window. State lives in preallocated arrays indexed by CC number
+    and time comes from the monotonic clock.
+    """
+
+    def __init__(self, cc_values=None, mode=PICKUP, threshold=10, window=2.0):
+        """
+        Initialize the engine.
+
+        Args:
+            cc_values (dict): Stored CC values of the bank.
+            mode (int): Default mode for every CC.
+            threshold (int): Default pickup distance.
+            window (float): Seconds a caught control stays engaged after its last move.
+        """
+        self.mode = bytearray([mode]) * 128
+        self.threshold = bytearray([threshold]) * 128
+        self.window = array('d', [window]) * 128
+        self.value = bytearray(128)                # stored/output value
+        self.hw = bytearray([NO_VALUE]) * 128      # last hardware position
+        self.last = array('d', [-1e300]) * 128     # monotonic time of the last output
+        self.engaged = bytearray(128)
+        self.accepted = 0
+        self.rejected = 0
+        if cc_values:
+            self.load(cc_values)
+
+    def load(self, cc_values):
+        """Take over new stored values (bank load, scene recall); every control has to catch up again."""
+        for cc, value in cc_values.items():
+            self.value[cc] = value
+        self.hw[:] = bytearray([NO_VALUE]) * 128
+        self.engaged[:] = bytes(128)
+
+    def configure(self, cc=None, mode=None, threshold=None, window=None):
+        """
+        Change the takeover settings of one CC, or of all CCs when cc is None.
+
+        Args:
+            cc (int): CC number.
+            mode (int | str): One of JUMP, PICKUP, SCALE, DIRECTION or its name.
+            threshold (int): Pickup distance.
+            window (float): Engaged window in seconds.
+        """
+        if isinstance(mode, str):
+            mode = MODES[mode]
+        for i in (range(128) if cc is None else (cc,)):
+            if mode is not None:
+                self.mode[i] = mode
+            if threshold is not None:
+                self.threshold[i] = threshold
+            if window is not None:
+                self.window[i] = window
+
+    def configure_from(self, config):
+        """Apply {"default": {...}, "<cc>": {...}} as read from the takeover config file."""
+        if "default" in config:
+            self.configure(None, **config["default"])
+        for key, settings in config.items():
+            if key != "default":
+                self.configure(int(key), **settings)
+
+    def process(self, cc, hw, now):
+        """
+        Decide what to output for a hardware move.
+
+        Args:
+            cc (int): CC number.
+            hw (int): Hardware value 0..127.
+            now (float): time.monotonic() of the move.
+
+        Returns:
+            int: Value to output, or -1 to ignore the move.
+        """
+        prev = self.hw[cc]
+        self.hw[cc] = hw
+        stored = self.value[cc]
+        if self.engaged[cc] and now - self.last[cc] <= self.window[cc]:
+            out = hw
+        else:
+            mode = self.mode[cc]
+            if mode == JUMP or hw == stored:
+                out = hw
+            elif mode == PICKUP:
+                out = hw if abs(hw - stored) <= self.threshold[cc] else -1
+            elif mode == DIRECTION:
+                out = hw if prev != NO_VALUE and (prev < stored < hw or prev > stored > hw) else -1
+            elif abs(hw - stored) <= self.threshold[cc]:
+                out = hw
+            elif prev == NO_VALUE or prev == hw:
+                out = -1
+            elif hw > prev:
+                out = stored + ((hw - prev) * (127 - stored) + (127 - prev) // 2) // (127 - prev)
+            else:
+                out = stored - ((prev - hw) * stored + prev // 2) // prev
+        if out < 0:
+            self.rejected += 1
+            return -1
+        self.accepted += 1
+        self.value[cc] = out
+        self.last[cc] = now
+        self.engaged[cc] = out == hw
+        return out
+
+
+def load_config(filename="Takeover.json"):
+    """
+    Read per-bank takeover settings, e.g.
+    {"Bank A": {"default": {"mode": "pickup", "threshold": 10, "window": 2.0}, "19": {"mode": "scale"}}}.
+
+    Returns:
+        dict: Bank name -> config for SoftTakeover.configure_from; empty if the file does not exist.
+    """
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
@@ -1,29 +1,12 @@
 import mido
 
-# Notes
-notes = [
-    1, 2, 3, 4, 5, 6, 7, 8, 9, 10,
-    11, 12, 13, 14, 15, 16, 17, 18, 19, 20,
-    21, 22, 23, 24, 25, 26, 27]
+import MappingProfile
 
-# Control Changes
-control_changes = [
-    16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
-    26, 27, 28, 29, 30, 31, 46, 47, 48, 49,
-    50, 51, 52, 53, 54, 55, 56, 57, 58, 59,
-    60, 61, 127]
-
-# Shifted Notes
-shifted_notes = [3, 6, 9, 12, 15, 18, 21, 24]
-
-# Notes after shift
-after_shift = [35, 38, 41, 44, 47, 50, 53, 56]
-
-# Notes with no light
-no_light = [25, 26, 27]
-
-# Add shifted notes after offset to the notes list
-notes.extend([note + 32 for note in shifted_notes])
+# Note/CC map of the device (Mapping.json)
+mapping = MappingProfile.current()
+shifted_notes = mapping.shifted  # notes that move while the shift button is held
+after_shift = mapping.after_shift  # where they move to
+special_notes = [mapping.bank_up, mapping.bank_down, mapping.shift_note]
 
 
 def print_available_midi_connections():
@@ -61,16 +44,7 @@ class MidiHandler:
         self.output_port = None
         self.output_port_2 = None
         self.note_27_state = False  # Attribute to track the state of note 27
-        self.toggle_states = {
-            1: False, 2: False, 3: False, 4: False,
-            5: False, 6: False, 7: False, 8: False,
-            9: False, 10: False, 11: False, 12: False,
-            13: False, 14: False, 15: False, 16: False,
-            17: False, 18: False, 19: False, 20: False,
-            21: False, 22: False, 23: False, 24: False,
-            35: False, 38: False, 41: False, 44: False,
-            47: False, 53: False, 50: False, 56: False
-        }  # Dictionary to store toggle states
+        self.toggle_states = dict(mapping.default_toggle_states)  # Dictionary to store toggle states
         self.last_cc_values = {}  # Dictionary to store last sent control change values
 
     def open_ports(self):
@@ -108,11 +82,11 @@ class MidiHandler:
                 if message.type == 'control_change':
                     self.process_control_change_message(message)
                 # Check if the received message is a special message
-                elif message.note == 25 and message.type in ['note_on', 'note_off']:
+                elif message.note == mapping.bank_up and message.type in ['note_on', 'note_off']:
                     self.handle_bank_up()
-                elif message.note == 26 and message.type in ['note_on', 'note_off']:
+                elif message.note == mapping.bank_down and message.type in ['note_on', 'note_off']:
                     self.handle_bank_down()
-                elif message.note == 27 and message.type in ['note_on', 'note_off']:
+                elif message.note == mapping.shift_note and message.type in ['note_on', 'note_off']:
                     self.handle_switch_button(message)
                 # Process regular MIDI messages
                 elif message.type == 'note_on':
@@ -140,7 +114,7 @@ class MidiHandler:
 
         # Check if the note should be shifted and note 27 is on
         if message.note in shifted_notes and self.note_27_state:
-            message.note = message.note + 32
+            message.note = message.note + mapping.shift_offset
             self.send_note_off_message(message)
         else:
             # Send note-off messages to the output port
@@ -154,9 +128,9 @@ class MidiHandler:
             message (mido.Message): The MIDI message.
         """
         # Send note messages to the output port
-        if message.note not in [25, 26, 27]:
+        if message.note not in special_notes:
             if message.note in shifted_notes and self.note_27_state:
-                message.note = message.note + 32
+                message.note = message.note + mapping.shift_offset
                 self.send_note_message(message)
             else:
                 self.send_note_message(message)
@@ -209,7 +183,7 @@ class MidiHandler:
     def send_note_off_message(self, message):
         """Send note-off messages to the output port."""
         outbound = mido.Message('note_off', note=message.note, velocity=message.velocity, channel=self.channel)
-        if message.note not in [25, 26, 27]:
+        if message.note not in special_notes:
             print("Sent note:", outbound)
             self.output_port.send(outbound)
 
@@ -239,13 +213,13 @@ class MidiHandler:
         for note_number, state in self.toggle_states.items():
             if state:
                 if note_number in after_shift and self.note_27_state:
-                    note_number -= 32
+                    note_number -= mapping.shift_offset
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=127))
                 else:
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=127))
             else:
                 if note_number in after_shift and self.note_27_state:
-                    note_number -= 32
+                    note_number -= mapping.shift_offset
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=0))
                 else:
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=0))
@@ -255,14 +229,14 @@ class MidiHandler:
         if note_number in self.toggle_states:
             if self.toggle_states[note_number]:
                 if note_number in after_shift:
-                    note_number = note_number - 32
+                    note_number = note_number - mapping.shift_offset
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=127))
                 else:
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=127))
 
             elif not self.toggle_states[note_number]:
                 if note_number in after_shift:
-                    note_number = note_number - 32
+                    note_number = note_number - mapping.shift_offset
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=0))
                 else:
                     self.output_port_2.send(mido.Message('note_on', note=note_number, velocity=0))
@@ -1,23 +1,15 @@
 import json
+import os
+import Log
+import MappingProfile
 
 
 class StateHandler:
-    def __init__(self):
-        self.default_toggle_states = {
-            1: False, 2: False, 3: False, 4: False,
-            5: False, 6: False, 7: False, 8: False,
-            9: False, 10: False, 11: False, 12: False,
-            13: False, 14: False, 15: False, 16: False,
-            17: False, 18: False, 19: False, 20: False,
-            21: False, 22: False, 23: False, 24: False,
-            35: False, 38: False, 41: False, 44: False,
-            47: False, 53: False, 50: False, 56: False}
-        self.default_cc = {
-            16: 0, 17: 0, 18: 0, 19: 0, 20: 0, 21: 0, 22: 0, 23: 0, 24: 0, 25: 0,
-            26: 0, 27: 0, 28: 0, 29: 0, 30: 0, 31: 0, 46: 0, 47: 0, 48: 0, 49: 0,
-            50: 0, 51: 0, 52: 0, 53: 0, 54: 0, 55: 0, 56: 0, 57: 0, 58: 0, 59: 0,
-            60: 0, 61: 0, 127: 0
-        }
+    def __init__(self, mapping=None):
+        # a bank that was never saved has every mapped toggle off and every mapped CC at 0
+        mapping = mapping or MappingProfile.current()
+        self.default_toggle_states = dict(mapping.default_toggle_states)
+        self.default_cc = dict(mapping.default_cc)
 
     def save_state(self, toggle_states, cc_values, bid):
         # Create a dictionary to store the current state
@@ -30,10 +22,24 @@ class StateHandler:
 
         # Save the state to a JSON file
         filename = bid + ".json"
-        with open(filename, "w") as file:
+        self._write_atomic(filename, state)
+
+        Log.persistence.debug("State saved to %s", filename)
+
+    def _write_atomic(self, filename, state):
+        """Write JSON to a temp file and rename it over the target so a crash never leaves half a file."""
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as file:
             json.dump(state, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, filename)
 
-        print(f"Debug: State saved to {filename}")
+    def flush(self, wait=True):
+        """Nothing is buffered by the plain JSON backend."""
+
+    def close(self):
+        """Nothing to release for the plain JSON backend."""
 
     def load_state(self, bid):
         filename = bid + ".json"
@@ -45,23 +51,11 @@ class StateHandler:
             # Convert loaded data back to appropriate types
             toggle_states = {int(k): v for k, v in state["toggle_states"].items()}
             cc_values = {int(k): v for k, v in state["cc_values"].items()}
-
-            print(f"Debug: State loaded from {filename}")
-            print(f"Debug: Loaded toggle_states: {toggle_states}")
-            print(f"Debug: Loaded cc_values: {cc_values}")
-            print(self.default_toggle_states, self.default_cc)
             return toggle_states, cc_values
 
         except FileNotFoundError:
-            print(f"Debug: State file {filename} not found. Initializing new state with default values.")
-            self.save_state(self.default_toggle_states, self.default_cc, bid)
-            print(f"Debug: Initialized toggle_states: {self.default_toggle_states}")
-            print(f"Debug: Initialized cc_values: {self.default_cc}")
+            # The file is created by the first save, not here, to keep startup free of writes
             return self.default_toggle_states.copy(), self.default_cc.copy()
         except json.JSONDecodeError:
-            print(f"Debug: State file {filename} is corrupted. Initializing new state with default values.")
-            self.save_state(self.default_toggle_states, self.default_cc, bid)
-            print(f"Debug: Initialized toggle_states: {self.default_toggle_states}")
-            print(f"Debug: Initialized cc_values: {self.default_cc}")
+            Log.persistence.warning("State file %s is corrupted. Initializing new state with default values.", filename)
             return self.default_toggle_states.copy(), self.default_cc.copy()
-
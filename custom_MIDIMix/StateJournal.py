@@ -0,0 +1,313 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+import Log
+from StateHandler import StateHandler
+
+# Journal file: header (magic "AKJ2", generation u32) followed by fixed 10-byte records:
+#   bank slot u16, kind u8, key u8, value u8, pad, crc32 u32 over generation + the first six bytes.
+# A KIND_BANK record gives a new bank its slot: key is the length of the bank ID, whose UTF-8 bytes
+# follow the record, zero-padded to a multiple of the record size; its crc32 also covers the ID.
+# Version 1 journals ("AKJ1", 8-byte records with a u8 slot) are still replayed, then compacted.
+JOURNAL_MAGIC = b"AKJ2"
+JOURNAL_HEADER = struct.Struct("<4sI")
+RECORD = struct.Struct("<HBBBxI")
+RECORD_HEAD = struct.Struct("<HBBBx")
+RECORD_V1 = struct.Struct("<BBBBI")
+RECORDS = {JOURNAL_MAGIC: RECORD, b"AKJ1": RECORD_V1}
+MAX_SLOTS = 1 << 16
+KIND_TOGGLE = 0
+KIND_CC = 1
+KIND_BANK = 2
+
+
+class StateJournal:
+    """Snapshot plus append-only journal backend.
+
+    Every toggle or CC change is appended as a small checksummed record, and
+    a bank saved for the first time is added with a bank record followed by
+    its full state. Once the journal grows past ``compact_every`` records a
+    background thread folds it into a new snapshot and starts an empty
+    journal, so both the file size and the replay time on startup stay
+    bounded. Compaction only holds the lock to copy the state and to swap
+    journals; saves in between go on to the old journal and are carried
+    over into the new one. On startup the newest
+    valid snapshot is loaded and the valid prefix of the journal is replayed;
+    a torn or corrupted tail only loses the records after the damage.
+    """
+
+    def __init__(self, basename="State", compact_every=4096, sync_interval=0.5):
+        """
+        Open the journal, recovering whatever state is on disk.
+
+        Args:
+            basename (str): Prefix for ``<basename>.snap``, ``<basename>.snap.prev`` and ``<basename>.journal``.
+            compact_every (int): Journal records after which a snapshot is taken.
+            sync_interval (float): Seconds between fsyncs of the journal.
+        """
+        self.seed = StateHandler()
+        self.default_toggle_states = self.seed.default_toggle_states
+        self.default_cc = self.seed.default_cc
+        self.snap_file = basename + ".snap"
+        self.prev_file = basename + ".snap.prev"
+        self.journal_file = basename + ".journal"
+        self.compact_every = compact_every
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._dirty = False
+        self._banks = {}   # bid -> (toggle_states, cc_values)
+        self._slots = {}   # bid -> slot in the journal records
+        self._touched = None  # banks saved while a compaction writes its snapshot, else None
+        self._generation = 0
+        self._records = 0
+        self._fd = None
+        self.compactions = 0
+        self.recovered_records = 0
+        self.dropped_bytes = 0
+
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="StateJournal", daemon=True)
+        self._thread.start()
+
+    # ---------- StateHandler API ----------
+    def load_state(self, bid):
+        with self._lock:
+            state = self._banks.get(bid)
+        if state is None:
+            if os.path.exists(bid + ".json"):
+                # migrate an existing per-bank JSON file on first use
+                return self.seed.load_state(bid)
+            return self.default_toggle_states.copy(), self.default_cc.copy()
+        return dict(state[0]), dict(state[1])
+
+    def save_state(self, toggle_states, cc_values, bid):
+        with self._lock:
+            if self._touched is not None:
+                self._touched.add(bid)
+            if bid not in self._slots:
+                slot = self._slots[bid] = len(self._slots)
+                self._banks[bid] = ({}, {})
+                out = self._bank_record(bid, slot)
+            else:
+                slot = self._slots[bid]
+                out = bytearray()
+            out += self._changes(slot, self._banks[bid], toggle_states, cc_values)
+            if out:
+                os.write(self._fd, out)
+                self._records += len(out) // RECORD.size
+                self._dirty = True
+                if self._records >= self.compact_every:
+                    self._wake.set()
+
+    def flush(self, wait=True):
+        if wait:
+            with self._lock:
+                self._sync()
+        else:
+            self._wake.set()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._compact()
+        with self._lock:
+            os.close(self._fd)
+            self._fd = None
+
+    # ---------- recovery ----------
+    def _recover(self):
+        snap = self._read_snapshot(self.snap_file)
+        prev = self._read_snapshot(self.prev_file)
+        try:
+            with open(self.journal_file, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        generation = None
+        record = RECORD
+        if len(data) >= JOURNAL_HEADER.size:
+            magic, generation = JOURNAL_HEADER.unpack_from(data, 0)
+            record = RECORDS.get(magic)
+            if record is None:
+                generation = None
+        # the journal belongs to the newest snapshot, or to the previous one if a compaction
+        # was cut off between writing its snapshot and replacing the journal
+        snapshot = next((s for s in (snap, prev) if s and s["generation"] == generation), None)
+        if snapshot is None:
+            generation = None  # no journal to replay; start from the newest snapshot there is
+        self._load_snapshot(snapshot or snap or prev)
+        names = {i: bid for bid, i in self._slots.items()}
+
+        valid = 0
+        if generation is not None:
+            valid = JOURNAL_HEADER.size
+            gen = generation.to_bytes(4, "little")
+            head = record.size - 4
+            while valid + record.size <= len(data):
+                slot, kind, key, value, crc = record.unpack_from(data, valid)
+                if kind == KIND_BANK:
+                    end = valid + record.size + key
+                    name = data[valid + record.size:end]
+                    if end > len(data) or crc != zlib.crc32(gen + data[valid:valid + head] + name) or slot in names:
+                        break
+                    bid = name.decode("utf-8", "replace")
+                    names[slot] = bid
+                    self._slots[bid] = slot
+                    self._banks[bid] = ({}, {})
+                    valid = end + -key % record.size
+                    self._records += 1
+                    continue
+                if crc != zlib.crc32(gen + data[valid:valid + head]) or slot not in names:
+                    break
+                toggles, ccs = self._banks[names[slot]]
+                if kind == KIND_TOGGLE:
+                    toggles[key] = bool(value)
+                else:
+                    ccs[key] = value
+                valid += record.size
+                self._records += 1
+        self.recovered_records = self._records
+        self.dropped_bytes = max(0, len(data) - valid) if valid else 0
+        if self.dropped_bytes:
+            Log.persistence.warning("Journal: dropped %d damaged bytes after %d good records",
+                                    self.dropped_bytes, self._records)
+
+        if valid:
+            self._fd = os.open(self.journal_file, os.O_RDWR | os.O_APPEND | getattr(os, "O_BINARY", 0))
+            os.ftruncate(self._fd, valid)
+            if snapshot is not snap:
+                # replayed on top of the previous snapshot: fold it in above the newer one's generation
+                self._generation = max(self._generation, snap["generation"] if snap else 0)
+                self._compact()
+            elif record is not RECORD:
+                self._compact()  # new records must not be appended to a version 1 journal
+        else:
+            self._compact()
+
+    def _load_snapshot(self, snapshot):
+        if snapshot:
+            self._generation = snapshot["generation"]
+            for bid, state in snapshot["banks"].items():
+                self._banks[bid] = ({int(k): v for k, v in state["toggle_states"].items()},
+                                    {int(k): v for k, v in state["cc_values"].items()})
+            self._slots = {bid: i for i, bid in enumerate(snapshot["order"])}
+
+    def _read_snapshot(self, filename):
+        try:
+            with open(filename, "r") as file:
+                wrapper = json.load(file)
+            body = wrapper["body"]
+            if wrapper["crc32"] != zlib.crc32(self._encode(body)):
+                return None
+            return body
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    # ---------- compaction ----------
+    def _compact(self):
+        """
+        Write a snapshot of every bank and start a fresh journal.
+
+        The lock is held to copy the banks and again to swap the journals, not
+        for the file I/O: saves made meanwhile still go to the old journal and
+        are written into the new one at the swap. Caller must not hold the lock.
+        """
+        with self._lock:
+            generation = self._generation + 1
+            banks = {bid: (dict(t), dict(c)) for bid, (t, c) in self._banks.items()}
+            self._touched = set()
+        order = list(banks)
+        body = {
+            "generation": generation,
+            "order": order,
+            "banks": {bid: {"toggle_states": {str(k): v for k, v in t.items()},
+                            "cc_values": {str(k): v for k, v in c.items()}}
+                      for bid, (t, c) in banks.items()},
+        }
+        if os.path.exists(self.snap_file):
+            os.replace(self.snap_file, self.prev_file)
+        self.seed._write_atomic(self.snap_file, {"crc32": zlib.crc32(self._encode(body)), "body": body})
+
+        tmp = self.journal_file + ".tmp"
+        with open(tmp, "wb") as file:
+            file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation))
+            file.flush()
+            os.fsync(file.fileno())
+
+        with self._lock:
+            os.replace(tmp, self.journal_file)
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self.journal_file, os.O_RDWR | os.O_APPEND | getattr(os, "O_BINARY", 0))
+            self._generation = generation
+            self._slots = {bid: i for i, bid in enumerate(order)}
+            # carry over what was saved since the copy, encoded for the new generation
+            out = bytearray()
+            for bid in self._touched:
+                toggles, ccs = self._banks[bid]
+                if bid in banks:
+                    out += self._changes(self._slots[bid], banks[bid], toggles, ccs)
+                else:
+                    slot = self._slots[bid] = len(self._slots)
+                    out += self._bank_record(bid, slot)
+                    out += self._changes(slot, ({}, {}), toggles, ccs)
+            self._touched = None
+            if out:
+                os.write(self._fd, out)
+            self._records = len(out) // RECORD.size
+            self._dirty = bool(out)
+            self.compactions += 1
+
+    def _changes(self, slot, old, toggle_states, cc_values):
+        """Records for what differs from old (toggle_states, cc_values), which is updated to match."""
+        old_toggles, old_cc = old
+        out = bytearray()
+        for note, on in toggle_states.items():
+            if old_toggles.get(note) != on:
+                old_toggles[note] = on
+                out += self._record(slot, KIND_TOGGLE, note, int(bool(on)))
+        for cc, value in cc_values.items():
+            if old_cc.get(cc) != value:
+                old_cc[cc] = value
+                out += self._record(slot, KIND_CC, cc, value)
+        return out
+
+    def _bank_record(self, bid, slot):
+        if slot >= MAX_SLOTS:
+            raise ValueError(f"Journal holds at most {MAX_SLOTS} banks")
+        name = bid.encode("utf-8")
+        head = RECORD_HEAD.pack(slot, KIND_BANK, len(name), 0)
+        crc = zlib.crc32(self._generation.to_bytes(4, "little") + head + name)
+        return bytearray(head + crc.to_bytes(4, "little") + name + bytes(-len(name) % RECORD.size))
+
+    def _record(self, slot, kind, key, value):
+        head = RECORD_HEAD.pack(slot, kind, key, value)
+        return head + zlib.crc32(self._generation.to_bytes(4, "little") + head).to_bytes(4, "little")
+
+    def _sync(self):
+        if self._dirty and self._fd is not None:
+            os.fsync(self._fd)
+            self._dirty = False
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            if self._closed:
+                return
+            if self._records >= self.compact_every:
+                self._compact()
+            else:
+                with self._lock:
+                    self._sync()
+
+    @staticmethod
+    def _encode(body):
+        return json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
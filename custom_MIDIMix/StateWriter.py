@@ -0,0 +1,125 @@
+import threading
+import time
+
+import Log
+from StateHandler import StateHandler
+
+
+class StateWriter:
+    """Write-behind wrapper around a state backend.
+
+    ``save_state`` only records the latest state of a bank and returns; a
+    background thread coalesces dirty banks and hands them to the wrapped
+    backend once the debounce interval has passed without the bank being
+    flushed. ``load_state``/``save_state`` keep the ``StateHandler`` signature
+    so a ``MidiHandler`` can use either one.
+    """
+
+    def __init__(self, backend=None, debounce=0.5, thread=True):
+        """
+        Initialize the writer and start its background thread.
+
+        Args:
+            backend (StateHandler): Backend that does the actual writes.
+            debounce (float): Seconds to wait for more changes before writing a dirty bank.
+            thread (bool): Start the background thread; False when a subclass schedules the writes (AsyncRuntime).
+        """
+        self.backend = backend or StateHandler()
+        self.debounce = debounce
+        self._pending = {}  # bid -> (toggle_states, cc_values)
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._kick = False
+        self._closed = False
+        self.save_requests = 0
+        self.writes = 0
+        self._thread = None
+        if thread:
+            self._thread = threading.Thread(target=self._run, name="StateWriter", daemon=True)
+            self._thread.start()
+
+    @property
+    def default_toggle_states(self):
+        return self.backend.default_toggle_states
+
+    @property
+    def default_cc(self):
+        return self.backend.default_cc
+
+    @property
+    def writes_saved(self):
+        """Number of save requests that were coalesced away instead of hitting the disk."""
+        return self.save_requests - self.writes - len(self._pending)
+
+    def load_state(self, bid):
+        # a bank saved but not written yet (e.g. by a scene recall before its first visit) loads from memory
+        with self._cond:
+            pending = self._pending.get(bid)
+        if pending is not None:
+            return dict(pending[0]), dict(pending[1])
+        with self._io_lock:  # nor may a load overtake its write in flight
+            return self.backend.load_state(bid)
+
+    def save_state(self, toggle_states, cc_values, bid):
+        """Mark a bank dirty. Copies the dicts so the MIDI thread can keep mutating them."""
+        with self._cond:
+            self._pending[bid] = (dict(toggle_states), dict(cc_values))
+            self.save_requests += 1
+            self._cond.notify()
+
+    def flush(self, wait=True):
+        """
+        Write every dirty bank now.
+
+        Args:
+            wait (bool): Write on the calling thread and return when done. With False the
+                background thread is woken to skip the debounce, and the caller does not block.
+        """
+        if wait:
+            self._write_pending()
+        else:
+            with self._cond:
+                self._kick = True
+                self._cond.notify()
+
+    def close(self):
+        """Stop the background thread and write whatever is still dirty."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        self._write_pending()
+        self.backend.close()
+        Log.persistence.info("State writer: %d saves requested, %d written, %d writes saved",
+                             self.save_requests, self.writes, self.writes_saved)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Keep absorbing changes until the interval passes or a flush is forced
+                deadline = time.monotonic() + self.debounce
+                while not self._kick and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._kick = False
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._io_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            for bid, (toggle_states, cc_values) in pending.items():
+                try:
+                    self.backend.save_state(toggle_states, cc_values, bid)
+                    self.writes += 1
+                except OSError as e:
+                    Log.persistence.error("Error writing state for %s: %s", bid, e)
+                    with self._cond:
+                        self._pending.setdefault(bid, (toggle_states, cc_values))
@@ -0,0 +1,261 @@
+import os
+import sys
+import threading
+import time
+
+import MappingProfile
+from Latency import Histogram
+from MidiDevice import bank_label
+
+CELL = 5  # columns per strip
+LEFT = 9  # columns of row labels
+PAGE = 4  # banks summarized at once: the page around the active bank
+
+ROWS = (  # (label, kind, key): one line per row, one cell per strip
+    ("Knob 1", "cc", "knob_row_1"),
+    ("Knob 2", "cc", "knob_row_2"),
+    ("Knob 3", "cc", "knob_row_3"),
+    ("Fader", "cc", "faders"),
+    ("Mute", "note", "mute"),
+    ("Solo", "note", "solo"),
+    ("Rec", "note", "recarm"),
+    ("Rec+32", "shifted", "recarm"),
+)
+
+
+class TerminalView:
+    """Low-overhead status view for a terminal (ANSI escapes, no curses).
+
+    Shows the active bank like the GUI's detail view plus a one-line summary
+    per bank of its page of four. Every frame is laid out as a dict of screen cells; only cells
+    whose text differs from what is on screen are written. Same producer API
+    as MasteratorGUI, so MidiMasterator feeds it through pull_gui_changes;
+    frames are event driven and capped at max_fps. Keys bound with ``bind``
+    (the terminal's stand-ins for the GUI's F-keys) are read on a thread of
+    their own while the view runs.
+    """
+
+    def __init__(self, stream=None, keys=None):
+        """
+        Initialize the view.
+
+        Args:
+            stream: Text stream to draw on, sys.stdout by default.
+            keys: Text stream keys are read from, sys.stdin by default; only read if it is a terminal.
+        """
+        self.stream = stream or sys.stdout
+        self.keys = keys or sys.stdin
+        self._bindings = {}  # key sequence -> (function, help text)
+        self._typed = ""  # start of a key sequence typed so far
+        self.mapping = MappingProfile.current()
+        self._latest_snapshot = None
+        self._bank_snaps = [None] * PAGE
+        self._status = ""
+        self._dirty = True
+        self._change_source = None
+        self._shown = {}  # (row, col) -> text on screen
+        self._interval = 1 / 30
+        self._wake = threading.Event()
+        self._frame_requested = False
+        self.frames = 0
+        self.requests = 0
+        self.cells_written = 0
+        self.frame_time = Histogram()
+
+    # ---------- producer API (as MasteratorGUI) ----------
+    def set_snapshot(self, snapshot):
+        self._latest_snapshot = snapshot
+        self._bank_snaps[snapshot.active_bank] = snapshot
+        self._dirty = True
+
+    def set_bank_snapshot(self, snapshot):
+        self._bank_snaps[snapshot.active_bank] = snapshot
+        self._dirty = True
+
+    def set_bank_count(self, count):
+        self._bank_snaps = [None] * count
+        self._latest_snapshot = None
+        self._dirty = True
+
+    def set_mapping(self, mapping):
+        self.mapping = mapping
+        self._dirty = True
+
+    def set_change_source(self, pull):
+        self._change_source = pull
+
+    def set_status(self, text):
+        if text != self._status:
+            self._status = text
+            self._dirty = True
+
+    def bind(self, keys, fn, help_text=None):
+        """
+        Call fn() when keys are typed (one key, or a sequence like "s1"), on the key reader thread.
+
+        Args:
+            keys (str): The key or key sequence.
+            fn (function): Called without arguments.
+            help_text (str): Shown in the key legend at the bottom of the view.
+        """
+        self._bindings[keys] = (fn, help_text)
+        self._dirty = True
+
+    def start_render_loop(self, max_fps=30):
+        self._interval = 1.0 / max(1, max_fps)
+
+    def request_frame(self):
+        """Ask for a frame soon; safe from any thread."""
+        if not self._frame_requested:
+            self._frame_requested = True
+            self.requests += 1
+            self._wake.set()
+
+    def render_now(self):
+        if self._change_source: self._change_source()
+        if self._dirty:
+            self._dirty = False
+            self._draw()
+
+    def frame_stats(self):
+        return {"frames": self.frames, "requests": self.requests, "cells_written": self.cells_written,
+                "frame_ms_p50": self.frame_time.percentile(50) / 1000,
+                "frame_ms_p95": self.frame_time.percentile(95) / 1000, "frame_ms_max": self.frame_time.max / 1000}
+
+    # ---------- loop ----------
+    def run(self, stop):
+        """Draw frames and handle bound keys until the stop event is set. Sleeps while nothing changes."""
+        self.stream.write("\x1b[?25l\x1b[2J")  # hide cursor, clear
+        self._shown.clear()
+        self._dirty = True
+        self.render_now()
+        last = 0.0
+        restore = self._start_keys(stop) if self._bindings else None
+        try:
+            while not stop.is_set():
+                if not self._wake.wait(0.5):
+                    continue
+                wait = last + self._interval - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                self._wake.clear()
+                self._frame_requested = False  # before pulling, a change during this frame asks for the next
+                start = time.perf_counter()
+                self.render_now()
+                last = start
+        finally:
+            if restore: restore()
+            self.stream.write(f"\x1b[{self._height() + 1};1H\x1b[?25h")
+            self.stream.flush()
+
+    # ---------- keys ----------
+    def _start_keys(self, stop):
+        """Start the key reader; returns a function that gives the terminal its settings back, or None."""
+        try:
+            if not self.keys.isatty():
+                return None
+            fd = self.keys.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        if os.name == "nt":
+            import msvcrt
+
+            def read():
+                while not stop.is_set():
+                    if msvcrt.kbhit():
+                        self._key(msvcrt.getwch())
+                    else:
+                        time.sleep(0.05)
+            restore = None
+        else:
+            import select
+            import termios
+            import tty
+            saved = termios.tcgetattr(fd)
+            tty.setcbreak(fd)  # keys arrive one by one, unechoed; Ctrl+C still interrupts
+
+            def read():
+                while not stop.is_set():
+                    if select.select([fd], [], [], 0.5)[0]:
+                        data = os.read(fd, 32)
+                        if not data:
+                            return
+                        for key in data.decode("utf-8", "ignore"):
+                            self._key(key)
+
+            def restore():
+                termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+        threading.Thread(target=read, name="TerminalKeys", daemon=True).start()
+        return restore
+
+    def _key(self, key):
+        """Feed one typed key; runs a binding once its whole sequence has been typed."""
+        typed = self._typed + key
+        if typed not in self._bindings and not any(k.startswith(typed) for k in self._bindings):
+            typed = key if any(k.startswith(key) for k in self._bindings) else ""
+        self._typed = typed
+        if typed in self._bindings:
+            self._typed = ""
+            self._bindings[typed][0]()
+
+    # ---------- internals ----------
+    def _height(self):
+        return len(ROWS) + 12  # header, strip numbers, rows, master, bank summaries, status, keys
+
+    def _cells(self):
+        """{(row, col): text} for the whole screen."""
+        legend = "  ".join(f"{k} {h}" for k, (_, h) in self._bindings.items() if h)
+        cells = {(self._height(), 1): f"{legend:<78}"}
+        s = self._latest_snapshot
+        if s is None:
+            cells[(1, 1)] = "Waiting for MIDI…"
+            return cells
+        m = self.mapping
+        count = len(self._bank_snaps)
+        start = s.active_bank - s.active_bank % PAGE
+        page = range(start, min(start + PAGE, count))
+        cells[(1, 1)] = f"MIDI Masterator  {s.name:<16}"
+        selector = " ".join(f"[{bank_label(i)}]" if i == s.active_bank else f" {bank_label(i)} " for i in page)
+        cells[(1, 35)] = f"{selector + (f' /{count}' if count > PAGE else ''):<22}"
+        cells[(1, 58)] = f"Shift({m.shift_note}) {'ON ' if s.note27_on else 'OFF'}"
+        for i in range(8):
+            cells[(3, LEFT + i * CELL)] = f"{i + 1:>4}"
+        for r, (label, kind, key) in enumerate(ROWS):
+            row = 4 + r
+            cells[(row, 1)] = f"{label:<8}"
+            for i in range(8):
+                if kind == "cc":
+                    text = f"{s.cc_values.get(m.cc_map[key][i], 0):>4}"
+                else:
+                    note = m.notes[key][i] + (m.shift_offset if kind == "shifted" else 0)
+                    on = s.toggle_states.get(note, False)
+                    # the layer that is not active is shown in lower case
+                    active = s.note27_on == (kind == "shifted" or key == "solo")
+                    text = f"{('ON' if active else 'on') if on else '--':>4}"
+                cells[(row, LEFT + i * CELL)] = text
+        cells[(4 + len(ROWS), 1)] = f"Master  {s.cc_values.get(m.cc_map['master'], 0):>4}"
+        for row, idx in enumerate(range(start, start + PAGE), 6 + len(ROWS)):
+            snap = self._bank_snaps[idx] if idx < count else None
+            if snap is None:
+                cells[(row, 1)] = f"{f'Bank {bank_label(idx)}  not loaded' if idx < count else '':<60}"
+                continue
+            on = sum(1 for v in snap.toggle_states.values() if v)
+            faders = " ".join(f"{snap.cc_values.get(cc, 0):>3}" for cc in m.cc_map["faders"])
+            cells[(row, 1)] = f"Bank {bank_label(idx):<2} {on:>2} on  faders {faders}{'  shift' if snap.note27_on else '       '}"
+        cells[(self._height() - 1, 1)] = f"{self._status:<78}"
+        return cells
+
+    def _draw(self):
+        start = time.perf_counter()
+        out = []
+        shown = self._shown
+        for pos, text in self._cells().items():
+            if shown.get(pos) != text:
+                shown[pos] = text
+                out.append(f"\x1b[{pos[0]};{pos[1]}H{text}")
+        if out:
+            self.stream.write("".join(out))
+            self.stream.flush()
+            self.cells_written += len(out)
+        self.frames += 1
+        self.frame_time.record(time.perf_counter() - start)
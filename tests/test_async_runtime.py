@@ -0,0 +1,31 @@
+import types
+
+import mido
+
+from AsyncRuntime import AsyncRuntime
+
+
+def shed(messages):
+    runtime = AsyncRuntime()
+    device = types.SimpleNamespace(index=0)
+    runtime._inbox.extend((device, message) for message in messages)
+    runtime._shed()
+    runtime.loop.close()
+    return [message for _, message in runtime._inbox], runtime.shed
+
+
+def cc(control, value):
+    return mido.Message('control_change', control=control, value=value)
+
+
+def test_shed_keeps_newest_move_per_control():
+    kept, count = shed([cc(19, 1), cc(19, 2), cc(20, 5), cc(19, 3)])
+    assert kept == [cc(20, 5), cc(19, 3)]
+    assert count == 2
+
+
+def test_shed_keeps_last_move_before_a_bank_switch():
+    bank_up = [mido.Message('note_on', note=25, velocity=127), mido.Message('note_off', note=25)]
+    kept, count = shed([cc(19, 90), cc(19, 100)] + bank_up + [cc(19, 40), cc(19, 50)])
+    assert kept == [cc(19, 100)] + bank_up + [cc(19, 50)]
+    assert count == 2
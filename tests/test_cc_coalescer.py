@@ -0,0 +1,40 @@
+import threading
+import time
+
+import mido
+
+from CcCoalescer import CcCoalescer
+
+
+def cc(control, value):
+    return mido.Message('control_change', control=control, value=value)
+
+
+def test_note_flushes_held_ccs_of_its_channel_first():
+    sent = []
+    coalescer = CcCoalescer(lambda message, stamp=None: sent.append(message), window=10.0)
+    note = mido.Message('note_on', note=1, velocity=127)
+    for message in (cc(19, 1), cc(19, 2), cc(20, 3), note):
+        coalescer.submit(message)
+    coalescer.close()
+    assert sent == [cc(19, 1), cc(20, 3), cc(19, 2), note]  # 20's first move goes out at once
+
+
+def test_note_waits_for_a_timer_send_under_way():
+    sent = []
+    in_send = threading.Event()
+
+    def send(message, stamp=None):
+        if threading.current_thread().name == "CcCoalescer":
+            in_send.set()
+            time.sleep(0.05)  # the note is submitted while the timer is sending
+        sent.append(message)
+
+    coalescer = CcCoalescer(send, window=0.01)
+    coalescer.submit(cc(19, 1))
+    coalescer.submit(cc(19, 2))
+    assert in_send.wait(1.0)
+    note = mido.Message('note_on', note=1, velocity=127)
+    coalescer.submit(note)
+    coalescer.close()
+    assert sent == [cc(19, 1), cc(19, 2), note]
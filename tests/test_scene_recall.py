@@ -0,0 +1,23 @@
+import types
+
+import FlightRecorder
+import Replay
+from MidiMasterator import MidiMasterator
+
+
+def test_recall_records_sends_for_the_recalled_unit_and_bank(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with Replay.fake_ports():
+        mm = MidiMasterator(None, "replay loopback", None, None, banks=4,
+                            devices=[Replay.port_names(0), Replay.port_names(1)])
+        assert mm.open_ports()
+        try:
+            target = mm.devices[1]
+            bank = types.SimpleNamespace(ID=target.bank_name(2), toggle_states={1: True}, last_cc_values={19: 100})
+            mm.scenes.save("scene", [bank])
+            assert mm.recall_scene("scene")
+            sent = [r for r in mm.recorder.records() if r[1] == FlightRecorder.LOOPBACK]
+            assert len(sent) == 2
+            assert all((unit, bank) == (1, 2) for _, _, unit, bank, *_ in sent)
+        finally:
+            mm.close_ports()
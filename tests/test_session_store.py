@@ -0,0 +1,35 @@
+import mido
+
+from MidiHandler import MidiHandler
+from SessionStore import SessionStore
+
+
+class CountingStore(SessionStore):
+    saves = 0
+
+    def save_state(self, toggle_states, cc_values, bid):
+        self.saves += 1
+        super().save_state(toggle_states, cc_values, bid)
+
+
+def test_setters_need_a_slot_and_write_in_place(tmp_path):
+    store = SessionStore(str(tmp_path / "Session.akgs"))
+    assert not store.set_cc("Bank A", 19, 100)
+    store.save_state({1: False}, {19: 0}, "Bank A")
+    assert store.set_cc("Bank A", 19, 100)
+    assert store.set_toggle("Bank A", 1, True)
+    store.close()
+    assert SessionStore(str(tmp_path / "Session.akgs")).load_state("Bank A") == ({1: True}, {19: 100})
+
+
+def test_handler_saves_the_bank_whole_once_then_per_change(tmp_path):
+    store = CountingStore(str(tmp_path / "Session.akgs"))
+    handler = MidiHandler(lambda message: None, lambda message: None, "Bank A", 0, state_handler=store)
+    handler.process_messages(mido.Message('control_change', control=19, value=0))
+    handler.process_messages(mido.Message('control_change', control=19, value=1))
+    handler.process_messages(mido.Message('note_on', note=1, velocity=127))
+    handler.process_messages(mido.Message('note_off', note=1, velocity=0))
+    assert store.saves == 1
+    toggles, ccs = store.load_state("Bank A")
+    assert toggles == handler.toggle_states and ccs == handler.last_cc_values
+    assert ccs[19] == 1 and toggles[1]
@@ -0,0 +1,36 @@
+import struct
+import zlib
+
+from StateJournal import StateJournal
+
+
+def test_more_than_256_banks_are_replayed_from_the_journal(tmp_path):
+    basename = str(tmp_path / "State")
+    journal = StateJournal(basename, compact_every=1 << 20)
+    for i in range(300):
+        journal.save_state({1: i % 2 == 0}, {19: i % 128}, f"Bank {i}")
+    journal.flush()
+    recovered = StateJournal(basename)  # as after a crash: the journal was never compacted
+    assert recovered.recovered_records > 300
+    assert recovered.load_state("Bank 299") == ({1: False}, {19: 299 % 128})
+    assert recovered.load_state("Bank 0") == ({1: True}, {19: 0})
+    recovered.close()
+
+
+def test_version_1_journal_is_replayed(tmp_path):
+    basename = str(tmp_path / "State")
+    StateJournal(basename).close()  # snapshot of generation 1, empty journal
+    gen = (1).to_bytes(4, "little")
+    name = b"Bank A"
+    data = bytearray(b"AKJ1" + gen)
+    head = bytes((0, 2, len(name), 0))
+    data += head + struct.pack("<I", zlib.crc32(gen + head + name)) + name + bytes(-len(name) % 8)
+    for head in (bytes((0, 1, 19, 100)), bytes((0, 0, 1, 1))):
+        data += head + struct.pack("<I", zlib.crc32(gen + head))
+    with open(basename + ".journal", "wb") as file:
+        file.write(data)
+    journal = StateJournal(basename)
+    assert journal.load_state("Bank A") == ({1: True}, {19: 100})
+    journal.save_state({1: False}, {19: 100}, "Bank A")
+    journal.close()
+    assert StateJournal(basename).load_state("Bank A") == ({1: False}, {19: 100})